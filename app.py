@@ -1,13 +1,26 @@
 import streamlit as st
 import pandas as pd
-import matplotlib.pyplot as plt
-from fpdf import FPDF
 import locale
-from supabase import create_client, Client
-import bcrypt
 from datetime import datetime
 import os
 import subprocess
+import time
+import uuid
+import json
+from auth import DUREE_COOKIE, ErreurAuth, ServiceAuth, TableUtilisateursMemoire, TableUtilisateursSupabase, client_supabase
+from base_transactions import obtenir_base
+from depot import obtenir_depot
+from donnees import FEUILLE, empreinte_contenu, indicateurs_periode
+from graphiques import graphique_mensuel_png
+from ingestion import agregats_du_jeu, charger_fichiers, cle_consolidee
+from incremental import AgregatsTransactions
+from mesures import collecte_courante, demarrer_collecte, etape, memoire_processus
+from rapports_lot import TYPES as TYPES_LOT, generer_lot
+from rapports import rapport_periode, rapport_region, rapport_selection, rapport_veille, normalize_str, safe_val
+
+# Étapes chronométrées de ce rerun (panneau Performances, réservé aux admins)
+debut_rerun = time.perf_counter()
+demarrer_collecte()
 
 # Locale française
 try:
@@ -18,64 +31,107 @@ except locale.Error:
     except locale.Error:
         pass
 
-# Installer Playwright browsers (uniquement chromium, silencieux)
-try:
+# Installer Playwright browsers (uniquement chromium, silencieux), une fois par processus
+@st.cache_resource
+def installer_playwright():
     subprocess.run(
         ["playwright", "install", "chromium", "--with-deps"],
         check=True,
         capture_output=True
     )
+
+
+try:
+    installer_playwright()
 except Exception as e:
     st.error(f"Erreur lors de l'installation de Playwright : {e}")
 
-# Configuration Supabase
-SUPABASE_URL = st.secrets["SUPABASE_URL"]
-SUPABASE_KEY = st.secrets["SUPABASE_KEY"]
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+
+# Service d'authentification : un seul client Supabase par processus.
+# AUTH_BACKEND=memoire remplace la table `users` par une table locale.
+@st.cache_resource
+def service_auth():
+    if os.environ.get("AUTH_BACKEND") == "memoire":
+        table = TableUtilisateursMemoire()
+    else:
+        table = TableUtilisateursSupabase(client_supabase(st.secrets["SUPABASE_URL"], st.secrets["SUPABASE_KEY"]))
+    return ServiceAuth(table, secret=st.secrets.get("AUTH_SECRET"))
+
+
+auth = service_auth()
+
+
+@st.cache_resource
+def derniers_jeux():
+    """Utilisateur -> clé de son dernier jeu de données dans le dépôt."""
+    return {}
+
 
 # Session
-if "authentifie" not in st.session_state:
+if "id_session" not in st.session_state:
+    st.session_state["id_session"] = uuid.uuid4().hex
+
+# Cookie signé : après un rechargement de la page, il restaure l'utilisateur
+# sans nouvelle connexion (ni requête Supabase, ni bcrypt). Il est lu dans
+# les en-têtes de la connexion (st.context.cookies) et écrit par le navigateur.
+NOM_COOKIE = "suivi_transactions_jeton"
+
+
+def ecrire_cookie(valeur, duree):
+    """Pose (ou, avec duree=0, efface) le cookie de session dans le navigateur."""
+    # Iframe de même origine : le script y accède au document de l'application
+    st.iframe(
+        "<script>window.parent.document.cookie = "
+        f"{json.dumps(f'{NOM_COOKIE}={valeur}; path=/; max-age={duree}; SameSite=Strict')}"
+        " + (window.parent.location.protocol === 'https:' ? '; Secure' : '');</script>",
+        height="content"
+    )
+
+
+def deconnecter(utilisateur):
     st.session_state["authentifie"] = False
+    st.session_state["client"] = None
+    st.session_state.pop("jeton", None)
+    # st.context.cookies garde sa valeur jusqu'à la prochaine connexion : le
+    # cookie de la session n'est plus lu, et il est effacé au prochain rendu
+    st.session_state["cookie_efface"] = True
+    st.session_state["cookie_a_effacer"] = True
+    if st.session_state.get("cle_donnees"):
+        obtenir_depot().liberer(st.session_state.pop("cle_donnees"), st.session_state["id_session"])
+    cle_utilisateur = derniers_jeux().pop(utilisateur, None)
+    if cle_utilisateur:
+        obtenir_depot().liberer(cle_utilisateur, f"utilisateur:{utilisateur}")
+
+
+# Un jeton signé encore valide suffit : pas de nouvel aller-retour ni de bcrypt.
+# Il est renouvelé à chaque rerun, la session expire donc après inactivité.
+utilisateur = auth.utilisateur_du_jeton(st.session_state.get("jeton"))
+if utilisateur is None and not st.session_state.get("cookie_efface"):
+    utilisateur = auth.utilisateur_du_jeton(st.context.cookies.get(NOM_COOKIE))
+st.session_state["authentifie"] = utilisateur is not None
+if utilisateur is not None:
+    st.session_state["jeton"] = auth.emettre_jeton(utilisateur)
+    st.session_state["client"] = utilisateur
 
 # Fonctions d'authentification
 def inscrire_utilisateur(email, password):
-    hashed = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-
-    exist = supabase.table("users").select("email").eq("email", email).execute()
-    error = getattr(exist, 'error', None)
-    if error is not None:
-        st.sidebar.error(f"Erreur vérification utilisateur : {error}")
-        return False
-    if exist.data and len(exist.data) > 0:
-        st.sidebar.error("❌ Identifiant déjà pris.")
-        return False
-
-    response = supabase.table("users").insert({
-        "email": email,
-        "password_hash": hashed
-    }).execute()
-
-    error_insert = getattr(response, 'error', None)
-    if error_insert is not None:
-        st.sidebar.error(f"Erreur création compte : {error_insert}")
-        return False
-    if not response.data or len(response.data) == 0:
-        st.sidebar.error("Erreur création compte : aucune donnée retournée")
+    try:
+        with etape("auth_inscription"):
+            auth.inscrire(email, password)
+    except ErreurAuth as e:
+        st.sidebar.error(str(e))
         return False
 
     st.sidebar.success("✅ Compte créé. Veuillez vous connecter.")
     return True
 
 def verifier_utilisateur(email, password):
-    result = supabase.table("users").select("password_hash").eq("email", email).execute()
-    error = getattr(result, 'error', None)
-    if error is not None:
-        st.sidebar.error(f"Erreur lors de la connexion : {error}")
-        return False
-    if not result.data or len(result.data) == 0:
-        return False
-    hashed = result.data[0]["password_hash"].encode("utf-8")
-    return bcrypt.checkpw(password.encode("utf-8"), hashed)
+    try:
+        with etape("auth_connexion"):
+            return auth.verifier(email, password)
+    except ErreurAuth as e:
+        st.sidebar.error(str(e))
+        return None
 
 # UI Auth
 st.sidebar.title("🔐 Connexion client")
@@ -84,6 +140,8 @@ email = st.sidebar.text_input("Identifiant")
 password = st.sidebar.text_input("Mot de passe", type="password")
 
 if not st.session_state["authentifie"]:
+    if st.session_state.pop("cookie_a_effacer", False):
+        ecrire_cookie("", 0)
     if choix == "Créer un compte":
         if st.sidebar.button("Créer mon compte"):
             if email and password:
@@ -95,49 +153,190 @@ if not st.session_state["authentifie"]:
         st.stop()
     elif choix == "Se connecter":
         if st.sidebar.button("Se connecter"):
-            if verifier_utilisateur(email, password):
+            jeton = verifier_utilisateur(email, password)
+            if jeton:
+                st.session_state["jeton"] = jeton
                 st.session_state["authentifie"] = True
                 st.session_state["client"] = email
+                st.session_state["cookie_efface"] = False
+                ecrire_cookie(auth.emettre_jeton(email, DUREE_COOKIE), DUREE_COOKIE)
                 st.sidebar.success(f"✅ Connecté : {email}")
             else:
                 st.sidebar.error("❌ Identifiants incorrects.")
         st.stop()
 else:
     st.sidebar.success(f"Connecté : {st.session_state['client']}")
-    if st.sidebar.button("Se déconnecter"):
-        st.session_state["authentifie"] = False
-        st.session_state["client"] = None
-        st.experimental_rerun()
+    # Le rerun qui suit le clic affiche la page de connexion et efface le cookie
+    st.sidebar.button("Se déconnecter", on_click=deconnecter, args=(utilisateur,))
+
+def effacer_commentaire(cle):
+    st.session_state[cle] = ""
+
 
 # ----------------------- PAGE NAVIGATION -----------------------
 page = st.sidebar.selectbox("📄 Choisissez une page :", ["Accueil", "Filtrer par client/fournisseur", "Carte des clients", "Veille concurrentielle"])
 
-# ----------------------- CHARGEMENT DU FICHIER -----------------------
-fichier_upload = st.file_uploader("📂 Importez votre fichier Excel", type=["xls", "xlsx"])
-
-if fichier_upload is None:
-    st.info("Veuillez importer un fichier pour continuer.")
+# ----------------------- PANNEAU PERFORMANCES -----------------------
+# Réservé aux identifiants listés dans ADMINS_PERF (secrets ou environnement).
+# Son emplacement est réservé dans la barre latérale avant les pages ; il est
+# rempli à la fin du rerun, ou par `arreter` avant un st.stop().
+admins_perf = st.secrets.get("ADMINS_PERF") or os.environ.get("ADMINS_PERF", "")
+panneau_perf = None
+if st.session_state.get("client") in {a.strip() for a in admins_perf.split(",") if a.strip()}:
+    panneau_perf = st.sidebar.empty()
+
+
+def afficher_performances():
+    if panneau_perf is None:
+        return
+    with panneau_perf.container().expander("⏱️ Performances"):
+        etapes = collecte_courante()
+        st.caption(f"Rerun : {(time.perf_counter() - debut_rerun) * 1000:.0f} ms")
+        if etapes:
+            st.dataframe(pd.DataFrame({
+                "Étape": ["\u00a0\u00a0" * profondeur + nom for nom, _, profondeur in etapes],
+                "ms": [round(duree * 1000, 1) for _, duree, _ in etapes],
+            }), hide_index=True)
+        rss, rss_max = memoire_processus()
+        if rss is not None:
+            st.caption(f"Mémoire du processus : {rss / 1e6:.0f} Mo (pic {rss_max / 1e6:.0f} Mo)" if rss_max else f"Mémoire du processus : {rss / 1e6:.0f} Mo")
+        stats_depot = obtenir_depot().statistiques()
+        st.caption(
+            f"Dépôt : {stats_depot['entrees']} jeu(x), {stats_depot['octets'] / 1e6:.0f} / "
+            f"{stats_depot['memoire_max_octets'] / 1e6:.0f} Mo, {stats_depot['references']} référence(s)"
+        )
+
+
+def arreter():
+    afficher_performances()
     st.stop()
 
-try:
-    df = pd.read_excel(fichier_upload, sheet_name="Données socio-démographiques")
-except Exception as e:
-    st.error(f"Erreur de chargement : {e}")
-    st.stop()
 
-# Traitement des dates
-df["Date 1"] = pd.to_datetime(df["Date 1"], errors='coerce')
-df["Date 2"] = pd.to_datetime(df["Date 2"], errors='coerce')
+# ----------------------- CHARGEMENT DU FICHIER -----------------------
+# Avec une base de transactions configurée, les classeurs y sont importés
+# et les données sont lues dans la base ; sinon, directement dans les fichiers
+base = obtenir_base(st.secrets.get("TRANSACTIONS_DB"))
+depot = obtenir_depot()
+
+if base is not None:
+    fichiers_upload = st.file_uploader("📂 Importez vos fichiers Excel dans la base", type=["xls", "xlsx"], accept_multiple_files=True)
+    # Un fichier déposé n'est importé (et haché) qu'une fois par session
+    deja_importes = st.session_state.setdefault("fichiers_importes", set())
+    for f in fichiers_upload or []:
+        if f.file_id in deja_importes:
+            continue
+        try:
+            with etape("import_base"):
+                nb_importees = base.importer_excel(f.getvalue(), f.name)
+        except Exception as e:
+            st.error(f"Erreur d'import de {f.name} : {e}")
+            continue
+        deja_importes.add(f.file_id)
+        if nb_importees is not None:
+            st.success(f"{f.name} : {nb_importees} lignes importées dans la base.")
+
+    fichiers_base = base.fichiers()
+    if not fichiers_base:
+        st.info("Veuillez importer un fichier pour continuer.")
+        arreter()
+    selection_fichiers = st.multiselect("🗂️ Fichiers à analyser :", fichiers_base, default=fichiers_base)
+    if not selection_fichiers:
+        st.info("Sélectionnez au moins un fichier.")
+        arreter()
+
+    cle_donnees = empreinte_contenu(
+        f"base:{base.chemin}:{base.version()}:{'|'.join(sorted(selection_fichiers))}".encode("utf-8"))
+    chargeur = lambda: base.transactions(fichiers=selection_fichiers)
+else:
+    fichiers_upload = st.file_uploader("📂 Importez vos fichiers Excel (un par client)", type=["xls", "xlsx"], accept_multiple_files=True)
+
+    toutes_feuilles = st.checkbox(f"Lire toutes les feuilles au format transactions (pas seulement « {FEUILLE} »)")
+
+    if fichiers_upload:
+        fichiers = [(f.name, f.getvalue()) for f in fichiers_upload]
+        # Empreinte de chaque fichier déposé, calculée une fois par session
+        connues = st.session_state.get("empreintes_fichiers", {})
+        empreintes_session = {f.file_id: connues.get(f.file_id) or empreinte_contenu(f.getvalue()) for f in fichiers_upload}
+        st.session_state["empreintes_fichiers"] = empreintes_session
+        empreintes = [empreintes_session[f.file_id] for f in fichiers_upload]
+        cle_donnees = cle_consolidee(fichiers, toutes_feuilles=toutes_feuilles, empreintes=empreintes)
+        chargeur = lambda: charger_fichiers(
+            fichiers, depot=depot, toutes_feuilles=toutes_feuilles, proprietaire=utilisateur, empreintes=empreintes)
+    else:
+        # Après un rechargement de la page : dernier jeu de l'utilisateur, s'il est encore en cache
+        cle_donnees = derniers_jeux().get(utilisateur)
+        df_restaure = depot.lire(cle_donnees) if cle_donnees else None
+        if df_restaure is None:
+            st.info("Veuillez importer un fichier pour continuer.")
+            arreter()
+        st.caption("♻️ Dernier fichier importé restauré — importez-en un autre pour le remplacer.")
+        chargeur = lambda: df_restaure
+
+
+def charger_jeu():
+    """Jeu complet et ses agrégats : partagé entre les sessions qui consultent
+    les mêmes données (dépôt), calculés une fois par jeu."""
+    ancienne_cle = st.session_state.get("cle_donnees")
+    if ancienne_cle and ancienne_cle != cle_donnees:
+        depot.liberer(ancienne_cle, st.session_state["id_session"])
+
+    def charger():
+        # Appelé par le dépôt seulement si le jeu n'est pas déjà en cache
+        with etape("lecture_donnees"):
+            return chargeur()
+
+    try:
+        with etape("chargement_donnees"):
+            df = depot.obtenir(
+                cle_donnees,
+                charger,
+                detenteur=st.session_state["id_session"]
+            )
+    except Exception as e:
+        st.error(f"Erreur de chargement : {e}")
+        arreter()
+    st.session_state["cle_donnees"] = cle_donnees
+
+    # Le dernier jeu de chaque utilisateur reste référencé pour être restauré
+    jeux = derniers_jeux()
+    if jeux.get(utilisateur) != cle_donnees:
+        if jeux.get(utilisateur):
+            depot.liberer(jeux[utilisateur], f"utilisateur:{utilisateur}")
+        depot.retenir(cle_donnees, f"utilisateur:{utilisateur}")
+        jeux[utilisateur] = cle_donnees
+
+    # Un fichier renvoyé complété ne fait qu'ajouter ses nouvelles lignes aux agrégats
+    with etape("agregats"):
+        agregats = agregats_du_jeu(cle_donnees, df)
+    return df, agregats
+
+
+# Avec la base, les pages filtrent et totalisent en SQL : le jeu complet
+# n'est chargé que pour les rapports qui en ont besoin
+if base is None:
+    df, agregats = charger_jeu()
+
+
+# PNG du graphique mensuel, par jeu de données et sélection de mois : les
+# reruns et le rapport PDF réutilisent la même image sans redessiner
+@st.cache_data(max_entries=64, show_spinner=False)
+def graphique_du_jeu(cle_donnees, mois_a_afficher, _mensuel):
+    with etape("graphique_mensuel"):
+        return graphique_mensuel_png(_mensuel, list(mois_a_afficher) if mois_a_afficher is not None else None)
 
 if page == "Accueil":
     st.title("Page principale")
 
     # ----------------------- FILTRAGE PAR MOIS -----------------------
-    mois_recu = df["Date 1"].dropna().dt.to_period("M")
-    mois_paye = df["Date 2"].dropna().dt.to_period("M")
+    with etape("mois_disponibles"):
+        if base is not None:
+            mois_disponibles = pd.Series(base.mois(selection_fichiers))
+        else:
+            mois_recu = df["Date 1"].dropna().dt.to_period("M")
+            mois_paye = df["Date 2"].dropna().dt.to_period("M")
 
-    mois_disponibles = pd.Series(pd.concat([mois_recu, mois_paye]).unique())
-    mois_disponibles = mois_disponibles.sort_values()
+            mois_disponibles = pd.Series(pd.concat([mois_recu, mois_paye]).unique())
+            mois_disponibles = mois_disponibles.sort_values()
 
     mois_labels = [m.to_timestamp().strftime("%b %Y").capitalize() for m in mois_disponibles]  # 3 lettres mois
     mois_mapping = dict(zip(mois_labels, mois_disponibles))
@@ -148,30 +347,21 @@ if page == "Accueil":
 
     if "Toute la période" in selection or not selection:
         # Pas de filtrage, on prend tout
-        df_filtre = df.copy()
+        mois_choisis = None
         periode_label = "Toute la période"
     else:
         mois_choisis = [mois_mapping[sel] for sel in selection if sel in mois_mapping]
-
-        # On garde les lignes dont Date 1 ou Date 2 est dans l'un des mois choisis
-        filtre_date1 = df["Date 1"].dt.to_period("M").isin(mois_choisis)
-        filtre_date2 = df["Date 2"].dt.to_period("M").isin(mois_choisis)
-        df_filtre = df[(filtre_date1 | filtre_date2)].copy()
         periode_label = ", ".join(selection)
 
     # ---------------- Filtrage et calcul des indicateurs sur df_recu et df_paye ----------------
-    df_recu = df_filtre[df_filtre["Montant reçu"].notna() & (df_filtre["Montant reçu"] > 0)].copy()
-    df_paye = df_filtre[df_filtre["Montant payé"].notna() & (df_filtre["Montant payé"] > 0)].copy()
-
-    if "Toute la période" not in selection and selection:
-        df_recu = df_recu[df_recu["Date 1"].dt.to_period("M").isin(mois_choisis)]
-        df_paye = df_paye[df_paye["Date 2"].dt.to_period("M").isin(mois_choisis)]
-
-    montant_recu_total = df_recu["Montant reçu"].sum()
-    montant_paye_total = df_paye["Montant payé"].sum()
-    solde = montant_recu_total - montant_paye_total
-    nb_clients = df_recu["Nom du client"].nunique()
-    nb_fournisseurs = df_paye["Nom du fournisseur"].nunique()
+    with etape("indicateurs_periode"):
+        if base is not None:
+            # Totaux calculés en SQL ; les lignes ne sont lues que pour le PDF
+            mois_sql = [str(m) for m in mois_choisis] if mois_choisis else None
+            montant_recu_total, montant_paye_total, nb_clients, nb_fournisseurs = base.indicateurs(mois_sql, selection_fichiers)
+            solde = montant_recu_total - montant_paye_total
+        else:
+            df_recu, df_paye, montant_recu_total, montant_paye_total, solde, nb_clients, nb_fournisseurs = indicateurs_periode(df, mois_choisis)
 
     col1, col2, col3, col4, col5 = st.columns(5)
     col1.metric("💰 Montant reçu", f"{montant_recu_total:.2f} EUR")
@@ -181,104 +371,52 @@ if page == "Accueil":
     col5.metric("🏭 Fournisseurs", f"{nb_fournisseurs}")
 
     # ----------------------- GRAPHIQUE FILTRÉ -----------------------
-    df_graph = df_filtre.copy()
-    df_graph["Date_combined"] = df_graph[["Date 1", "Date 2"]].min(axis=1, skipna=True)
-    df_graph["Mois"] = df_graph["Date_combined"].dt.to_period("M").dt.to_timestamp()
-
-    if not df_graph["Mois"].empty:
+    graphique = None
+    mensuel = base.totaux_mensuels(selection_fichiers) if base is not None else agregats.mensuel
+    if not mensuel.empty:
         if "Toute la période" in selection or not selection:
-            mois_a_afficher = sorted(df_graph["Mois"].dropna().unique())
+            mois_a_afficher = None
         else:
-            mois_a_afficher = sorted([m.to_timestamp() for m in mois_choisis])
-
-        graph_grouped = df_graph.groupby("Mois").agg({
-            "Montant reçu": "sum",
-            "Montant payé": "sum"
-        }).reindex(mois_a_afficher, fill_value=0)
-
-        graph_grouped["Solde"] = graph_grouped["Montant reçu"] - graph_grouped["Montant payé"]
-        graph_grouped = graph_grouped.sort_index()
-
-        fig, ax = plt.subplots()
-        graph_grouped.index = graph_grouped.index.to_series().dt.strftime('%b %Y').str.capitalize()
-        graph_grouped[["Montant reçu", "Montant payé", "Solde"]].plot(kind="bar", ax=ax)
-        plt.xticks(rotation=45, fontsize=8)
-        plt.xlabel("Mois")
-        plt.ylabel("Montant (€)")
-        plt.title("Évolution mensuelle")
-        plt.tight_layout()
+            mois_a_afficher = tuple(sorted(m.to_timestamp() for m in mois_choisis))
+        graphique = graphique_du_jeu(cle_donnees, mois_a_afficher, mensuel)
 
         st.subheader("📊 Évolution mensuelle")
-        st.pyplot(fig)
+        st.image(graphique)
     else:
         st.info("Aucune donnée trouvée")
 
     # ----------------------- COMMENTAIRE -----------------------
     st.subheader("🗣️ Laissez un commentaire pour cette période")
-    commentaire_client = st.text_area("Vos remarques à joindre au rapport PDF :", height=150)
-    if st.button("🗑️ Supprimer le commentaire"):
-        commentaire_client = ""
-        st.experimental_rerun()
+    commentaire_client = st.text_area("Vos remarques à joindre au rapport PDF :", height=150, key="commentaire_accueil")
+    st.button("🗑️ Supprimer le commentaire", on_click=effacer_commentaire, args=("commentaire_accueil",))
 
         # ----------------------- GÉNÉRATION PDF -----------------------
-    def generer_pdf(periode_label, df_recu, df_paye, commentaire_client, nb_clients, nb_fournisseurs, montant_recu_total, montant_paye_total, solde):
-        pdf = FPDF()
-        pdf.add_page()
-        pdf.set_font("Arial", "B", 16)
-        pdf.cell(0, 10, f"Rapport - {periode_label}", ln=True)
-        pdf.set_font("Arial", "", 12)
-        date_rapport = datetime.today().strftime("%d/%m/%Y")
-        pdf.cell(0, 10, f"Date du rapport : {date_rapport}", ln=True)
-        pdf.ln(10)
-
-        # Résumé des chiffres clés
-        pdf.cell(0, 10, f"Montant reçu total : {montant_recu_total:.2f} EUR", ln=True)
-        pdf.cell(0, 10, f"Montant payé total : {montant_paye_total:.2f} EUR", ln=True)
-        pdf.cell(0, 10, f"Solde : {solde:.2f} EUR", ln=True)
-        pdf.cell(0, 10, f"Nombre de clients : {nb_clients}", ln=True)
-        pdf.cell(0, 10, f"Nombre de fournisseurs : {nb_fournisseurs}", ln=True)
-        pdf.ln(10)
-
-        # Commentaire utilisateur
-        pdf.set_font("Arial", "I", 12)
-        pdf.multi_cell(0, 10, f"Commentaires :\n{commentaire_client if commentaire_client else 'Aucun commentaire'}")
-        pdf.ln(10)
-
-        # Table Montant reçu par client
-        pdf.set_font("Arial", "B", 14)
-        pdf.cell(0, 10, "Montants reçus par client", ln=True)
-        pdf.set_font("Arial", "", 12)
-        df_recu_group = df_recu.groupby("Nom du client")["Montant reçu"].sum().reset_index()
-        for _, row in df_recu_group.iterrows():
-            pdf.cell(0, 10, f"{row['Nom du client']}: {row['Montant reçu']:.2f} EUR", ln=True)
-        pdf.ln(10)
-
-        # Table Montant payé par fournisseur
-        pdf.set_font("Arial", "B", 14)
-        pdf.cell(0, 10, "Montants payés par fournisseur", ln=True)
-        pdf.set_font("Arial", "", 12)
-        df_paye_group = df_paye.groupby("Nom du fournisseur")["Montant payé"].sum().reset_index()
-        for _, row in df_paye_group.iterrows():
-            pdf.cell(0, 10, f"{row['Nom du fournisseur']}: {row['Montant payé']:.2f} EUR", ln=True)
-        pdf.ln(10)
-
-        # Sauvegarde PDF dans buffer
-        pdf_output_path = "/tmp/rapport_suivi.pdf"
-        pdf.output(pdf_output_path)
-        return pdf_output_path
-
     if st.button("📄 Générer le rapport PDF"):
-        pdf_path = generer_pdf(periode_label, df_recu, df_paye, commentaire_client, nb_clients, nb_fournisseurs, montant_recu_total, montant_paye_total, solde)
-        with open(pdf_path, "rb") as f:
-            st.download_button("⬇️ Télécharger le rapport PDF", f, file_name="rapport_suivi.pdf", mime="application/pdf")
+        with etape("pdf_periode"):
+            if base is not None:
+                lignes = base.transactions(mois=mois_sql, fichiers=selection_fichiers)
+                df_recu, df_paye = indicateurs_periode(lignes, mois_choisis)[:2]
+            pdf_bytes = rapport_periode(periode_label, df_recu, df_paye, commentaire_client, nb_clients, nb_fournisseurs, montant_recu_total, montant_paye_total, solde, graphique)
+        st.download_button("⬇️ Télécharger le rapport PDF", pdf_bytes, file_name="rapport_suivi.pdf", mime="application/pdf")
+
+    # ----------------------- RAPPORTS EN LOT -----------------------
+    st.subheader("📦 Rapports en lot")
+    types_lot = st.multiselect("Un rapport PDF par :", list(TYPES_LOT), default=list(TYPES_LOT))
+    if st.button("📦 Générer tous les rapports (ZIP)") and types_lot:
+        if base is not None:
+            df, agregats = charger_jeu()
+        barre = st.progress(0.0, text="Génération des rapports...")
+        with etape("rapports_lot"):
+            zip_bytes, stats_lot = generer_lot(
+                df, types_lot, agregats=agregats,
+                progression=lambda fait, total: barre.progress(fait / total, text=f"{fait} / {total} rapports")
+            )
+        st.success(f"✅ {stats_lot['rapports']} rapports en {stats_lot['secondes']:.1f} s ({stats_lot['rapports_par_seconde']:.1f} rapports/s)")
+        st.download_button("⬇️ Télécharger les rapports (ZIP)", zip_bytes, file_name="rapports.zip", mime="application/zip")
 
 elif page == "Filtrer par client/fournisseur":
     import streamlit as st
     import pandas as pd
-    from io import BytesIO
-    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-    from reportlab.lib.pagesizes import A4
-    from reportlab.lib.styles import getSampleStyleSheet
 
     st.title("Filtrer par client et fournisseur")
 
@@ -292,8 +430,11 @@ elif page == "Filtrer par client/fournisseur":
         st.session_state["clients_selection"] = []
         st.session_state["fournisseurs_selection"] = []
 
-    clients = df["Nom du client"].dropna().unique().tolist()
-    fournisseurs = df["Nom du fournisseur"].dropna().unique().tolist()
+    if base is not None:
+        clients, fournisseurs = base.entites(selection_fichiers)
+    else:
+        clients = df["Nom du client"].dropna().unique().tolist()
+        fournisseurs = df["Nom du fournisseur"].dropna().unique().tolist()
 
     clients_selection = st.multiselect(
         "Sélectionnez un ou plusieurs clients :",
@@ -309,6 +450,15 @@ elif page == "Filtrer par client/fournisseur":
         key="fournisseurs_selection"
     )
 
+    if base is not None:
+        # Seules les lignes des entités sélectionnées sont lues : leurs
+        # statistiques en sont exactes, toutes leurs lignes y étant
+        df = base.transactions(
+            clients=clients_selection, fournisseurs=fournisseurs_selection, fichiers=selection_fichiers,
+            limite=None if clients_selection or fournisseurs_selection else 0
+        )
+        agregats = AgregatsTransactions.depuis(df)
+
     filtre_clients = df["Nom du client"].isin(clients_selection) if clients_selection else pd.Series([False] * len(df))
     filtre_fournisseurs = df["Nom du fournisseur"].isin(fournisseurs_selection) if fournisseurs_selection else pd.Series([False] * len(df))
 
@@ -328,14 +478,13 @@ elif page == "Filtrer par client/fournisseur":
     if clients_selection:
         st.markdown("### 💰 Clients")
         for client in clients_selection:
-            df_client = df[filtre_clients & (df["Nom du client"] == client)]
-            montant_total = df_client["Montant reçu"].sum()
-            nb_trans = df_client["Montant reçu"].count()
-            moyenne = df_client["Montant reçu"].mean() if nb_trans > 0 else 0
-            derniere_ligne = df_client.loc[df_client["Date 1"].idxmax()] if nb_trans > 0 else None
-            if derniere_ligne is not None and pd.notna(derniere_ligne["Date 1"]):
-                derniere_date = derniere_ligne["Date 1"].strftime('%d %B %Y')
-                derniere_montant = derniere_ligne["Montant reçu"]
+            stats = agregats.clients.loc[client]
+            montant_total = stats["Montant total"]
+            nb_trans = stats["Transactions"]
+            moyenne = montant_total / nb_trans if nb_trans > 0 else 0
+            if nb_trans > 0 and pd.notna(stats["Dernière date"]):
+                derniere_date = stats["Dernière date"].strftime('%d %B %Y')
+                derniere_montant = stats["Dernier montant"]
             else:
                 derniere_date = "N/A"
                 derniere_montant = 0
@@ -353,14 +502,13 @@ elif page == "Filtrer par client/fournisseur":
     if fournisseurs_selection:
         st.markdown("### 🧾 Fournisseurs")
         for fournisseur in fournisseurs_selection:
-            df_fournisseur = df[filtre_fournisseurs & (df["Nom du fournisseur"] == fournisseur)]
-            montant_total = df_fournisseur["Montant payé"].sum()
-            nb_trans = df_fournisseur["Montant payé"].count()
-            moyenne = df_fournisseur["Montant payé"].mean() if nb_trans > 0 else 0
-            derniere_ligne = df_fournisseur.loc[df_fournisseur["Date 2"].idxmax()] if nb_trans > 0 else None
-            if derniere_ligne is not None and pd.notna(derniere_ligne["Date 2"]):
-                derniere_date = derniere_ligne["Date 2"].strftime('%d %B %Y')
-                derniere_montant = derniere_ligne["Montant payé"]
+            stats = agregats.fournisseurs.loc[fournisseur]
+            montant_total = stats["Montant total"]
+            nb_trans = stats["Transactions"]
+            moyenne = montant_total / nb_trans if nb_trans > 0 else 0
+            if nb_trans > 0 and pd.notna(stats["Dernière date"]):
+                derniere_date = stats["Dernière date"].strftime('%d %B %Y')
+                derniere_montant = stats["Dernier montant"]
             else:
                 derniere_date = "N/A"
                 derniere_montant = 0
@@ -397,113 +545,30 @@ elif page == "Filtrer par client/fournisseur":
                 if pd.notna(montant) and pd.notna(date):
                     st.markdown(f"- **{fournisseur}** a reçu **{montant:.2f} €** le **{date.strftime('%d %B %Y')}**")
 
-    # Fonction utilitaire pour récupérer la première valeur non nulle d'une colonne client
-    def get_first_valid_value(df_client, col):
-        if col in df_client.columns:
-            vals = df_client[col].dropna().unique()
-            if len(vals) > 0:
-                return vals[0]
-        return "N/A"
-
     # ----------------------- COMMENTAIRE -----------------------
     st.subheader("🗣️ Laissez un commentaire pour ces clients et fournisseurs")
-    commentaire_client = st.text_area("Vos remarques à joindre au rapport PDF :", height=150)
-    if st.button("🗑️ Supprimer le commentaire"):
-        commentaire_client = ""
-        st.experimental_rerun()
+    commentaire_client = st.text_area("Vos remarques à joindre au rapport PDF :", height=150, key="commentaire_selection")
+    st.button("🗑️ Supprimer le commentaire", on_click=effacer_commentaire, args=("commentaire_selection",))
 
     # Génération du PDF
-if st.button("📄 Générer le PDF des données sélectionnées"):
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4)
-    styles = getSampleStyleSheet()
-    elements = []
-
-    elements.append(Paragraph("Rapport des Transactions - Clients et Fournisseurs", styles["Title"]))
-    elements.append(Spacer(1, 12))
-
-    # AJOUT DES 3 VARIABLES CLÉS EN HAUT DU PDF
-    elements.append(Paragraph(f"Montant reçu total : {montant_recu_total:.2f} €", styles["Heading3"]))
-    elements.append(Paragraph(f"Montant payé total : {montant_paye_total:.2f} €", styles["Heading3"]))
-    elements.append(Paragraph(f"Solde : {solde:.2f} €", styles["Heading3"]))
-    elements.append(Spacer(1, 12))
-
-    # Infos Clients
-    for client in clients_selection:
-        df_client = df[df["Nom du client"] == client]
-        montant_total = df_client["Montant reçu"].sum()
-        nb_trans = df_client["Montant reçu"].count()
-        moyenne = df_client["Montant reçu"].mean() if nb_trans > 0 else 0
-
-        if nb_trans > 0:
-            derniere_ligne = df_client.loc[df_client["Date 1"].idxmax()]
-            derniere_date = derniere_ligne["Date 1"].strftime('%d %B %Y') if pd.notna(derniere_ligne["Date 1"]) else "N/A"
-            derniere_montant = derniere_ligne["Montant reçu"]
-        else:
-            derniere_date = "N/A"
-            derniere_montant = 0
-
-        sexe = get_first_valid_value(df_client, "Sexe")
-        age = get_first_valid_value(df_client, "Âge")
-        provenance = get_first_valid_value(df_client, "Provenance")
-        csp = get_first_valid_value(df_client, "Catégorie socio-professionnelle")
-
-        elements.append(Paragraph(f"Client : {client}", styles["Heading2"]))
-        elements.append(Paragraph(f"Sexe : {sexe}, Âge : {age}, Provenance : {provenance}, CSP : {csp}", styles["Normal"]))
-        elements.append(Paragraph(f"Montant total reçu : {montant_total:.2f} €", styles["Normal"]))
-        elements.append(Paragraph(f"Nombre de transactions : {nb_trans}", styles["Normal"]))
-        elements.append(Paragraph(f"Moyenne par transaction : {moyenne:.2f} €", styles["Normal"]))
-        elements.append(Paragraph(f"Dernière transaction : {derniere_date} pour {derniere_montant:.2f} €", styles["Normal"]))
-        elements.append(Spacer(1, 12))
-
-    # Infos Fournisseurs
-    for fournisseur in fournisseurs_selection:
-        df_fournisseur = df[df["Nom du fournisseur"] == fournisseur]
-        montant_total = df_fournisseur["Montant payé"].sum()
-        nb_trans = df_fournisseur["Montant payé"].count()
-        moyenne = df_fournisseur["Montant payé"].mean() if nb_trans > 0 else 0
-
-        if nb_trans > 0:
-            derniere_ligne = df_fournisseur.loc[df_fournisseur["Date 2"].idxmax()]
-            derniere_date = derniere_ligne["Date 2"].strftime('%d %B %Y') if pd.notna(derniere_ligne["Date 2"]) else "N/A"
-            derniere_montant = derniere_ligne["Montant payé"]
-        else:
-            derniere_date = "N/A"
-            derniere_montant = 0
-
-        elements.append(Paragraph(f"Fournisseur : {fournisseur}", styles["Heading2"]))
-        elements.append(Paragraph(f"Montant total payé : {montant_total:.2f} €", styles["Normal"]))
-        elements.append(Paragraph(f"Nombre de transactions : {nb_trans}", styles["Normal"]))
-        elements.append(Paragraph(f"Moyenne par transaction : {moyenne:.2f} €", styles["Normal"]))
-        elements.append(Paragraph(f"Dernière transaction : {derniere_date} pour {derniere_montant:.2f} €", styles["Normal"]))
-        elements.append(Spacer(1, 12))
-
-    # Ajout du commentaire utilisateur s'il existe
-    if commentaire_client.strip():
-        elements.append(Paragraph("Commentaire de l'utilisateur :", styles["Heading2"]))
-        elements.append(Paragraph(commentaire_client.strip(), styles["Normal"]))
-        elements.append(Spacer(1, 12))
-
-    doc.build(elements)
-    st.success("✅ PDF généré avec succès !")
-
-    st.download_button(
-        label="📥 Télécharger le PDF",
-        data=buffer.getvalue(),
-        file_name="rapport_filtrage.pdf",
-        mime="application/pdf"
-    )
+    if st.button("📄 Générer le PDF des données sélectionnées"):
+        with etape("pdf_selection"):
+            pdf_bytes = rapport_selection(df, clients_selection, fournisseurs_selection, montant_recu_total, montant_paye_total, solde, commentaire_client)
+        st.success("✅ PDF généré avec succès !")
+
+        st.download_button(
+            label="📥 Télécharger le PDF",
+            data=pdf_bytes,
+            file_name="rapport_filtrage.pdf",
+            mime="application/pdf"
+        )
 
 elif page == "Carte des clients":
     import streamlit as st
     import pandas as pd
     import folium
     from streamlit_folium import st_folium
-    import unicodedata
     import html
-    from fpdf import FPDF
-    import tempfile
-    import os
 
     st.title("🗺️ Carte des clients par région (clic sur une région)")
 
@@ -523,50 +588,51 @@ elif page == "Carte des clients":
         "Corse": (42.0396, 9.0129)
     }
 
-    def normalize_str(s):
-        if not isinstance(s, str):
-            return ""
-        s = s.replace('\xa0', ' ')
-        s = s.strip().lower()
-        s = unicodedata.normalize('NFD', s)
-        s = ''.join(c for c in s if unicodedata.category(c) != 'Mn')
-        return s
-
-    def safe_val(v):
-        if pd.isna(v):
-            return "Non renseigné"
-        return str(v).strip() if str(v).strip() else "Non renseigné"
-
-    # Nettoyage et renommage des colonnes
-    df.columns = (
-        df.columns
-        .str.strip()
-        .str.replace("\xa0", " ", regex=False)
-        .str.replace("\n", "", regex=False)
-        .str.lower()
-    )
-    df = df.rename(columns={
-        "nom du client": "nom",
-        "provenance": "region",
-        "montant reçu": "montant",
-        "nom du fournisseur": "nom_fournisseur",
-        "montant payé": "montant_paye",
-        "sexe": "sexe",
-        "âge": "age",
-        "catégorie socio-professionnelle": "csp"
-    })
-
-    df["region_norm"] = df["region"].astype(str).apply(normalize_str)
     coords_regions_norm = {normalize_str(k): v for k, v in coords_regions.items()}
     norm_to_original = {normalize_str(k): k for k in coords_regions.keys()}
 
-    df_clients = df[df["nom"].notna() & df["region_norm"].isin(coords_regions_norm.keys())].copy()
-    df_fournisseurs = df[df["nom_fournisseur"].notna() & df["region_norm"].isin(coords_regions_norm.keys())].copy()
+    def lignes_carte(df):
+        """Lignes clients et fournisseurs des régions connues, colonnes renommées."""
+        # Nettoyage et renommage des colonnes
+        df.columns = (
+            df.columns
+            .str.strip()
+            .str.replace("\xa0", " ", regex=False)
+            .str.replace("\n", "", regex=False)
+            .str.lower()
+        )
+        df = df.rename(columns={
+            "nom du client": "nom",
+            "provenance": "region",
+            "montant reçu": "montant",
+            "nom du fournisseur": "nom_fournisseur",
+            "montant payé": "montant_paye",
+            "sexe": "sexe",
+            "âge": "age",
+            "catégorie socio-professionnelle": "csp"
+        })
+
+        # Normalisation par valeur distincte plutôt que ligne par ligne
+        regions_brutes = df["region"].astype(str)
+        df["region_norm"] = regions_brutes.map({r: normalize_str(r) for r in regions_brutes.unique()})
+
+        df_clients = df[df["nom"].notna() & df["region_norm"].isin(coords_regions_norm.keys())].copy()
+        df_fournisseurs = df[df["nom_fournisseur"].notna() & df["region_norm"].isin(coords_regions_norm.keys())].copy()
+        return df_clients, df_fournisseurs
+
+    regions = base.totaux_regions(selection_fichiers) if base is not None else agregats.regions
+    lignes_par_region = regions["Lignes clients"]
+    region_counts = (
+        lignes_par_region
+        .groupby(lignes_par_region.index.map(lambda r: normalize_str(str(r))))
+        .sum()
+        .astype(int)
+        .to_dict()
+    )
 
-    if df_clients.empty:
+    if not any(region_counts.get(r, 0) for r in coords_regions_norm):
         st.warning("Aucun client avec région valide.")
     else:
-        region_counts = df_clients["region_norm"].value_counts().to_dict()
         m = folium.Map(location=[46.6, 2.5], zoom_start=6)
 
         region_id_map = {i: region for i, region in enumerate(coords_regions_norm.keys())}
@@ -601,6 +667,12 @@ elif page == "Carte des clients":
             selected_region_original = norm_to_original.get(selected_region, selected_region)
             st.markdown(f"### Région sélectionnée : **{selected_region_original}**")
 
+            if base is not None:
+                # Seules les lignes de la région sont lues dans la base
+                provenances = [p for p in regions.index if normalize_str(str(p)) == selected_region]
+                df = base.transactions(provenances=provenances, fichiers=selection_fichiers)
+            df_clients, df_fournisseurs = lignes_carte(df)
+
             # Filtrage clients et fournisseurs par région sélectionnée
             filtered_clients = df_clients[df_clients["region_norm"] == selected_region]
             filtered_fournisseurs = df_fournisseurs[df_fournisseurs["region_norm"] == selected_region]
@@ -641,71 +713,24 @@ elif page == "Carte des clients":
                 """, unsafe_allow_html=True)
 
             st.subheader("🗣️ Laissez un commentaire pour cette région")
-            commentaire_client = st.text_area("Vos remarques à joindre au rapport PDF :", height=150)
-            if st.button("🗑️ Supprimer le commentaire"):
-                commentaire_client = ""
-                st.experimental_rerun()
+            commentaire_client = st.text_area("Vos remarques à joindre au rapport PDF :", height=150, key="commentaire_region")
+            st.button("🗑️ Supprimer le commentaire", on_click=effacer_commentaire, args=("commentaire_region",))
 
             st.markdown("### 📄 Export PDF")
             if st.button("Générer un PDF avec ces informations"):
-                pdf = FPDF()
-                pdf.add_page()
-                pdf.set_font("Arial", "B", 14)
-                # Titre + variables clés
-                pdf.cell(0, 10, f"Clients de la région : {selected_region_original}".encode('latin-1', 'replace').decode('latin-1'), ln=True)
-                pdf.ln(5)
-                pdf.set_font("Arial", "", 12)
-                pdf.cell(0, 8, f"Montant reçu total : {montant_recu_total:.2f} EUR", ln=True)
-                pdf.cell(0, 8, f"Montant payé total : {montant_paye_total:.2f} EUR", ln=True)
-                pdf.cell(0, 8, f"Solde : {solde:.2f} EUR", ln=True)
-                pdf.cell(0, 8, f"Nombre de clients : {nb_clients}", ln=True)
-                pdf.cell(0, 8, f"Nombre de fournisseurs : {nb_fournisseurs}", ln=True)
-                pdf.ln(5)
-
-                for _, row in filtered_clients.iterrows():
-                    text_block = f"""
-Nom : {safe_val(row.get("nom"))}
-Région : {safe_val(row.get("region"))}
-Montant reçu : {row.get("montant", 0.0):.2f} euros
-Sexe : {safe_val(row.get("sexe"))}
-Âge : {safe_val(row.get("age"))}
-CSP : {safe_val(row.get("csp"))}
-""".strip()
-                    safe_text_block = text_block.encode('latin-1', 'replace').decode('latin-1')
-                    pdf.ln(5)
-                    pdf.multi_cell(0, 8, safe_text_block)
-
-                if commentaire_client.strip():
-                    pdf.ln(10)
-                    pdf.set_font("Arial", "B", 14)
-                    pdf.cell(0, 10, "Commentaire de l'utilisateur :".encode('latin-1', 'replace').decode('latin-1'), ln=True)
-                    pdf.set_font("Arial", "", 12)
-                    for ligne in commentaire_client.strip().split('\n'):
-                        safe_ligne = ligne.encode('latin-1', 'replace').decode('latin-1')
-                        pdf.cell(0, 8, safe_ligne, ln=True)
-
-                with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-                    pdf.output(tmp_file.name)
-                    st.success("PDF généré avec succès.")
-                    with open(tmp_file.name, "rb") as f:
-                        st.download_button("📥 Télécharger le PDF", f, file_name=f"{selected_region_original}.pdf")
-                    os.unlink(tmp_file.name)
+                with etape("pdf_region"):
+                    pdf_bytes = rapport_region(selected_region_original, filtered_clients, montant_recu_total, montant_paye_total, solde, nb_clients, nb_fournisseurs, commentaire_client)
+                st.success("PDF généré avec succès.")
+                st.download_button("📥 Télécharger le PDF", pdf_bytes, file_name=f"{selected_region_original}.pdf")
 
         else:
             st.info("Cliquez sur un cercle pour afficher les clients.")
 
 elif page == "Veille concurrentielle":
     import streamlit as st
-    from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeoutError
-    from bs4 import BeautifulSoup
-    import re
-    from fpdf import FPDF
-    from io import BytesIO
-    from datetime import datetime
-    from urllib.parse import urljoin, urlparse
     import unidecode
-    from langdetect import detect, LangDetectException
-    from difflib import SequenceMatcher
+    from veille import MAX_PAGES, BudgetCrawl, crawler_site_playwright, dedoublonner, passages_pertinents
+    from veille_planifiee import INTERVALLE_HEURES, executer_profil, obtenir_suivi
 
     st.title("🔍 Veille concurrentielle automatisée")
 
@@ -714,147 +739,6 @@ elif page == "Veille concurrentielle":
     mots_cles_input = st.text_input("Mots-clés (séparés par des virgules)")
 
     mots_cles = [unidecode.unidecode(m.strip().lower()) for m in mots_cles_input.split(",") if m.strip()]
-    MAX_PAGES = 5
-
-    STOPWORDS = {
-        "le","la","les","de","des","du","un","une","et","en","à","a","au","aux","pour","par","sur","dans","que","qui","ce","ces","se","ses","est","sont","d'","l'","avec","ou","où","mais","nous","vous","il","elle","ils","elles",
-        "the","and","of","to","in","for","with","on","at","by","is","are","we","you","our","us","be","this","that","it","from","as","an"
-    }
-
-    def nettoyer_html(soup):
-        for tag in soup(["script", "style", "noscript", "header", "footer", "nav", "form", "svg", "img", "meta", "link", "button", "input", "aside"]):
-            tag.decompose()
-        text = soup.get_text(separator=' ')
-        text = re.sub(r'\s+', ' ', text).strip()
-        return text
-
-    def extraire_phrases(texte):
-        phrases = re.split(r'(?<=[.!?;:])\s+', texte)
-        phrases = [p.strip() for p in phrases if 30 <= len(p.strip()) <= 600]
-        return phrases
-
-    def est_francais(texte):
-        try:
-            return detect(texte) == 'fr'
-        except LangDetectException:
-            return False
-
-    def mots_cles_dans_phrase(phrase, mots):
-        phrase_ascii = unidecode.unidecode(phrase.lower())
-        return any(m in phrase_ascii for m in mots)
-
-    def safe_pdf_text(txt):
-        txt = txt.replace('\n', ' ').replace('\r', '')
-        txt = unidecode.unidecode(txt)
-        txt = re.sub(r'[^\x20-\x7E]+', ' ', txt)
-        txt = re.sub(r'\s+', ' ', txt).strip()
-        return txt
-
-    def canonicalize_url(u):
-        try:
-            p = urlparse(u)
-            scheme = p.scheme or "http"
-            netloc = p.netloc
-            path = p.path.rstrip('/')
-            query = ('?' + p.query) if p.query else ''
-            return f"{scheme}://{netloc}{path}{query}"
-        except Exception:
-            return u.split('#')[0]
-
-    def crawler_site_playwright(url, max_pages=MAX_PAGES):
-        pages_visited = set()
-        to_visit = [url]
-        textes = []
-
-        domaine = urlparse(url).netloc
-
-        with sync_playwright() as p:
-            browser = p.chromium.launch(headless=True)
-            context = browser.new_context(user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115.0 Safari/537.36")
-
-            while to_visit and len(pages_visited) < max_pages:
-                current_url = to_visit.pop(0)
-                canon_current = canonicalize_url(current_url)
-                if canon_current in pages_visited:
-                    continue
-                try:
-                    page = context.new_page()
-                    page.goto(current_url, timeout=15000)
-                    page.wait_for_timeout(7000)
-
-                    content = page.content()
-                    soup = BeautifulSoup(content, "html.parser")
-                    texte = nettoyer_html(soup)
-                    textes.append((current_url, texte))
-
-                    pages_visited.add(canon_current)
-
-                    for link in soup.find_all('a', href=True):
-                        href = link['href']
-                        href_parsed = urlparse(href)
-                        if href_parsed.scheme in ['http', 'https']:
-                            lien_complet = href
-                        else:
-                            lien_complet = urljoin(current_url, href)
-
-                        try:
-                            domaine_lien = urlparse(lien_complet).netloc
-                        except Exception:
-                            domaine_lien = ''
-                        if domaine_lien == domaine:
-                            canon_link = canonicalize_url(lien_complet)
-                            already_in_to_visit = any(canonicalize_url(t) == canon_link for t in to_visit)
-                            if canon_link not in pages_visited and not already_in_to_visit:
-                                to_visit.append(lien_complet)
-                    page.close()
-                except PlaywrightTimeoutError:
-                    continue
-                except Exception:
-                    continue
-
-            browser.close()
-        return textes
-
-    def normalize_for_dedup(text):
-        s = unidecode.unidecode(text.lower())
-        s = re.sub(r'http\S+', ' ', s)
-        s = re.sub(r'\d+', ' ', s)
-        s = re.sub(r'[^\w\s]', ' ', s)
-        s = re.sub(r'\s+', ' ', s).strip()
-        tokens = [t for t in s.split() if t not in STOPWORDS and len(t) > 2]
-        norm_str = ' '.join(tokens)
-        return tokens, norm_str
-
-    def is_similar(passage, existing_passages, token_thresh=0.55, seq_thresh=0.78):
-        tokens_a, norm_a = normalize_for_dedup(passage)
-        set_a = set(tokens_a)
-        if not set_a:
-            return False
-
-        for _, existing in existing_passages:
-            tokens_b, norm_b = normalize_for_dedup(existing)
-            set_b = set(tokens_b)
-            if not set_b:
-                continue
-
-            inter = set_a.intersection(set_b)
-            min_len = min(len(set_a), len(set_b))
-            if min_len > 0:
-                overlap_ratio = len(inter) / min_len
-                if overlap_ratio >= token_thresh:
-                    return True
-
-            if norm_a and norm_b:
-                seq_ratio = SequenceMatcher(None, norm_a, norm_b).ratio()
-                if seq_ratio >= seq_thresh:
-                    return True
-
-            if norm_a and norm_b:
-                if norm_a in norm_b or norm_b in norm_a:
-                    if len(norm_a) >= 20 and len(norm_b) >= 20:
-                        return True
-
-        return False
 
     if st.button("Générer le rapport PDF"):
         urls = [u.strip() for u in liens_sites.split("\n") if u.strip()]
@@ -865,106 +749,85 @@ elif page == "Veille concurrentielle":
         else:
             with st.spinner("Extraction et analyse en cours... cela peut prendre quelques secondes..."):
                 all_pages_textes = []
+                budget = BudgetCrawl()
                 for url in urls:
                     st.write(f"Analyse du site : {url}")
                     try:
-                        pages_textes = crawler_site_playwright(url, MAX_PAGES)
+                        with etape("crawl_site"):
+                            pages_textes = crawler_site_playwright(url, MAX_PAGES, budget=budget)
                         all_pages_textes.extend(pages_textes)
                     except Exception as e:
                         st.warning(f"Erreur lors du crawl de {url} : {e}")
 
                 st.write(f"Nombre total de pages analysées : {len(all_pages_textes)}")
+                for limite in budget.limites:
+                    st.warning(f"Crawl incomplet : {limite}")
 
-                toutes_phrases = []
-                for url_page, texte in all_pages_textes:
-                    phrases = extraire_phrases(texte)
-                    for p in phrases:
-                        if mots_cles_dans_phrase(p, mots_cles) and est_francais(p):
-                            toutes_phrases.append((url_page, p))
-
-                unique_phrases = []
-                seen_exact = set()
-                for url_page, passage in toutes_phrases:
-                    if passage in seen_exact:
-                        continue
-                    if is_similar(passage, unique_phrases, token_thresh=0.55, seq_thresh=0.78):
-                        continue
-                    seen_exact.add(passage)
-                    unique_phrases.append((url_page, passage))
-
-                toutes_phrases = unique_phrases
+                with etape("selection_passages"):
+                    toutes_phrases = passages_pertinents(all_pages_textes, mots_cles)
+
+                with etape("dedoublonnage"):
+                    toutes_phrases = dedoublonner(toutes_phrases, token_thresh=0.55, seq_thresh=0.78)
                 st.write(f"Passages pertinents après suppression des doublons : {len(toutes_phrases)}")
 
             if toutes_phrases:
-                pdf = FPDF()
-                pdf.set_auto_page_break(auto=True, margin=15)
-                pdf.add_page()
-
-                # En-tête
-                pdf.set_font("Arial", "B", 16)
-                pdf.cell(0, 10, "Rapport de veille concurrentielle", ln=True, align="C")
-                pdf.ln(8)
-
-                pdf.set_font("Arial", "B", 12)
-                pdf.cell(0, 8, f"Entreprise : {entreprise}", ln=True)
-                pdf.cell(0, 8, f"Liens : {', '.join(urls)}", ln=True)
-                pdf.cell(0, 8, f"Date : {datetime.now().strftime('%d/%m/%Y')}", ln=True)
-                pdf.ln(10)
-
-                # Corps du document
-                pdf.set_font("Arial", "", 12)
-                largeur_cell = 180
-                interligne = 7
-
-                for idx, (url_page, passage) in enumerate(toutes_phrases[:30], 1):
-                    pdf.set_fill_color(240, 240, 240)
-                    x_start = pdf.get_x()
-                    y_start = pdf.get_y()
-
-                    texte = safe_pdf_text(passage)
-
-                    # Vérifier hauteur avant impression (si besoin d’une nouvelle page)
-                    temp_pdf = FPDF()
-                    temp_pdf.add_page()
-                    temp_pdf.set_font("Arial", "", 12)
-                    temp_pdf.multi_cell(largeur_cell, interligne, f"Passage {idx}:\n{texte}")
-                    hauteur_necessaire = temp_pdf.get_y()
-                    hauteur_totale = hauteur_necessaire + 14  # marge + source
-
-                    if pdf.get_y() + hauteur_totale > pdf.page_break_trigger:
-                        pdf.add_page()
-                        x_start = pdf.get_x()
-                        y_start = pdf.get_y()
-
-                    # Impression du passage
-                    pdf.multi_cell(largeur_cell, interligne, f"Passage {idx}:\n{texte}", fill=True)
-                    y_end = pdf.get_y()
-
-                    # Bordure autour du passage
-                    pdf.rect(x_start - 1, y_start - 1, largeur_cell + 2, y_end - y_start + 2)
-
-                    # Source du passage
-                    pdf.ln(2)
-                    pdf.set_text_color(100, 100, 100)
-                    pdf.set_font("Arial", "I", 10)
-                    url_court = url_page if len(url_page) <= 70 else url_page[:67] + "..."
-                    pdf.cell(largeur_cell, 6, f"Source : {url_court}", ln=True)
-
-                    # Reset style
-                    pdf.set_text_color(0, 0, 0)
-                    pdf.set_font("Arial", "", 12)
-                    pdf.ln(6)
-
-                buffer = BytesIO()
-                pdf.output(buffer)
-                buffer.seek(0)
+                with etape("pdf_veille"):
+                    pdf_bytes = rapport_veille(entreprise, urls, toutes_phrases, limites=budget.limites)
 
                 st.success("PDF généré avec succès.")
                 st.download_button(
                     label="📥 Télécharger le rapport PDF",
-                    data=buffer,
+                    data=pdf_bytes,
                     file_name=f"veille_concurrentielle_{entreprise}_{datetime.now().strftime('%Y%m%d')}.pdf",
                     mime="application/pdf"
                 )
             else:
                 st.warning("Aucun passage pertinent trouvé avec ces mots-clés.")
+
+    # ----------------------- PROFILS PLANIFIÉS -----------------------
+    # Profils relancés par `python veille_planifiee.py VEILLE_DB planifier` ;
+    # chaque passage ne rapporte que les nouveautés
+    suivi = obtenir_suivi(st.secrets.get("VEILLE_DB"))
+    if suivi is not None:
+        st.subheader("🗓️ Veille planifiée")
+        with st.form("profil_veille"):
+            nom_profil = st.text_input("Nom du profil", value=entreprise)
+            intervalle = st.number_input("Intervalle entre deux passages (heures)", min_value=1.0, value=float(INTERVALLE_HEURES))
+            if st.form_submit_button("💾 Enregistrer le profil (entreprise, URLs et mots-clés ci-dessus)"):
+                urls = [u.strip() for u in liens_sites.split("\n") if u.strip()]
+                if not nom_profil or not entreprise or not urls or not mots_cles:
+                    st.error("Merci de renseigner tous les champs (nom, URLs, mots-clés).")
+                else:
+                    suivi.enregistrer_profil(nom_profil, entreprise, urls[:5], mots_cles, intervalle)
+                    st.success(f"Profil « {nom_profil} » enregistré.")
+
+        profils = {p.nom: p for p in suivi.profils()}
+        if profils:
+            profil = profils[st.selectbox("Profil", list(profils))]
+            derniere = profil.derniere_execution.strftime("%d/%m/%Y %H:%M") if profil.derniere_execution else "jamais"
+            st.caption(f"{profil.entreprise} · {len(profil.urls)} URL(s) · toutes les {profil.intervalle_heures:g} h · dernier passage : {derniere}")
+            if st.button("🔄 Lancer maintenant (nouveautés seulement)"):
+                with st.spinner("Passage de veille en cours..."):
+                    resultat = executer_profil(suivi, profil)
+                for url, message in resultat.erreurs:
+                    st.warning(f"Erreur lors du crawl de {url} : {message}")
+                for limite in resultat.limites:
+                    st.warning(f"Crawl incomplet : {limite}")
+                st.write(f"Pages nouvelles ou modifiées : {resultat.pages_modifiees} · nouveautés : {len(resultat.passages)} ({resultat.secondes:.0f} s)")
+                if resultat.passages:
+                    with etape("pdf_veille"):
+                        pdf_bytes = rapport_veille(profil.entreprise, profil.urls, resultat.passages,
+                                                   depuis=profil.derniere_execution, limites=resultat.limites,
+                                                   max_passages=None)
+                    st.download_button(
+                        label="📥 Télécharger les nouveautés (PDF)",
+                        data=pdf_bytes,
+                        file_name=f"veille_{profil.nom}_{datetime.now().strftime('%Y%m%d')}.pdf",
+                        mime="application/pdf"
+                    )
+                else:
+                    st.info("Rien de nouveau depuis le dernier passage.")
+
+
+# Panneau rempli en fin de rerun, ou juste avant un arrêt anticipé
+afficher_performances()
@@ -0,0 +1,142 @@
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from functools import lru_cache
+
+import bcrypt
+
+# Configuration (variables d'environnement, cf. env.sh)
+BCRYPT_COUT = int(os.environ.get("BCRYPT_COUT", "12"))
+DUREE_SESSION = int(os.environ.get("AUTH_SESSION_SECONDES", "1800"))
+DUREE_COOKIE = int(os.environ.get("AUTH_COOKIE_SECONDES", str(7 * 24 * 3600)))
+
+
+class ErreurAuth(Exception):
+    """Erreur à afficher telle quelle à l'utilisateur."""
+
+
+# ----------------------- TABLES UTILISATEURS -----------------------
+@lru_cache(maxsize=None)
+def client_supabase(url, cle):
+    # Un seul client par processus : sa session HTTP (et ses connexions
+    # keep-alive) est réutilisée par toutes les requêtes
+    from supabase import create_client
+    return create_client(url, cle)
+
+
+class TableUtilisateursSupabase:
+    def __init__(self, client):
+        self.client = client
+
+    def hash_de(self, email):
+        result = self.client.table("users").select("password_hash").eq("email", email).execute()
+        error = getattr(result, 'error', None)
+        if error is not None:
+            raise ErreurAuth(f"Erreur lors de la connexion : {error}")
+        if not result.data:
+            return None
+        return result.data[0]["password_hash"]
+
+    def existe(self, email):
+        exist = self.client.table("users").select("email").eq("email", email).execute()
+        error = getattr(exist, 'error', None)
+        if error is not None:
+            raise ErreurAuth(f"Erreur vérification utilisateur : {error}")
+        return bool(exist.data)
+
+    def inserer(self, email, password_hash):
+        response = self.client.table("users").insert({
+            "email": email,
+            "password_hash": password_hash
+        }).execute()
+        error_insert = getattr(response, 'error', None)
+        if error_insert is not None:
+            raise ErreurAuth(f"Erreur création compte : {error_insert}")
+        if not response.data:
+            raise ErreurAuth("Erreur création compte : aucune donnée retournée")
+
+
+class TableUtilisateursMemoire:
+    """Table `users` locale, pour le développement et les essais hors Supabase."""
+
+    def __init__(self):
+        self._lignes = {}
+        self._verrou = threading.Lock()
+
+    def hash_de(self, email):
+        with self._verrou:
+            return self._lignes.get(email)
+
+    def existe(self, email):
+        with self._verrou:
+            return email in self._lignes
+
+    def inserer(self, email, password_hash):
+        with self._verrou:
+            if email in self._lignes:
+                raise ErreurAuth("❌ Identifiant déjà pris.")
+            self._lignes[email] = password_hash
+
+
+# ----------------------- SERVICE -----------------------
+def _b64(donnees):
+    return base64.urlsafe_b64encode(donnees).rstrip(b"=").decode("ascii")
+
+
+def _de_b64(texte):
+    return base64.urlsafe_b64decode(texte + "=" * (-len(texte) % 4))
+
+
+class ServiceAuth:
+    """Inscription, connexion et jetons de session signés.
+
+    Un jeton prouve qu'un utilisateur s'est authentifié il y a moins de
+    `duree_session` secondes : tant qu'il est valide, les reruns le vérifient
+    par HMAC sans refaire de requête ni de bcrypt.
+    """
+
+    def __init__(self, table, secret=None, cout=BCRYPT_COUT, duree_session=DUREE_SESSION):
+        self.table = table
+        # Sans secret configuré, les jetons ne survivent pas au redémarrage
+        self.secret = (secret or secrets.token_hex(32)).encode("utf-8")
+        self.cout = cout
+        self.duree_session = duree_session
+
+    # bcrypt libère le GIL : appelé directement depuis le thread de chaque
+    # session, il ne bloque pas les autres sessions
+    def inscrire(self, email, password):
+        if self.table.existe(email):
+            raise ErreurAuth("❌ Identifiant déjà pris.")
+        hashed = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(self.cout))
+        self.table.inserer(email, hashed.decode('utf-8'))
+
+    def verifier(self, email, password):
+        """Jeton de session si les identifiants sont bons, sinon None."""
+        hashed = self.table.hash_de(email)
+        if hashed is None:
+            return None
+        if not bcrypt.checkpw(password.encode("utf-8"), hashed.encode("utf-8")):
+            return None
+        return self.emettre_jeton(email)
+
+    def emettre_jeton(self, email, duree=None):
+        charge = f"{_b64(email.encode('utf-8'))}.{int(time.time()) + (duree or self.duree_session)}"
+        signature = hmac.new(self.secret, charge.encode("ascii"), hashlib.sha256).digest()
+        return f"{charge}.{_b64(signature)}"
+
+    def utilisateur_du_jeton(self, jeton):
+        """Email porté par un jeton valide et non expiré, sinon None."""
+        try:
+            email_b64, expiration, signature = jeton.split(".")
+            attendue = hmac.new(self.secret, f"{email_b64}.{expiration}".encode("ascii"), hashlib.sha256).digest()
+            if not hmac.compare_digest(attendue, _de_b64(signature)):
+                return None
+            if int(expiration) < time.time():
+                return None
+            return _de_b64(email_b64).decode("utf-8")
+        except (AttributeError, ValueError):
+            return None
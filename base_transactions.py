@@ -0,0 +1,355 @@
+"""Base locale des transactions (SQLite), alimentée par import des classeurs Excel.
+
+    python base_transactions.py transactions.db fichier_client.xlsx fichiers_clients/
+"""
+import os
+import sqlite3
+import sys
+import threading
+from datetime import datetime
+from io import BytesIO
+
+import pandas as pd
+
+from donnees import COLONNE_FEUILLE, COLONNE_SOURCE, COLONNES_DATES, empreinte_contenu, lire_transactions
+from ingestion import fichiers_du_dossier
+
+CHEMIN_BASE = os.environ.get("TRANSACTIONS_DB") or None
+
+# Colonne du classeur -> colonne SQL
+COLONNES_SQL = {
+    COLONNE_SOURCE: "fichier_source",
+    COLONNE_FEUILLE: "feuille",
+    "Nom du client": "client",
+    "Nom du fournisseur": "fournisseur",
+    "Âge": "age",
+    "Sexe": "sexe",
+    "Provenance": "provenance",
+    "Catégorie socio-professionnelle": "csp",
+    "Montant reçu": "montant_recu",
+    "Date 1": "date1",
+    "Montant payé": "montant_paye",
+    "Date 2": "date2",
+}
+COLONNES_CLASSEUR = {sql: col for col, sql in COLONNES_SQL.items()}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS imports (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    fichier_source TEXT NOT NULL,
+    empreinte TEXT NOT NULL,
+    nb_lignes INTEGER NOT NULL,
+    date_import TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS transactions (
+    id INTEGER PRIMARY KEY,
+    fichier_source TEXT NOT NULL,
+    feuille TEXT,
+    client TEXT,
+    fournisseur TEXT,
+    age TEXT,
+    sexe TEXT,
+    provenance TEXT,
+    csp TEXT,
+    montant_recu REAL,
+    date1 TEXT,
+    montant_paye REAL,
+    date2 TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_transactions_client ON transactions (client, date1);
+CREATE INDEX IF NOT EXISTS idx_transactions_fournisseur ON transactions (fournisseur, date2);
+CREATE INDEX IF NOT EXISTS idx_transactions_date1 ON transactions (date1);
+CREATE INDEX IF NOT EXISTS idx_transactions_date2 ON transactions (date2);
+CREATE INDEX IF NOT EXISTS idx_transactions_provenance ON transactions (provenance);
+CREATE INDEX IF NOT EXISTS idx_transactions_fichier ON transactions (fichier_source);
+"""
+
+
+def _bornes_mois(mois):
+    """'2025-03' -> ('2025-03-01', '2025-04-01') : filtre par plage, donc indexé."""
+    debut = pd.Period(mois, "M")
+    return debut.start_time.strftime("%Y-%m-%d"), (debut + 1).start_time.strftime("%Y-%m-%d")
+
+
+def _dans(colonne, valeurs):
+    return f"{colonne} IN ({', '.join('?' * len(valeurs))})", list(valeurs)
+
+
+def _plages_mois(colonnes, mois):
+    """Condition « l'une des `colonnes` tombe dans l'un des `mois` » et ses paramètres."""
+    plages, params = [], []
+    for m in mois:
+        debut, fin = _bornes_mois(m)
+        for colonne in colonnes:
+            plages.append(f"({colonne} >= ? AND {colonne} < ?)")
+            params += [debut, fin]
+    return "(" + " OR ".join(plages) + ")", params
+
+
+def _nombre(texte):
+    # « 25 » -> 25, « 25.0 » -> 25.0 ; None si le texte n'est pas exactement un nombre
+    for type_ in (int, float):
+        try:
+            valeur = type_(texte)
+        except ValueError:
+            continue
+        if str(valeur) == texte:
+            return valeur
+    return None
+
+
+def _typer(serie):
+    """Colonne d'attributs stockée en TEXT, retypée comme à la lecture du classeur.
+
+    Une colonne entièrement numérique (l'âge) redevient int64, ou float64 si
+    elle a des cases vides ; les autres restent du texte.
+    """
+    valeurs = {texte: _nombre(texte) for texte in serie.dropna().unique()}
+    if not valeurs or any(v is None for v in valeurs.values()):
+        return serie
+    return pd.to_numeric(serie.map(valeurs))
+
+
+class BaseTransactions:
+    """Transactions de tous les classeurs importés, interrogeables par index.
+
+    Chaque fichier est identifié par son nom : le réimporter remplace ses
+    lignes, sauf si son contenu n'a pas changé depuis le dernier import.
+    """
+
+    def __init__(self, chemin):
+        self.chemin = chemin
+        self._local = threading.local()
+        with self._connexion() as cx:
+            cx.executescript(SCHEMA)
+
+    def _connexion(self):
+        # Une connexion par thread (serveur Streamlit / FastAPI multi-threads)
+        cx = getattr(self._local, "cx", None)
+        if cx is None:
+            cx = sqlite3.connect(self.chemin)
+            cx.execute("PRAGMA journal_mode=WAL")
+            cx.execute("PRAGMA synchronous=NORMAL")
+            self._local.cx = cx
+        return cx
+
+    # ----------------------- IMPORT -----------------------
+    def importer(self, df, fichier_source, empreinte):
+        """Remplace les lignes de `fichier_source` par `df`. Renvoie le nombre de lignes."""
+        lignes = df.rename(columns=COLONNES_SQL)
+        lignes = lignes[[c for c in COLONNES_SQL.values() if c in lignes.columns]].copy()
+        lignes["fichier_source"] = fichier_source
+        lignes = lignes.dropna(how="all", subset=[c for c in lignes.columns if c not in ("fichier_source", "feuille")])
+        for col in ("date1", "date2"):
+            if col in lignes.columns:
+                lignes[col] = lignes[col].dt.strftime("%Y-%m-%d %H:%M:%S")
+        for col in ("client", "fournisseur", "age", "sexe", "provenance", "csp"):
+            if col in lignes.columns:
+                lignes[col] = lignes[col].where(lignes[col].isna(), lignes[col].astype(str))
+        # Colonnes TEXT : les nombres sont retypés à la lecture (`_typer`)
+        lignes = lignes.astype(object).where(lignes.notna(), None)
+
+        colonnes = list(lignes.columns)
+        with self._connexion() as cx:
+            cx.execute("DELETE FROM transactions WHERE fichier_source = ?", (fichier_source,))
+            cx.executemany(
+                f"INSERT INTO transactions ({', '.join(colonnes)}) VALUES ({', '.join('?' * len(colonnes))})",
+                lignes.itertuples(index=False, name=None)
+            )
+            cx.execute(
+                "INSERT INTO imports (fichier_source, empreinte, nb_lignes, date_import) VALUES (?, ?, ?, ?)",
+                (fichier_source, empreinte, len(lignes), datetime.now().isoformat(timespec="seconds"))
+            )
+        return len(lignes)
+
+    def importer_excel(self, contenu, fichier_source):
+        """Importe un classeur (bytes) ; None s'il est identique au dernier import."""
+        empreinte = empreinte_contenu(contenu)
+        dernier = self._connexion().execute(
+            "SELECT empreinte FROM imports WHERE fichier_source = ? ORDER BY id DESC LIMIT 1",
+            (fichier_source,)
+        ).fetchone()
+        if dernier is not None and dernier[0] == empreinte:
+            return None
+        return self.importer(lire_transactions(BytesIO(contenu)), fichier_source, empreinte)
+
+    # ----------------------- REQUÊTES -----------------------
+    def version(self):
+        """Change à chaque import : sert de clé de cache aux lecteurs."""
+        ligne = self._connexion().execute("SELECT COALESCE(MAX(id), 0) FROM imports").fetchone()
+        return ligne[0]
+
+    def fichiers(self):
+        return [r[0] for r in self._connexion().execute(
+            "SELECT DISTINCT fichier_source FROM transactions ORDER BY fichier_source")]
+
+    def _filtres(self, clients=None, fournisseurs=None, mois=None, fichiers=None, provenances=None):
+        """Clause WHERE (ou "") et paramètres des filtres de `transactions`."""
+        conditions, params = [], []
+        entites = []
+        if clients:
+            condition, valeurs = _dans("client", clients)
+            entites.append(condition)
+            params += valeurs
+        if fournisseurs:
+            condition, valeurs = _dans("fournisseur", fournisseurs)
+            entites.append(condition)
+            params += valeurs
+        if entites:
+            conditions.append("(" + " OR ".join(entites) + ")")
+        if mois:
+            condition, valeurs = _plages_mois(("date1", "date2"), mois)
+            conditions.append(condition)
+            params += valeurs
+        if fichiers:
+            condition, valeurs = _dans("fichier_source", fichiers)
+            conditions.append(condition)
+            params += valeurs
+        if provenances:
+            condition, valeurs = _dans("provenance", provenances)
+            conditions.append(condition)
+            params += valeurs
+        return (" WHERE " + " AND ".join(conditions) if conditions else ""), params
+
+    def transactions(self, clients=None, fournisseurs=None, mois=None, fichiers=None, provenances=None, limite=None):
+        """Lignes filtrées, aux noms et aux types de colonnes du classeur.
+
+        Comme dans l'application : une ligne est retenue si son client OU son
+        fournisseur est sélectionné, et si sa Date 1 OU sa Date 2 tombe dans
+        l'un des `mois` ('AAAA-MM'). `limite=0` donne un jeu vide bien typé.
+        """
+        where, params = self._filtres(clients, fournisseurs, mois, fichiers, provenances)
+        requete = f"SELECT {', '.join(COLONNES_CLASSEUR)} FROM transactions{where} ORDER BY id"
+        if limite is not None:
+            requete += " LIMIT ?"
+            params.append(limite)
+        df = pd.read_sql_query(requete, self._connexion(), params=params)
+        for col in ("client", "fournisseur", "age", "sexe", "provenance", "csp"):
+            df[col] = _typer(df[col])
+        df = df.rename(columns=COLONNES_CLASSEUR)
+        for col in COLONNES_DATES:
+            df[col] = pd.to_datetime(df[col], errors='coerce')
+        return df
+
+    def entites(self, fichiers=None):
+        """(clients, fournisseurs) distincts des `fichiers`, dans l'ordre d'apparition."""
+        where, params = self._filtres(fichiers=fichiers)
+        listes = []
+        for colonne in ("client", "fournisseur"):
+            valeurs = pd.read_sql_query(
+                f"""
+                SELECT {colonne} FROM transactions
+                {where + " AND" if where else "WHERE"} {colonne} IS NOT NULL
+                GROUP BY {colonne} ORDER BY MIN(id)
+                """,
+                self._connexion(),
+                params=params
+            )[colonne]
+            listes.append(_typer(valeurs).tolist())
+        return tuple(listes)
+
+    def mois(self, fichiers=None):
+        """Mois (Periods) où tombe au moins une Date 1 ou Date 2, triés."""
+        where, params = self._filtres(fichiers=fichiers)
+        lignes = self._connexion().execute(
+            f"""
+            SELECT substr(date1, 1, 7) FROM transactions{where}
+            UNION SELECT substr(date2, 1, 7) FROM transactions{where}
+            """,
+            params * 2
+        ).fetchall()
+        return sorted(pd.Period(m, "M") for m, in lignes if m)
+
+    def indicateurs(self, mois=None, fichiers=None):
+        """Montants reçu/payé et nombres de clients/fournisseurs, comme `indicateurs_periode`.
+
+        Un montant reçu compte dans le mois de sa Date 1, un montant payé dans
+        celui de sa Date 2. Renvoie (montant reçu, montant payé, clients, fournisseurs).
+        """
+        recu, params_recu = _plages_mois(("date1",), mois) if mois else ("1", [])
+        paye, params_paye = _plages_mois(("date2",), mois) if mois else ("1", [])
+        where, params = self._filtres(fichiers=fichiers)
+        ligne = self._connexion().execute(
+            f"""
+            SELECT COALESCE(SUM(CASE WHEN montant_recu > 0 AND {recu} THEN montant_recu END), 0),
+                   COALESCE(SUM(CASE WHEN montant_paye > 0 AND {paye} THEN montant_paye END), 0),
+                   COUNT(DISTINCT CASE WHEN montant_recu > 0 AND {recu} THEN client END),
+                   COUNT(DISTINCT CASE WHEN montant_paye > 0 AND {paye} THEN fournisseur END)
+            FROM transactions{where}
+            """,
+            params_recu + params_paye + params_recu + params_paye + params
+        ).fetchone()
+        return ligne
+
+    def totaux_mensuels(self, fichiers=None):
+        """Montants reçus/payés par mois de la plus ancienne des deux dates."""
+        where, params = self._filtres(fichiers=fichiers)
+        df = pd.read_sql_query(
+            f"""
+            SELECT substr(MIN(COALESCE(date1, date2), COALESCE(date2, date1)), 1, 7) AS "Mois",
+                   SUM(COALESCE(montant_recu, 0)) AS "Montant reçu",
+                   SUM(COALESCE(montant_paye, 0)) AS "Montant payé"
+            FROM transactions
+            {where + " AND" if where else "WHERE"} (date1 IS NOT NULL OR date2 IS NOT NULL)
+            GROUP BY 1 ORDER BY 1
+            """,
+            self._connexion(),
+            params=params
+        )
+        df["Mois"] = pd.to_datetime(df["Mois"] + "-01")
+        return df.set_index("Mois")
+
+    def totaux_regions(self, fichiers=None):
+        where, params = self._filtres(fichiers=fichiers)
+        df = pd.read_sql_query(
+            f"""
+            SELECT provenance AS "Provenance",
+                   SUM(client IS NOT NULL) AS "Lignes clients",
+                   SUM(CASE WHEN client IS NOT NULL THEN COALESCE(montant_recu, 0) ELSE 0 END) AS "Montant reçu",
+                   SUM(fournisseur IS NOT NULL) AS "Lignes fournisseurs",
+                   SUM(CASE WHEN fournisseur IS NOT NULL THEN COALESCE(montant_paye, 0) ELSE 0 END) AS "Montant payé"
+            FROM transactions
+            {where + " AND" if where else "WHERE"} provenance IS NOT NULL
+            GROUP BY provenance ORDER BY provenance
+            """,
+            self._connexion(),
+            params=params
+        )
+        df["Provenance"] = _typer(df["Provenance"])
+        return df.set_index("Provenance")
+
+
+_bases = {}
+_verrou_bases = threading.Lock()
+
+
+def obtenir_base(chemin=None):
+    """Base du processus pour `chemin` (par défaut TRANSACTIONS_DB), ou None."""
+    chemin = chemin or CHEMIN_BASE
+    if not chemin:
+        return None
+    with _verrou_bases:
+        if chemin not in _bases:
+            _bases[chemin] = BaseTransactions(chemin)
+        return _bases[chemin]
+
+
+def main(arguments):
+    if len(arguments) < 2:
+        print(__doc__.strip())
+        return 1
+    base = BaseTransactions(arguments[0])
+    for chemin in arguments[1:]:
+        if os.path.isdir(chemin):
+            fichiers = fichiers_du_dossier(chemin)
+        else:
+            with open(chemin, "rb") as f:
+                fichiers = [(os.path.basename(chemin), f.read())]
+        for nom, contenu in fichiers:
+            nb = base.importer_excel(contenu, nom)
+            print(f"{nom} : " + ("inchangé" if nb is None else f"{nb} lignes importées"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
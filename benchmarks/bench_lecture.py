@@ -0,0 +1,63 @@
+"""Temps de lecture et pic mémoire par moteur Excel.
+
+    python -m benchmarks.bench_lecture --lignes 10000 100000 1000000
+
+Chaque mesure tourne dans un processus neuf, pour que le pic mémoire (RSS)
+ne soit pas pollué par la mesure précédente.
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+from benchmarks.generateur import classeur_synthetique
+from donnees import FEUILLE, lire_transactions
+
+
+def _moteurs_disponibles():
+    moteurs = ["openpyxl"]
+    try:
+        import python_calamine  # noqa: F401
+        moteurs.insert(0, "calamine")
+    except ImportError:
+        pass
+    return moteurs
+
+
+def _mesurer(chemin, moteur, colonnes_utiles):
+    base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    debut = time.perf_counter()
+    if colonnes_utiles:
+        df = lire_transactions(chemin, [FEUILLE], moteur=moteur)
+    else:
+        df = lire_transactions(chemin, [FEUILLE], colonnes=None, moteur=moteur)
+    duree = time.perf_counter() - debut
+    pic = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss est en Ko sous Linux
+    return len(df), duree, pic / 1024, (pic - base) / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lignes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--moteurs", nargs="+", default=_moteurs_disponibles())
+    parser.add_argument("--dossier", default=os.path.join(tempfile.gettempdir(), "suivi_bench"))
+    args = parser.parse_args()
+
+    contexte = multiprocessing.get_context("spawn")
+    print(f"{'lignes':>9} {'moteur':<10} {'colonnes':<8} {'lignes lues':>11} {'durée (s)':>10} {'pic RSS (Mo)':>13} {'lecture (Mo)':>13}")
+    for nb in args.lignes:
+        print(f"# génération / réutilisation du classeur {nb} lignes...", flush=True)
+        chemin = classeur_synthetique(nb, args.dossier)
+        for moteur in args.moteurs:
+            for colonnes_utiles in (True, False):
+                with contexte.Pool(1) as pool:
+                    lues, duree, pic, delta = pool.apply(_mesurer, (chemin, moteur, colonnes_utiles))
+                etiquette = "utiles" if colonnes_utiles else "toutes"
+                print(f"{nb:>9} {moteur:<10} {etiquette:<8} {lues:>11} {duree:>10.2f} {pic:>13.1f} {delta:>13.1f}", flush=True)
+
+
+if __name__ == "__main__":
+    main()
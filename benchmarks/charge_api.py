@@ -0,0 +1,98 @@
+"""Test de charge de l'API : latences p50/p99 et requêtes par seconde.
+
+    python -m benchmarks.charge_api --lancer main:app --chemin /data --requetes 2000 --concurrence 50
+
+Avec --lancer, un uvicorn local est démarré (et arrêté) pour la mesure ;
+sinon, l'API visée par --url doit déjà tourner. Nécessite httpx et uvicorn.
+"""
+import argparse
+import asyncio
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter
+
+import httpx
+
+
+def _port_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _attendre_serveur(url, delai=30):
+    fin = time.monotonic() + delai
+    while time.monotonic() < fin:
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Le serveur {url} ne répond pas")
+
+
+def centile(valeurs, p):
+    valeurs = sorted(valeurs)
+    return valeurs[min(len(valeurs) - 1, int(round(p / 100 * (len(valeurs) - 1))))]
+
+
+async def charger(url, nb_requetes, concurrence, en_tetes=None):
+    latences, statuts = [], Counter()
+    restantes = iter(range(nb_requetes))
+    limites = httpx.Limits(max_connections=concurrence, max_keepalive_connections=concurrence)
+
+    async with httpx.AsyncClient(limits=limites, timeout=60, headers=en_tetes) as client:
+        async def travailleur():
+            for _ in restantes:
+                debut = time.perf_counter()
+                try:
+                    reponse = await client.get(url)
+                    statuts[reponse.status_code] += 1
+                except httpx.HTTPError as e:
+                    statuts[type(e).__name__] += 1
+                latences.append(time.perf_counter() - debut)
+
+        debut = time.perf_counter()
+        await asyncio.gather(*(travailleur() for _ in range(concurrence)))
+        duree = time.perf_counter() - debut
+    return latences, statuts, duree
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--lancer", metavar="MODULE:APP", help="démarre uvicorn sur cette application")
+    parser.add_argument("--chemin", default="/data")
+    parser.add_argument("--requetes", type=int, default=1000)
+    parser.add_argument("--concurrence", type=int, default=50)
+    parser.add_argument("--en-tete", action="append", default=[], metavar="NOM:VALEUR")
+    args = parser.parse_args()
+
+    serveur = None
+    url = args.url
+    if args.lancer:
+        port = _port_libre()
+        url = f"http://127.0.0.1:{port}"
+        serveur = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", args.lancer, "--port", str(port), "--log-level", "warning"])
+    try:
+        _attendre_serveur(url + "/")
+        # Une requête de chauffe : la première lecture du classeur n'est pas mesurée
+        httpx.get(url + args.chemin, timeout=120)
+        en_tetes = dict(e.split(":", 1) for e in args.en_tete)
+        latences, statuts, duree = asyncio.run(charger(url + args.chemin, args.requetes, args.concurrence, en_tetes))
+    finally:
+        if serveur is not None:
+            serveur.terminate()
+            serveur.wait()
+
+    print(f"{args.requetes} requêtes, concurrence {args.concurrence}, {duree:.2f} s")
+    print(f"débit : {args.requetes / duree:.1f} req/s")
+    print(f"latence p50 : {centile(latences, 50) * 1000:.1f} ms, p99 : {centile(latences, 99) * 1000:.1f} ms")
+    print("statuts : " + ", ".join(f"{k}={v}" for k, v in sorted(statuts.items(), key=str)))
+
+
+if __name__ == "__main__":
+    main()
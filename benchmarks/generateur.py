@@ -0,0 +1,106 @@
+"""Classeurs de transactions synthétiques au schéma « Données socio-démographiques »."""
+import os
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+from donnees import COLONNES_UTILES, FEUILLE
+
+REGIONS = [
+    "Île-de-France", "Auvergne-Rhône-Alpes", "Nouvelle-Aquitaine", "Occitanie",
+    "Provence-Alpes-Côte d'Azur", "Grand Est", "Bretagne", "Normandie",
+    "Hauts-de-France", "Pays de la Loire", "Centre-Val de Loire",
+    "Bourgogne-Franche-Comté", "Corse"
+]
+AGES = ["18-24 ans", "25-34 ans", "35-44 ans", "45-54 ans", "55-64 ans", "65 ans et plus"]
+SEXES = ["Femme", "Homme"]
+CSP = [
+    "Agriculteurs exploitants", "Artisans, commerçants", "Cadres",
+    "Professions intermédiaires", "Employés", "Ouvriers", "Retraités", "Étudiants"
+]
+
+
+def transactions_synthetiques(nb_lignes, nb_clients=None, nb_fournisseurs=None, graine=0):
+    """DataFrame de `nb_lignes` transactions, sur deux ans à partir de janvier 2024."""
+    rng = np.random.default_rng(graine)
+    nb_clients = nb_clients or max(10, nb_lignes // 20)
+    nb_fournisseurs = nb_fournisseurs or max(5, nb_lignes // 100)
+
+    jours = pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 730, nb_lignes), unit="D")
+    recu = rng.random(nb_lignes) < 0.6
+    paye = rng.random(nb_lignes) < 0.6
+    montants_recus = np.round(rng.gamma(2.0, 150.0, nb_lignes), 2)
+    montants_payes = np.round(rng.gamma(2.0, 120.0, nb_lignes), 2)
+    decalage = pd.to_timedelta(rng.integers(0, 45, nb_lignes), unit="D")
+
+    return pd.DataFrame({
+        "Nom du client": pd.Series(rng.integers(0, nb_clients, nb_lignes)).map("Client {:05d}".format),
+        "Nom du fournisseur": pd.Series(rng.integers(0, nb_fournisseurs, nb_lignes)).map("Fournisseur {:04d}".format),
+        "Âge": np.array(AGES)[rng.integers(0, len(AGES), nb_lignes)],
+        "Sexe": np.array(SEXES)[rng.integers(0, len(SEXES), nb_lignes)],
+        "Provenance": np.array(REGIONS)[rng.integers(0, len(REGIONS), nb_lignes)],
+        "Catégorie socio-professionnelle": np.array(CSP)[rng.integers(0, len(CSP), nb_lignes)],
+        "Montant reçu": np.where(recu, montants_recus, np.nan),
+        "Date 1": pd.Series(jours).where(recu),
+        "Montant payé": np.where(paye, montants_payes, np.nan),
+        "Date 2": pd.Series(jours + decalage).where(paye),
+    }, columns=COLONNES_UTILES)
+
+
+def ecrire_classeur(df, chemin, colonnes_en_plus=0):
+    """Écrit `df` dans la feuille de transactions, en flux (openpyxl write_only).
+
+    `colonnes_en_plus` ajoute des colonnes annexes, comme les tableaux de
+    synthèse à droite des vrais classeurs, que les lecteurs doivent ignorer.
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(FEUILLE)
+    annexes = [f"Annexe {i}" for i in range(colonnes_en_plus)]
+    ws.append(list(df.columns) + annexes)
+    valeurs_annexes = ["x"] * colonnes_en_plus
+    for ligne in df.itertuples(index=False, name=None):
+        ws.append([None if pd.isna(v) else (v.to_pydatetime() if isinstance(v, pd.Timestamp) else v) for v in ligne] + valeurs_annexes)
+    wb.save(chemin)
+    return chemin
+
+
+def classeur_synthetique(nb_lignes, dossier, colonnes_en_plus=5, graine=0):
+    """Chemin d'un classeur de `nb_lignes` lignes, généré une seule fois par dossier."""
+    chemin = os.path.join(dossier, f"transactions_{nb_lignes}_{graine}.xlsx")
+    if not os.path.exists(chemin):
+        os.makedirs(dossier, exist_ok=True)
+        ecrire_classeur(transactions_synthetiques(nb_lignes, graine=graine), chemin + ".tmp", colonnes_en_plus)
+        os.replace(chemin + ".tmp", chemin)
+    return chemin
+
+
+PHRASES_VEILLE = [
+    "Notre {produit} est disponible dans toutes nos agences de {region} depuis le mois dernier.",
+    "La nouvelle offre {produit} propose un tarif réduit aux clients fidèles de {region}.",
+    "Nous avons ouvert un point de vente {produit} au cœur de la région {region}.",
+    "Le service client {produit} répond désormais sous vingt-quatre heures en {region}.",
+    "Découvrez la gamme {produit} pensée pour les professionnels de {region}.",
+    "Les abonnés {produit} bénéficient de la livraison gratuite partout en {region}.",
+]
+PRODUITS = ["Premium", "Essentiel", "Pro", "Famille", "Entreprise", "Étudiant", "Senior", "Connect"]
+
+
+def passages_synthetiques(nb_passages, taux_doublons=0.3, graine=0):
+    """Passages (url, texte) de veille, dont une part de quasi-doublons reformulés."""
+    rng = np.random.default_rng(graine)
+    passages = []
+    for i in range(nb_passages):
+        url = f"https://exemple-{i % 5}.fr/page-{i % 17}"
+        if passages and rng.random() < taux_doublons:
+            # Quasi-doublon : un passage déjà vu, ponctuation et casse modifiées
+            _, texte = passages[rng.integers(0, len(passages))]
+            texte = texte.replace(".", " !").upper() if rng.random() < 0.5 else "En bref : " + texte
+        else:
+            modele = PHRASES_VEILLE[rng.integers(0, len(PHRASES_VEILLE))]
+            texte = modele.format(
+                produit=PRODUITS[rng.integers(0, len(PRODUITS))] + f" {i}",
+                region=REGIONS[rng.integers(0, len(REGIONS))]
+            )
+        passages.append((url, texte))
+    return passages
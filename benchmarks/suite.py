@@ -0,0 +1,253 @@
+"""Benchmarks des chemins critiques, avec historique des résultats.
+
+    python -m benchmarks.suite --complet --comparer
+    python -m benchmarks.suite --tailles 1000 --cas pdf --comparer
+
+--complet (1 000, 100 000 et 1 000 000 lignes) est la mesure de référence ;
+sans lui, seules les tailles de --tailles (1 000 et 100 000 par défaut)
+tournent, pour un tour rapide. Les cas tournent sur des classeurs synthétiques (benchmarks.generateur) de
+chaque taille ; les cas indépendants de la taille (dédoublonnage, rapport de
+veille) tournent une seule fois. Chaque exécution est ajoutée à
+benchmarks/historique.jsonl avec le commit courant. --comparer compare au
+dernier résultat enregistré sur la même machine et sort en erreur si un cas
+a ralenti de plus de --seuil.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from benchmarks.generateur import REGIONS, classeur_synthetique, passages_synthetiques
+from donnees import FEUILLE, indicateurs_periode, lire_transactions
+from incremental import AgregatsTransactions
+
+HISTORIQUE = os.path.join(os.path.dirname(__file__), "historique.jsonl")
+NB_SELECTION = 10
+TAILLES_COMPLETES = [1_000, 100_000, 1_000_000]
+
+_cas = []
+
+
+def cas(nom, par_taille=True):
+    """Déclare un cas : `preparer(contexte)` renvoie la fonction à chronométrer."""
+    def enregistrer(preparer):
+        _cas.append((nom, par_taille, preparer))
+        return preparer
+    return enregistrer
+
+
+class Contexte:
+    def __init__(self, chemin=None, df=None):
+        self.chemin = chemin
+        self.df = df
+        if df is not None:
+            self.clients = df["Nom du client"].dropna().unique()[:NB_SELECTION].tolist()
+            self.fournisseurs = df["Nom du fournisseur"].dropna().unique()[:NB_SELECTION].tolist()
+            self.mois = sorted(df["Date 1"].dropna().dt.to_period("M").unique())[:3]
+
+
+# ----------------------- CAS -----------------------
+@cas("ingestion_excel")
+def _ingestion(ctx):
+    return lambda: lire_transactions(ctx.chemin, [FEUILLE])
+
+
+@cas("accueil_indicateurs")
+def _accueil_indicateurs(ctx):
+    return lambda: indicateurs_periode(ctx.df, ctx.mois)
+
+
+@cas("agregats")
+def _agregats(ctx):
+    # Cumuls mensuels et statistiques par client, fournisseur et région
+    return lambda: AgregatsTransactions.depuis(ctx.df)
+
+
+@cas("graphique_mensuel")
+def _graphique_mensuel(ctx):
+    from graphiques import graphique_mensuel_png
+    mensuel = AgregatsTransactions.depuis(ctx.df).mensuel
+    return lambda: graphique_mensuel_png(mensuel)
+
+
+@cas("pdf_periode")
+def _pdf_periode(ctx):
+    from rapports import rapport_periode
+    i = indicateurs_periode(ctx.df, ctx.mois)
+    return lambda: rapport_periode(
+        "Benchmark", i.df_recu, i.df_paye, "", i.nb_clients, i.nb_fournisseurs,
+        i.montant_recu_total, i.montant_paye_total, i.solde
+    )
+
+
+@cas("pdf_selection")
+def _pdf_selection(ctx):
+    from rapports import rapport_selection
+    return lambda: rapport_selection(ctx.df, ctx.clients, ctx.fournisseurs, 0.0, 0.0, 0.0, "")
+
+
+@cas("pdf_region")
+def _pdf_region(ctx):
+    from rapports import rapport_region
+    # Colonnes renommées comme sur la page Carte des clients
+    lignes = ctx.df[ctx.df["Provenance"] == REGIONS[0]].rename(columns={
+        "Nom du client": "nom", "Provenance": "region", "Montant reçu": "montant",
+        "Sexe": "sexe", "Âge": "age", "Catégorie socio-professionnelle": "csp",
+    })
+    lignes = lignes[lignes["nom"].notna()]
+    return lambda: rapport_region(REGIONS[0], lignes, 0.0, 0.0, 0.0, 0, 0, "")
+
+
+@cas("api_data")
+def _api_data(ctx):
+    from fastapi.testclient import TestClient
+    import main
+    # Requête /data complète sur le classeur de cette taille, sans cache de
+    # réponses : lecture des lignes, sérialisation orjson et compression
+    main.FICHIER = ctx.chemin
+    main.API_CACHE_REPONSES = 0
+    client = TestClient(main.app)
+    client.get("/data")  # ingestion du classeur, hors mesure
+
+    def requete():
+        reponse = client.get("/data", headers={"Accept-Encoding": "br, gzip"})
+        reponse.raise_for_status()
+    return requete
+
+
+@cas("dedoublonnage_veille", par_taille=False)
+def _dedoublonnage(ctx):
+    from veille import dedoublonner
+    passages = passages_synthetiques(400)
+    return lambda: dedoublonner(passages)
+
+
+@cas("pdf_veille", par_taille=False)
+def _pdf_veille(ctx):
+    from rapports import rapport_veille
+    from veille import dedoublonner
+    passages = dedoublonner(passages_synthetiques(100))
+    return lambda: rapport_veille("Benchmark", ["https://exemple-0.fr"], passages)
+
+
+# ----------------------- MESURE -----------------------
+def chronometrer(fonction, repetitions, budget):
+    """Temps (s) de jusqu'à `repetitions` appels, en s'arrêtant après `budget` secondes."""
+    durees = []
+    debut_total = time.perf_counter()
+    while len(durees) < repetitions:
+        debut = time.perf_counter()
+        fonction()
+        durees.append(time.perf_counter() - debut)
+        if time.perf_counter() - debut_total > budget:
+            break
+    return durees
+
+
+def machine():
+    return f"{platform.node()}|{platform.machine()}|{platform.python_version()}"
+
+
+def commit_courant():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def dernier_resultat(historique, nom_machine):
+    """Dernier temps connu de chaque (cas, taille) sur cette machine."""
+    references = {}
+    if not os.path.exists(historique):
+        return references
+    with open(historique, encoding="utf-8") as f:
+        for ligne in f:
+            execution = json.loads(ligne)
+            if execution["machine"] != nom_machine:
+                continue
+            for r in execution["resultats"]:
+                references[(r["cas"], r["taille"])] = r["meilleur"]
+    return references
+
+
+def executer(tailles, filtres, repetitions, budget, dossier):
+    resultats = []
+
+    def mesurer(nom, taille, preparer, ctx):
+        fonction = preparer(ctx)
+        durees = chronometrer(fonction, repetitions, budget)
+        resultat = {
+            "cas": nom, "taille": taille, "repetitions": len(durees),
+            "meilleur": min(durees), "mediane": statistics.median(durees),
+        }
+        print(f"{nom:<22} {taille or '-':>9} {resultat['meilleur'] * 1000:>12.1f} {resultat['mediane'] * 1000:>12.1f} {len(durees):>4}", flush=True)
+        resultats.append(resultat)
+
+    choisis = [c for c in _cas if not filtres or any(f in c[0] for f in filtres)]
+    print(f"{'cas':<22} {'lignes':>9} {'meilleur ms':>12} {'médiane ms':>12} {'rép':>4}")
+    for nom, par_taille, preparer in choisis:
+        if not par_taille:
+            mesurer(nom, None, preparer, Contexte())
+    for taille in tailles:
+        print(f"# classeur {taille} lignes (généré au premier passage)...", flush=True)
+        chemin = classeur_synthetique(taille, dossier)
+        ctx = Contexte(chemin, lire_transactions(chemin, [FEUILLE]))
+        for nom, par_taille, preparer in choisis:
+            if par_taille:
+                mesurer(nom, taille, preparer, ctx)
+    return resultats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tailles", type=int, nargs="+", default=[1_000, 100_000])
+    parser.add_argument("--complet", action="store_true", help=f"tailles de référence : {TAILLES_COMPLETES}")
+    parser.add_argument("--cas", nargs="*", default=[], help="ne lancer que les cas contenant ces textes")
+    parser.add_argument("--repetitions", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=20.0, help="secondes max par cas et par taille")
+    parser.add_argument("--dossier", default=os.path.join(tempfile.gettempdir(), "suivi_bench"))
+    parser.add_argument("--historique", default=HISTORIQUE)
+    parser.add_argument("--comparer", action="store_true")
+    parser.add_argument("--seuil", type=float, default=0.20, help="ralentissement toléré (0.20 = 20 %%)")
+    parser.add_argument("--sans-historique", action="store_true", help="ne pas enregistrer cette exécution")
+    args = parser.parse_args()
+
+    nom_machine = machine()
+    references = dernier_resultat(args.historique, nom_machine)
+    tailles = TAILLES_COMPLETES if args.complet else args.tailles
+    resultats = executer(tailles, args.cas, args.repetitions, args.budget, args.dossier)
+
+    if not args.sans_historique:
+        with open(args.historique, "a", encoding="utf-8") as f:
+            f.write(json.dumps({
+                "date": datetime.now().isoformat(timespec="seconds"),
+                "commit": commit_courant(),
+                "machine": nom_machine,
+                "resultats": resultats,
+            }, ensure_ascii=False) + "\n")
+
+    regressions = []
+    for r in resultats:
+        reference = references.get((r["cas"], r["taille"]))
+        if reference and r["meilleur"] > reference * (1 + args.seuil):
+            regressions.append((r, reference))
+    if args.comparer:
+        for r, reference in regressions:
+            print(f"RÉGRESSION {r['cas']} ({r['taille'] or '-'} lignes) : "
+                  f"{reference * 1000:.1f} ms -> {r['meilleur'] * 1000:.1f} ms")
+        if not references:
+            print("# aucune exécution précédente sur cette machine")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
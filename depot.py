@@ -0,0 +1,234 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:  # pyarrow est optionnel : sans lui, le dépôt reste en mémoire
+    pa = None
+
+# Configuration (variables d'environnement, cf. env.sh)
+MEMOIRE_MAX_MO = int(os.environ.get("DEPOT_MEMOIRE_MO", "512"))
+DOSSIER_ARROW = os.environ.get("DEPOT_DOSSIER_ARROW") or None
+BAIL_SECONDES = int(os.environ.get("DEPOT_BAIL_SECONDES", "3600"))
+DISQUE_MAX_MO = int(os.environ.get("DEPOT_DISQUE_MO", "2048"))
+
+
+class _Entree:
+    def __init__(self, df):
+        self.df = df
+        self.taille = int(df.memory_usage(deep=True, index=True).sum())
+        # detenteur -> dernier accès ; une session disparue sans libérer
+        # son jeu de données perd sa référence à l'expiration du bail
+        self.detenteurs = {}
+
+
+class DepotDonnees:
+    """Jeux de données partagés entre toutes les sessions du processus.
+
+    Les entrées sont indexées par l'empreinte du fichier source : des envois
+    identiques partagent un seul DataFrame, lu une seule fois. Chaque session
+    reçoit une copie superficielle (mêmes tableaux, pas de recopie) qu'elle
+    ne doit pas modifier en place. Les entrées non référencées sont évincées
+    dans l'ordre LRU dès que le budget mémoire est dépassé ; si un dossier
+    Arrow est configuré, elles y restent et sont relues par memory-map. Les
+    fichiers Arrow ont leur propre budget disque, lui aussi géré en LRU.
+    """
+
+    def __init__(self, memoire_max_octets, dossier_arrow=None, bail_secondes=BAIL_SECONDES,
+                 disque_max_octets=DISQUE_MAX_MO * 1024 * 1024):
+        self.memoire_max_octets = memoire_max_octets
+        self.dossier_arrow = dossier_arrow if pa is not None else None
+        self.bail_secondes = bail_secondes
+        self.disque_max_octets = disque_max_octets
+        self._entrees = OrderedDict()
+        # Fichiers Arrow du dossier : clé -> octets, du moins au plus récemment utilisé
+        self._fichiers = OrderedDict()
+        self._verrou = threading.Lock()
+        self._verrous_cles = {}
+        if self.dossier_arrow:
+            os.makedirs(self.dossier_arrow, exist_ok=True)
+            self._inventorier_arrow()
+
+    # ----------------------- API -----------------------
+    def obtenir(self, cle, chargeur, detenteur=None):
+        """Renvoie le jeu de données `cle`, en appelant `chargeur()` au besoin."""
+        entree = self._depuis_memoire(cle, detenteur)
+        if entree is None:
+            # Un verrou par clé : dix sessions qui envoient le même fichier
+            # en même temps n'en déclenchent qu'une seule lecture
+            verrou = self._verrou_cle(cle)
+            try:
+                with verrou:
+                    entree = self._depuis_memoire(cle, detenteur)
+                    if entree is None:
+                        df = self._lire_arrow(cle)
+                        if df is None:
+                            df = chargeur()
+                            self._ecrire_arrow(cle, df)
+                        entree = self._inserer(cle, _Entree(df), detenteur)
+            finally:
+                # Aussi quand `chargeur` échoue : pas de verrou orphelin par clé
+                with self._verrou:
+                    if self._verrous_cles.get(cle) is verrou:
+                        del self._verrous_cles[cle]
+        return entree.df.copy(deep=False)
+
+    def lire(self, cle, detenteur=None):
+        """Le jeu de données `cle` s'il est encore disponible (mémoire ou Arrow), sinon None."""
+        entree = self._depuis_memoire(cle, detenteur)
+        if entree is None:
+            df = self._lire_arrow(cle)
+            if df is None:
+                return None
+            entree = self._inserer(cle, _Entree(df), detenteur)
+        return entree.df.copy(deep=False)
+
+    def retenir(self, cle, detenteur):
+        """Ajoute une référence à un jeu déjà chargé (sans effet s'il est absent)."""
+        self._depuis_memoire(cle, detenteur)
+
+    def liberer(self, cle, detenteur):
+        with self._verrou:
+            entree = self._entrees.get(cle)
+            if entree is not None:
+                entree.detenteurs.pop(detenteur, None)
+            self._evincer()
+
+    def contient(self, cle):
+        with self._verrou:
+            return cle in self._entrees
+
+    def statistiques(self):
+        with self._verrou:
+            return {
+                "entrees": len(self._entrees),
+                "octets": sum(e.taille for e in self._entrees.values()),
+                "memoire_max_octets": self.memoire_max_octets,
+                "references": sum(len(e.detenteurs) for e in self._entrees.values()),
+            }
+
+    # ----------------------- Interne -----------------------
+    def _verrou_cle(self, cle):
+        with self._verrou:
+            return self._verrous_cles.setdefault(cle, threading.Lock())
+
+    def _depuis_memoire(self, cle, detenteur):
+        with self._verrou:
+            entree = self._entrees.get(cle)
+            if entree is not None:
+                self._entrees.move_to_end(cle)
+                if detenteur is not None:
+                    entree.detenteurs[detenteur] = time.monotonic()
+            return entree
+
+    def _inserer(self, cle, entree, detenteur):
+        with self._verrou:
+            if detenteur is not None:
+                entree.detenteurs[detenteur] = time.monotonic()
+            self._entrees[cle] = entree
+            self._evincer()
+            return entree
+
+    def _evincer(self):
+        # Appelé sous self._verrou
+        limite = time.monotonic() - self.bail_secondes
+        total = sum(e.taille for e in self._entrees.values())
+        for cle in list(self._entrees):
+            if total <= self.memoire_max_octets:
+                break
+            entree = self._entrees[cle]
+            for detenteur, vu in list(entree.detenteurs.items()):
+                if vu < limite:
+                    del entree.detenteurs[detenteur]
+            if not entree.detenteurs:
+                del self._entrees[cle]
+                total -= entree.taille
+
+    def _chemin_arrow(self, cle):
+        return os.path.join(self.dossier_arrow, f"{cle}.arrow")
+
+    def _inventorier_arrow(self):
+        # Fichiers laissés par un processus précédent, les plus anciens d'abord
+        fichiers = []
+        for nom in os.listdir(self.dossier_arrow):
+            chemin = os.path.join(self.dossier_arrow, nom)
+            if nom.endswith(".arrow.tmp"):
+                self._supprimer(chemin)
+            elif nom.endswith(".arrow"):
+                stat = os.stat(chemin)
+                fichiers.append((stat.st_mtime, nom.removesuffix(".arrow"), stat.st_size))
+        for _, cle, taille in sorted(fichiers):
+            self._fichiers[cle] = taille
+        self._limiter_disque()
+
+    def _lire_arrow(self, cle):
+        if not self.dossier_arrow or not os.path.exists(self._chemin_arrow(cle)):
+            return None
+        try:
+            source = pa.memory_map(self._chemin_arrow(cle), "r")
+            table = pa.ipc.open_file(source).read_all()
+            # split_blocks : les colonnes numériques sans valeurs manquantes
+            # pointent directement dans le fichier mappé, sans copie
+            df = table.to_pandas(split_blocks=True)
+        except Exception:
+            return None
+        with self._verrou:
+            if cle in self._fichiers:
+                self._fichiers.move_to_end(cle)
+        return df
+
+    def _ecrire_arrow(self, cle, df):
+        if not self.dossier_arrow:
+            return
+        chemin = self._chemin_arrow(cle)
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            with pa.OSFile(chemin + ".tmp", "wb") as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            os.replace(chemin + ".tmp", chemin)
+        except Exception:
+            # Colonnes de types mixtes non convertibles : on reste en mémoire
+            if os.path.exists(chemin + ".tmp"):
+                os.unlink(chemin + ".tmp")
+            return
+        with self._verrou:
+            self._fichiers[cle] = os.path.getsize(chemin)
+            self._fichiers.move_to_end(cle)
+            self._limiter_disque(garder=cle)
+
+    def _limiter_disque(self, garder=None):
+        # Appelé sous self._verrou (ou à l'initialisation). Un fichier encore
+        # mappé peut être supprimé : ses pages restent lisibles jusqu'au démappage.
+        total = sum(self._fichiers.values())
+        for cle in list(self._fichiers):
+            if total <= self.disque_max_octets:
+                break
+            if cle == garder:
+                continue
+            total -= self._fichiers.pop(cle)
+            self._supprimer(self._chemin_arrow(cle))
+
+    @staticmethod
+    def _supprimer(chemin):
+        try:
+            os.unlink(chemin)
+        except OSError:
+            pass
+
+
+_depot = None
+_verrou_depot = threading.Lock()
+
+
+def obtenir_depot():
+    """Dépôt unique du processus, partagé par toutes les sessions Streamlit."""
+    global _depot
+    with _verrou_depot:
+        if _depot is None:
+            _depot = DepotDonnees(MEMOIRE_MAX_MO * 1024 * 1024, DOSSIER_ARROW,
+                                  disque_max_octets=DISQUE_MAX_MO * 1024 * 1024)
+        return _depot
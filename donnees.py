@@ -0,0 +1,141 @@
+import hashlib
+import os
+from typing import NamedTuple
+
+import pandas as pd
+
+# Moteur de lecture Excel : calamine (Rust, pip install python-calamine) si
+# disponible. Sinon pandas choisit selon l'extension : openpyxl pour .xlsx,
+# qu'il ouvre déjà en mode read_only (lecture en flux). MOTEUR_EXCEL permet
+# de forcer un moteur.
+try:
+    import python_calamine  # noqa: F401
+    MOTEUR_EXCEL = "calamine"
+except ImportError:
+    MOTEUR_EXCEL = None
+MOTEUR_EXCEL = os.environ.get("MOTEUR_EXCEL") or MOTEUR_EXCEL
+
+# Schéma des classeurs clients
+FEUILLE = "Données socio-démographiques"
+COLONNES_UTILES = [
+    "Nom du client", "Nom du fournisseur", "Âge", "Sexe", "Provenance",
+    "Catégorie socio-professionnelle", "Montant reçu", "Date 1",
+    "Montant payé", "Date 2"
+]
+COLONNES_DATES = ["Date 1", "Date 2"]
+# Une feuille est reconnue comme feuille de transactions si elle a ces colonnes
+COLONNES_SCHEMA = {"Nom du client", "Nom du fournisseur", "Montant reçu", "Montant payé"}
+COLONNE_FEUILLE = "Feuille"
+COLONNE_SOURCE = "Fichier source"
+
+
+def empreinte_contenu(contenu):
+    """Clé de contenu d'un fichier : deux envois identiques ont la même clé."""
+    return hashlib.sha256(contenu).hexdigest()
+
+
+def preparer_transactions(df):
+    # Supprimer colonnes "Unnamed" et espaces parasites ("Âge ")
+    df = df.drop(columns=[c for c in df.columns if str(c).startswith("Unnamed")])
+    df.columns = df.columns.astype(str).str.strip()
+
+    # Traitement des dates
+    for col in COLONNES_DATES:
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col], errors='coerce')
+    return df
+
+
+def feuilles_transactions(classeur):
+    """Noms des feuilles d'un pd.ExcelFile qui suivent le schéma transactions."""
+    feuilles = []
+    for nom in classeur.sheet_names:
+        entetes = classeur.parse(nom, nrows=0).columns.astype(str).str.strip()
+        if COLONNES_SCHEMA.issubset(entetes):
+            feuilles.append(nom)
+    return feuilles
+
+
+def selection_colonnes(colonnes):
+    if colonnes is None:
+        return None
+    attendues = set(colonnes)
+    return lambda c: str(c).strip() in attendues
+
+
+def lire_transactions(source, feuilles=None, colonnes=COLONNES_UTILES, moteur=None, toutes_feuilles=False):
+    """Lit une ou plusieurs feuilles d'un classeur et les empile.
+
+    Sans `feuilles`, seule la feuille FEUILLE est lue ; avec
+    `toutes_feuilles`, toutes les feuilles au schéma transactions le sont.
+    Chaque ligne garde le nom de sa feuille d'origine. Seules les
+    `colonnes` utiles sont construites (None : toutes).
+    """
+    with pd.ExcelFile(source, engine=moteur or MOTEUR_EXCEL) as classeur:
+        if feuilles is None:
+            feuilles = feuilles_transactions(classeur) if toutes_feuilles else [FEUILLE]
+        if not feuilles:
+            raise ValueError(f"Aucune feuille de transactions (attendu : « {FEUILLE} »)")
+        absentes = [nom for nom in feuilles if nom not in classeur.sheet_names]
+        if absentes:
+            raise ValueError(f"Feuille introuvable : « {absentes[0]} »")
+        morceaux = [
+            preparer_transactions(
+                classeur.parse(nom, usecols=selection_colonnes(colonnes))
+            ).assign(**{COLONNE_FEUILLE: nom})
+            for nom in feuilles
+        ]
+    if len(morceaux) == 1:
+        return morceaux[0]
+    return pd.concat(morceaux, ignore_index=True)
+
+
+def filtrer_transactions(df, clients=None, fournisseurs=None, mois=None):
+    """Même sélection que BaseTransactions.transactions, sur un DataFrame."""
+    masque = pd.Series(True, index=df.index)
+    if clients or fournisseurs:
+        entites = pd.Series(False, index=df.index)
+        if clients:
+            entites |= df["Nom du client"].isin(clients)
+        if fournisseurs:
+            entites |= df["Nom du fournisseur"].isin(fournisseurs)
+        masque &= entites
+    if mois:
+        periodes = [pd.Period(m, "M") for m in mois]
+        masque &= df["Date 1"].dt.to_period("M").isin(periodes) | df["Date 2"].dt.to_period("M").isin(periodes)
+    return df[masque]
+
+
+class IndicateursPeriode(NamedTuple):
+    df_recu: pd.DataFrame
+    df_paye: pd.DataFrame
+    montant_recu_total: float
+    montant_paye_total: float
+    solde: float
+    nb_clients: int
+    nb_fournisseurs: int
+
+
+def indicateurs_periode(df, mois_choisis=None):
+    """Chiffres clés de la page Accueil sur les mois choisis (Periods), ou sur tout `df`.
+
+    Un montant reçu compte dans le mois de sa Date 1, un montant payé dans
+    celui de sa Date 2.
+    """
+    if mois_choisis:
+        # On garde les lignes dont Date 1 ou Date 2 est dans l'un des mois choisis
+        mois_recu = df["Date 1"].dt.to_period("M").isin(mois_choisis)
+        mois_paye = df["Date 2"].dt.to_period("M").isin(mois_choisis)
+        df_recu = df[mois_recu & df["Montant reçu"].notna() & (df["Montant reçu"] > 0)]
+        df_paye = df[mois_paye & df["Montant payé"].notna() & (df["Montant payé"] > 0)]
+    else:
+        df_recu = df[df["Montant reçu"].notna() & (df["Montant reçu"] > 0)]
+        df_paye = df[df["Montant payé"].notna() & (df["Montant payé"] > 0)]
+
+    montant_recu_total = df_recu["Montant reçu"].sum()
+    montant_paye_total = df_paye["Montant payé"].sum()
+    return IndicateursPeriode(
+        df_recu, df_paye, montant_recu_total, montant_paye_total,
+        montant_recu_total - montant_paye_total,
+        df_recu["Nom du client"].nunique(), df_paye["Nom du fournisseur"].nunique()
+    )
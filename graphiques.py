@@ -0,0 +1,38 @@
+"""Graphiques rendus en PNG, sans pyplot : à mettre en cache et à réutiliser dans les PDF."""
+from io import BytesIO
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from PIL import Image
+
+
+def graphique_mensuel_png(mensuel, mois_a_afficher=None, dpi=100):
+    """Barres reçu / payé / solde par mois, en PNG.
+
+    `mensuel` : montants indexés par mois (AgregatsTransactions.mensuel).
+    `mois_a_afficher` : Timestamps de début de mois, ou None pour tous.
+    """
+    if mois_a_afficher is None:
+        mois_a_afficher = list(mensuel.index)
+    graph_grouped = mensuel.reindex(sorted(mois_a_afficher), fill_value=0)
+    graph_grouped["Solde"] = graph_grouped["Montant reçu"] - graph_grouped["Montant payé"]
+    graph_grouped.index = graph_grouped.index.to_series().dt.strftime('%b %Y').str.capitalize()
+
+    # Figure hors pyplot : aucune référence globale, libérée dès la fin de la fonction
+    fig = Figure()
+    ax = fig.subplots()
+    graph_grouped[["Montant reçu", "Montant payé", "Solde"]].plot(kind="bar", ax=ax)
+    ax.tick_params(axis="x", labelrotation=45, labelsize=8)
+    ax.set_xlabel("Mois")
+    ax.set_ylabel("Montant (€)")
+    ax.set_title("Évolution mensuelle")
+    fig.tight_layout()
+
+    fig.set_dpi(dpi)
+    canvas = FigureCanvasAgg(fig)
+    canvas.draw()
+    # PNG RVB sans canal alpha : fpdf l'intègre tel quel, sans décoder les pixels
+    image = Image.frombuffer("RGBA", canvas.get_width_height(), canvas.buffer_rgba()).convert("RGB")
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
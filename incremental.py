@@ -0,0 +1,182 @@
+import hashlib
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from donnees import (
+    COLONNE_FEUILLE, COLONNE_SOURCE, COLONNES_UTILES, FEUILLE, lire_transactions
+)
+
+COLONNES_ORIGINE = (COLONNE_FEUILLE, COLONNE_SOURCE)
+
+
+# ----------------------- EMPREINTES -----------------------
+def empreinte_bloc(df):
+    """Empreinte de toutes les lignes de `df`, indépendante des dtypes numériques (25 == 25.0)."""
+    normalise = df.apply(
+        lambda c: c.astype("float64")
+        if pd.api.types.is_numeric_dtype(c) and not pd.api.types.is_bool_dtype(c) else c
+    )
+    valeurs = pd.util.hash_pandas_object(normalise, index=False).to_numpy()
+    return hashlib.sha1(valeurs.tobytes()).hexdigest()
+
+
+class EtatIngestion(NamedTuple):
+    nb_lignes: int
+    colonnes: tuple
+    empreinte: str
+
+
+def etat_de(df):
+    """État d'un classeur déjà ingéré, ou None s'il ne contient aucune ligne.
+
+    Les lignes vides en bas de feuille ne comptent pas : une transaction
+    saisie dedans est une nouvelle ligne à la prochaine lecture.
+    """
+    colonnes = [c for c in df.columns if c not in COLONNES_ORIGINE]
+    remplies = np.flatnonzero(df[colonnes].notna().any(axis=1).to_numpy())
+    if len(remplies) == 0:
+        return None
+    nb_lignes = int(remplies[-1]) + 1
+    return EtatIngestion(nb_lignes, tuple(colonnes), empreinte_bloc(df[colonnes].iloc[:nb_lignes]))
+
+
+def lignes_ajoutees(df, etat):
+    """Lignes de `df` ajoutées sous les `etat.nb_lignes` lignes déjà ingérées.
+
+    Renvoie None si le classeur relu n'est pas un simple ajout en bas :
+    colonnes changées, aucune ligne remplie ajoutée, ou une ligne connue
+    modifiée, n'importe où dans le bloc. Ses agrégats sont alors à refaire.
+    """
+    colonnes = [c for c in df.columns if c not in COLONNES_ORIGINE]
+    if tuple(colonnes) != etat.colonnes or len(df) <= etat.nb_lignes:
+        return None
+    if not df[colonnes].iloc[etat.nb_lignes:].notna().any(axis=None):
+        return None
+    if empreinte_bloc(df[colonnes].iloc[:etat.nb_lignes]) != etat.empreinte:
+        return None
+    return df.iloc[etat.nb_lignes:].reset_index(drop=True)
+
+
+# ----------------------- AGRÉGATS -----------------------
+def _somme_par_mois(df):
+    date_combinee = df[["Date 1", "Date 2"]].min(axis=1, skipna=True)
+    mois = date_combinee.dt.to_period("M").dt.to_timestamp().rename("Mois")
+    return df.groupby(mois)[["Montant reçu", "Montant payé"]].sum()
+
+
+def _stats_entites(df, col_nom, col_montant, col_date):
+    lignes = df[df[col_nom].notna()]
+    montants = lignes.groupby(col_nom)[col_montant]
+    stats = pd.DataFrame({"Montant total": montants.sum(), "Transactions": montants.count()})
+    # Dernière transaction : date la plus récente, première ligne en cas d'égalité
+    dernieres = (
+        lignes[lignes[col_date].notna()]
+        .sort_values(col_date, ascending=False, kind="stable")
+        .drop_duplicates(col_nom)
+        .set_index(col_nom)
+    )
+    stats["Dernière date"] = dernieres[col_date]
+    stats["Dernier montant"] = dernieres[col_montant]
+    return stats
+
+
+def _fusion_entites(avant, apres):
+    if avant.empty:
+        return apres
+    index = avant.index.union(apres.index)
+    a = avant.reindex(index)
+    b = apres.reindex(index)
+    plus_recente = b["Dernière date"].notna() & ~(b["Dernière date"] <= a["Dernière date"])
+    return pd.DataFrame({
+        "Montant total": a["Montant total"].fillna(0) + b["Montant total"].fillna(0),
+        "Transactions": (a["Transactions"].fillna(0) + b["Transactions"].fillna(0)).astype(int),
+        "Dernière date": a["Dernière date"].mask(plus_recente, b["Dernière date"]),
+        "Dernier montant": a["Dernier montant"].mask(plus_recente, b["Dernier montant"]),
+    })
+
+
+def _stats_regions(df):
+    if "Provenance" not in df.columns:
+        return pd.DataFrame(columns=["Lignes clients", "Montant reçu", "Lignes fournisseurs", "Montant payé"])
+    clients = df[df["Nom du client"].notna()].groupby("Provenance")["Montant reçu"]
+    fournisseurs = df[df["Nom du fournisseur"].notna()].groupby("Provenance")["Montant payé"]
+    return pd.DataFrame({
+        "Lignes clients": clients.size(),
+        "Montant reçu": clients.sum(),
+        "Lignes fournisseurs": fournisseurs.size(),
+        "Montant payé": fournisseurs.sum(),
+    }).fillna(0)
+
+
+def _fusion_sommes(avant, apres):
+    if avant.empty:
+        return apres
+    return avant.add(apres, fill_value=0).sort_index()
+
+
+class AgregatsTransactions:
+    """Cumuls mensuels, statistiques par client/fournisseur et par région.
+
+    `ajouter` fusionne les agrégats de nouvelles lignes dans les cumuls
+    existants : le coût dépend du nombre de lignes ajoutées et du nombre
+    d'entités, pas de l'historique complet.
+    """
+
+    def __init__(self):
+        self.mensuel = pd.DataFrame()
+        self.clients = pd.DataFrame()
+        self.fournisseurs = pd.DataFrame()
+        self.regions = pd.DataFrame()
+
+    @classmethod
+    def depuis(cls, df):
+        agregats = cls()
+        agregats.ajouter(df)
+        return agregats
+
+    def copie(self):
+        """Copie indépendante : `ajouter` remplace les tableaux sans les modifier."""
+        agregats = AgregatsTransactions()
+        agregats.mensuel, agregats.clients = self.mensuel, self.clients
+        agregats.fournisseurs, agregats.regions = self.fournisseurs, self.regions
+        return agregats
+
+    def ajouter(self, df):
+        self.mensuel = _fusion_sommes(self.mensuel, _somme_par_mois(df))
+        self.clients = _fusion_entites(
+            self.clients, _stats_entites(df, "Nom du client", "Montant reçu", "Date 1"))
+        self.fournisseurs = _fusion_entites(
+            self.fournisseurs, _stats_entites(df, "Nom du fournisseur", "Montant payé", "Date 2"))
+        self.regions = _fusion_sommes(self.regions, _stats_regions(df))
+
+
+# ----------------------- INGESTION -----------------------
+class IngestionIncrementale:
+    """Suivi d'un classeur-registre où les transactions s'ajoutent en bas.
+
+    Chaque `rafraichir` relit le classeur ; si les lignes déjà ingérées sont
+    toutes inchangées, `agregats` n'est complété que des lignes ajoutées,
+    sinon il est recalculé.
+    """
+
+    def __init__(self, feuille=FEUILLE, colonnes=COLONNES_UTILES, moteur=None):
+        self.feuille = feuille
+        self.colonnes = colonnes
+        self.moteur = moteur
+        self.df = None
+        self.agregats = None
+        self.etat = None
+
+    def rafraichir(self, source):
+        """Ingère `source` et renvoie le nombre de lignes ajoutées au jeu."""
+        df = lire_transactions(source, [self.feuille], self.colonnes, self.moteur)
+        nouvelles = None if self.etat is None else lignes_ajoutees(df, self.etat)
+        self.df = df
+        self.etat = etat_de(df)
+        if nouvelles is not None:
+            self.agregats.ajouter(nouvelles)
+            return len(nouvelles)
+        self.agregats = AgregatsTransactions.depuis(df)
+        return len(df)
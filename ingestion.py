@@ -0,0 +1,269 @@
+import glob
+import hashlib
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+import pandas as pd
+
+from depot import obtenir_depot
+from donnees import COLONNE_FEUILLE, COLONNE_SOURCE, empreinte_contenu, lire_transactions
+from incremental import AgregatsTransactions, etat_de, lignes_ajoutees
+
+MAX_PROCESSUS = int(os.environ.get("INGESTION_PROCESSUS", "0")) or os.cpu_count() or 1
+
+# Jeu consolidé -> {clé de fichier: (première ligne, fin)} : un classeur déjà
+# lu est repris du jeu consolidé qui le contient, au lieu d'une seconde copie
+# dans le dépôt. Les lignes sont repérées par position, pas par nom de fichier :
+# deux envois de même nom ne se mélangent pas.
+_compositions = OrderedDict()
+MAX_COMPOSITIONS = 256
+
+# Propriétaire (utilisateur) -> son dernier jeu consolidé et l'état de chaque
+# fichier : un classeur qu'il renvoie avec des lignes ajoutées en bas n'est lu
+# qu'à partir de ces lignes. Jamais partagé entre propriétaires.
+_suivis = {}
+
+# Jeu consolidé -> (jeu précédent du même propriétaire, lignes ajoutées) :
+# ses agrégats sont ceux du précédent, complétés de ces lignes
+_derivations = OrderedDict()
+MAX_DERIVATIONS = 8
+
+# Agrégats des derniers jeux consolidés
+_agregats = OrderedDict()
+MAX_AGREGATS = 32
+
+_verrou = threading.Lock()
+
+_executeur = None
+_verrou_executeur = threading.Lock()
+
+
+def _executeur_processus():
+    # Pool réutilisé d'un chargement à l'autre : le démarrage des processus
+    # (import de pandas) n'est payé qu'une fois. "spawn" évite de forker
+    # le serveur Streamlit et ses threads.
+    global _executeur
+    with _verrou_executeur:
+        if _executeur is None:
+            _executeur = ProcessPoolExecutor(
+                max_workers=MAX_PROCESSUS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _executeur
+
+
+def _lire_contenu(contenu, feuilles, toutes_feuilles=False):
+    return lire_transactions(BytesIO(contenu), feuilles, toutes_feuilles=toutes_feuilles)
+
+
+def _cle_fichier(contenu, feuilles, toutes_feuilles=False, empreinte=None):
+    if toutes_feuilles:
+        suffixe = "|*"
+    else:
+        suffixe = "" if feuilles is None else "|" + "|".join(feuilles)
+    return (empreinte or empreinte_contenu(contenu)) + suffixe
+
+
+def _morceau_connu(cle, depot):
+    """Lignes du classeur `cle` reprises d'un jeu consolidé encore dans le dépôt, ou None."""
+    with _verrou:
+        candidats = [(cle_jeu, plages[cle]) for cle_jeu, plages in reversed(_compositions.items()) if cle in plages]
+    for cle_jeu, (debut, fin) in candidats:
+        jeu = depot.lire(cle_jeu)
+        if jeu is not None:
+            return jeu.iloc[debut:fin].reset_index(drop=True)
+    return None
+
+
+def _suivi_de(cle, df):
+    # Seuls les classeurs à une feuille de transactions sont suivis
+    feuilles = df[COLONNE_FEUILLE].unique()
+    etat = etat_de(df) if len(feuilles) == 1 else None
+    return None if etat is None else (cle, etat, feuilles[0])
+
+
+def _fichiers_et_cles(fichiers, feuilles, toutes_feuilles, empreintes):
+    """`fichiers` triés par nom (ordre d'envoi entre homonymes) et la clé de chacun."""
+    tries = sorted(zip(fichiers, empreintes or [None] * len(fichiers)), key=lambda f: f[0][0])
+    cles = [_cle_fichier(contenu, feuilles, toutes_feuilles, empreinte) for (_, contenu), empreinte in tries]
+    return [fichier for fichier, _ in tries], cles
+
+
+def _cle_jeu(fichiers, cles):
+    h = hashlib.sha256()
+    for (nom, _), cle in zip(fichiers, cles):
+        h.update(nom.encode("utf-8"))
+        h.update(cle.encode("utf-8"))
+    return h.hexdigest()
+
+
+def cle_consolidee(fichiers, feuilles=None, toutes_feuilles=False, empreintes=None):
+    """Clé du jeu consolidé : dépend du nom et du contenu de chaque fichier.
+
+    `empreintes`, liste parallèle à `fichiers` (empreinte_contenu de chacun),
+    évite de rehacher les contenus dont l'appelant connaît déjà l'empreinte.
+    """
+    return _cle_jeu(*_fichiers_et_cles(fichiers, feuilles, toutes_feuilles, empreintes))
+
+
+def charger_fichiers(fichiers, feuilles=None, depot=None, toutes_feuilles=False, proprietaire=None, empreintes=None):
+    """Lit plusieurs classeurs en parallèle et les fusionne en un seul DataFrame.
+
+    `fichiers` est une liste de (nom, contenu). Par défaut seule la feuille
+    FEUILLE de chaque classeur est lue (cf. `lire_transactions`). Le jeu
+    consolidé, gardé dans le dépôt sous `cle_consolidee`, sert aussi de cache
+    par fichier : ajouter un fichier client ne relit que celui-là, sans
+    seconde copie des autres. Les lignes sont marquées de leur fichier source.
+
+    Avec un `proprietaire`, un classeur qu'il avait déjà chargé et qu'il
+    renvoie complété en bas est relu, mais les agrégats du jeu ne sont
+    complétés que de ses nouvelles lignes (cf. `agregats_du_jeu`).
+    `empreintes` : comme pour `cle_consolidee`.
+    """
+    depot = depot or obtenir_depot()
+    fichiers, cles = _fichiers_et_cles(fichiers, feuilles, toutes_feuilles, empreintes)
+    cle_jeu = _cle_jeu(fichiers, cles)
+    noms = [nom for nom, _ in fichiers]
+    precedent = None
+    # Le suivi se fait par nom de fichier : pas avec deux envois homonymes
+    suivi = (proprietaire is not None and feuilles is None and not toutes_feuilles
+             and len(set(noms)) == len(noms))
+    if suivi:
+        with _verrou:
+            precedent = _suivis.get(proprietaire)
+    suivis_precedents = precedent["fichiers"] if precedent else {}
+
+    # Classeurs déjà lus dans un jeu consolidé
+    lus = {}
+    for cle in cles:
+        if cle not in lus:
+            morceau = _morceau_connu(cle, depot)
+            if morceau is not None:
+                lus[cle] = morceau
+
+    # Les autres : lecture en parallèle (un seul : sur place)
+    a_lire = {}
+    for (nom, contenu), cle in zip(fichiers, cles):
+        if cle not in lus and cle not in a_lire:
+            a_lire[cle] = (nom, contenu)
+    if len(a_lire) > 1:
+        executeur = _executeur_processus()
+        futures = {
+            cle: executeur.submit(_lire_contenu, contenu, feuilles, toutes_feuilles)
+            for cle, (_, contenu) in a_lire.items()
+        }
+        for cle, future in futures.items():
+            try:
+                lus[cle] = future.result()
+            except Exception as e:
+                raise ValueError(f"{a_lire[cle][0]} : {e}") from e
+    else:
+        for cle, (nom, contenu) in a_lire.items():
+            try:
+                lus[cle] = _lire_contenu(contenu, feuilles, toutes_feuilles)
+            except Exception as e:
+                raise ValueError(f"{nom} : {e}") from e
+
+    # Classeurs suivis relus : ceux qui n'ont fait que s'allonger en bas
+    nouvelles = {}
+    for cle, (nom, _) in a_lire.items():
+        if nom in suivis_precedents:
+            ajout = lignes_ajoutees(lus[cle], suivis_precedents[nom][1])
+            if ajout is not None:
+                nouvelles[cle] = ajout
+
+    morceaux = [lus[cle].assign(**{COLONNE_SOURCE: nom}) for (nom, _), cle in zip(fichiers, cles)]
+    plages = {}
+    debut = 0
+    for morceau, cle in zip(morceaux, cles):
+        plages.setdefault(cle, (debut, debut + len(morceau)))
+        debut += len(morceau)
+
+    with _verrou:
+        _compositions[cle_jeu] = plages
+        _compositions.move_to_end(cle_jeu)
+        while len(_compositions) > MAX_COMPOSITIONS:
+            _compositions.popitem(last=False)
+
+    if suivi:
+        _suivre(proprietaire, precedent, cle_jeu, fichiers, cles, lus, nouvelles)
+
+    if len(morceaux) == 1:
+        return morceaux[0]
+    return pd.concat(morceaux, ignore_index=True)
+
+
+def _suivre(proprietaire, precedent, cle_jeu, fichiers, cles, lus, nouvelles):
+    """Retient l'état des fichiers du propriétaire et, si le nouveau jeu ne fait
+    qu'ajouter des lignes ou des fichiers au précédent, ces ajouts."""
+    suivis_precedents = precedent["fichiers"] if precedent else {}
+    suivis = {}
+    ajouts = []
+    derivable = precedent is not None and set(suivis_precedents) <= {nom for nom, _ in fichiers}
+    for (nom, _), cle in zip(fichiers, cles):
+        avant = suivis_precedents.get(nom)
+        if avant is not None and avant[0] == cle:
+            suivis[nom] = avant
+            continue
+        suivi = _suivi_de(cle, lus[cle])
+        if suivi is not None:
+            suivis[nom] = suivi
+        if avant is None:
+            ajouts.append(lus[cle].assign(**{COLONNE_SOURCE: nom}))
+        elif cle in nouvelles:
+            ajouts.append(nouvelles[cle].assign(**{COLONNE_SOURCE: nom}))
+        else:
+            derivable = False
+
+    with _verrou:
+        _suivis[proprietaire] = {"cle": cle_jeu, "fichiers": suivis}
+        if derivable and ajouts and cle_jeu != precedent["cle"]:
+            _derivations[cle_jeu] = (precedent["cle"], pd.concat(ajouts, ignore_index=True))
+            while len(_derivations) > MAX_DERIVATIONS:
+                _derivations.popitem(last=False)
+
+
+def agregats_du_jeu(cle_jeu, df):
+    """Agrégats du jeu consolidé `cle_jeu` (`df`), gardés pour les derniers jeux.
+
+    Si ce jeu ne fait qu'ajouter des lignes au jeu précédent du même
+    propriétaire, les agrégats de celui-ci sont complétés de ces lignes
+    (`AgregatsTransactions.ajouter`) au lieu d'être recalculés.
+    """
+    with _verrou:
+        agregats = _agregats.get(cle_jeu)
+        if agregats is not None:
+            _agregats.move_to_end(cle_jeu)
+            return agregats
+        cle_precedente, ajout = _derivations.pop(cle_jeu, (None, None))
+        precedents = _agregats.get(cle_precedente)
+    if precedents is not None:
+        agregats = precedents.copie()
+        agregats.ajouter(ajout)
+    else:
+        agregats = AgregatsTransactions.depuis(df)
+    with _verrou:
+        _agregats[cle_jeu] = agregats
+        while len(_agregats) > MAX_AGREGATS:
+            _agregats.popitem(last=False)
+    return agregats
+
+
+def fichiers_du_dossier(dossier, motif="*.xls*"):
+    """(nom, contenu) des classeurs d'un dossier, fichiers verrous Excel exclus."""
+    fichiers = []
+    for chemin in sorted(glob.glob(os.path.join(dossier, motif))):
+        nom = os.path.basename(chemin)
+        if nom.startswith("~$"):
+            continue
+        with open(chemin, "rb") as f:
+            fichiers.append((nom, f.read()))
+    return fichiers
+
+
+def charger_dossier(dossier, feuilles=None, depot=None, toutes_feuilles=False):
+    return charger_fichiers(fichiers_du_dossier(dossier), feuilles, depot, toutes_feuilles)
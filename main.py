@@ -1,41 +1,307 @@
-from fastapi import FastAPI
-from fastapi.responses import ORJSONResponse
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import PlainTextResponse
 import pandas as pd
 import numpy as np
+import asyncio
+import gzip
+import hashlib
+import logging
+import orjson
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from base_transactions import obtenir_base
+from donnees import COLONNES_UTILES, filtrer_transactions
+from incremental import IngestionIncrementale
+from mesures import enregistrer, etape, exposition_prometheus
+
+try:
+    import brotli
+except ImportError:  # brotli est optionnel : sans lui, les réponses sont en gzip
+    brotli = None
 
 app = FastAPI()
+logger = logging.getLogger(__name__)
 
-@app.get("/")
-def read_root():
-    return {"message": "API is running"}
+FICHIER = "fichier_client.xlsx"
+# Lecture Excel et sérialisation bloquent : elles tournent dans un pool borné,
+# et au-delà de API_FILE_MAX requêtes en attente l'API répond 503
+API_THREADS = int(os.environ.get("API_THREADS", "4"))
+API_FILE_MAX = int(os.environ.get("API_FILE_MAX", "64"))
+# Réponses sérialisées et compressées gardées en mémoire, par route et version des données
+API_CACHE_REPONSES = int(os.environ.get("API_CACHE_REPONSES", "32"))
+TAILLE_MIN_COMPRESSION = 1024
 
-@app.get("/data", response_class=ORJSONResponse)
-def read_excel_data():
-    try:
-        df = pd.read_excel("fichier_client.xlsx", sheet_name="Données socio-démographiques")
+# Le classeur est un registre : seules les lignes ajoutées depuis la
+# dernière lecture sont relues, et les agrégats mis à jour en place
+_ingestion = IngestionIncrementale()
+_signature = None
+_verrou = threading.Lock()
 
-        # Supprimer colonnes "Unnamed"
-        df = df.loc[:, ~df.columns.str.contains('^Unnamed')]
-        df.columns = df.columns.str.strip()
+_executeur = ThreadPoolExecutor(max_workers=API_THREADS, thread_name_prefix="api")
+_en_vol = {}
+# Calculs soumis au pool mais pas encore démarrés (la file), et calculs en cours
+_en_attente = 0
+_en_cours = 0
+_verrou_file = threading.Lock()
+_reponses = OrderedDict()
 
-        colonnes_utiles = [
-            "Nom du client", "Nom du fournisseur", "Âge", "Sexe", "Provenance",
-            "Catégorie socio-professionnelle", "Montant reçu", "Date 1",
-            "Montant payé", "Date 2"
-        ]
-        df = df[[col for col in colonnes_utiles if col in df.columns]]
 
-        # Nettoyer inf / -inf -> None
-        df.replace([np.inf, -np.inf], np.nan, inplace=True)
-        df = df.where(pd.notnull(df), None)
+def donnees_a_jour():
+    global _signature
+    with _verrou:
+        stat = os.stat(FICHIER)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if signature != _signature:
+            with etape("api_ingestion"):
+                _ingestion.rafraichir(FICHIER)
+            _signature = signature
+        return _ingestion.df, _ingestion.agregats
 
-        # Convertir les datetime en string (orjson gère ça mais c'est plus propre)
-        for col in df.columns:
-            if pd.api.types.is_datetime64_any_dtype(df[col]):
-                df[col] = df[col].dt.strftime("%d/%m/%Y")
 
-        data = df.to_dict(orient="records")
-        return data
+def version_donnees():
+    """Identifiant de la version des données servies : change à chaque import
+    dans la base, ou à chaque modification du classeur."""
+    base = obtenir_base()
+    if base is not None:
+        return f"base-{base.version()}"
+    stat = os.stat(FICHIER)
+    return f"fichier-{stat.st_mtime_ns}-{stat.st_size}"
+
+
+def _executer(fonction, *args):
+    # Dans un thread du pool : le calcul quitte la file et passe en cours
+    global _en_attente, _en_cours
+    with _verrou_file:
+        _en_attente -= 1
+        _en_cours += 1
+    try:
+        return fonction(*args)
+    finally:
+        with _verrou_file:
+            _en_cours -= 1
 
+
+async def en_vol_unique(cle, fonction, *args):
+    """Exécute `fonction(*args)` dans le pool ; les appels simultanés de même
+    `cle` attendent le même résultat au lieu de relancer le calcul."""
+    global _en_attente
+    future = _en_vol.get(cle)
+    if future is None:
+        with _verrou_file:
+            if _en_attente >= API_FILE_MAX:
+                raise HTTPException(status_code=503, detail="Serveur saturé", headers={"Retry-After": "1"})
+            _en_attente += 1
+        future = asyncio.get_running_loop().run_in_executor(_executeur, _executer, fonction, *args)
+        _en_vol[cle] = future
+
+        def terminer(f):
+            if _en_vol.get(cle) is f:
+                del _en_vol[cle]
+        future.add_done_callback(terminer)
+
+    try:
+        # shield : un client qui se déconnecte n'annule pas le calcul partagé
+        return await asyncio.shield(future)
+    except HTTPException:
+        raise
+    except (FileNotFoundError, PermissionError) as e:
+        raise HTTPException(status_code=503, detail=f"Source de données indisponible : {e}")
     except Exception as e:
-        return {"error": str(e)}
+        logger.exception("Erreur pendant %s", cle)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# ----------------------- RÉPONSES -----------------------
+def _encodage_accepte(accept_encoding):
+    acceptes = set()
+    for element in (accept_encoding or "").lower().split(","):
+        nom, _, parametres = element.strip().partition(";")
+        if parametres.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            acceptes.add(nom.strip())
+    if brotli is not None and "br" in acceptes:
+        return "br"
+    if "gzip" in acceptes:
+        return "gzip"
+    return None
+
+
+def _corps(fonction, args):
+    """Sérialise une seule fois, puis compresse chaque encodage à la demande."""
+    with etape("api_donnees"):
+        donnees = fonction(*args)
+    with etape("api_serialisation"):
+        corps = orjson.dumps(donnees)
+    variantes = {None: corps}
+    if len(corps) >= TAILLE_MIN_COMPRESSION:
+        with etape("api_compression"):
+            variantes["gzip"] = gzip.compress(corps, compresslevel=6)
+            if brotli is not None:
+                variantes["br"] = brotli.compress(corps, quality=5)
+    return variantes
+
+
+def _etag(cle, version, encodage=None):
+    # Une ETag forte par représentation : "<empreinte>", "<empreinte>-gzip", "<empreinte>-br"
+    empreinte = hashlib.sha256(repr((cle, version)).encode("utf-8")).hexdigest()[:32]
+    return f'"{empreinte}-{encodage}"' if encodage else f'"{empreinte}"'
+
+
+def _base_etag(valeur):
+    # W/"<empreinte>-br" -> <empreinte> (les proxys qui recompressent suffixent l'ETag ou la rendent faible)
+    return valeur.strip().removeprefix("W/").strip('"').split("-", 1)[0]
+
+
+def _correspond(if_none_match, etag):
+    """ETag présentée par le client pour la même version que `etag`, sinon None."""
+    if not if_none_match:
+        return None
+    for valeur in if_none_match.split(","):
+        if valeur.strip() == "*":
+            return etag
+        if _base_etag(valeur) == _base_etag(etag):
+            return valeur.strip().removeprefix("W/")
+    return None
+
+
+async def reponse_json(request, cle, fonction, *args):
+    """Réponse JSON avec ETag forte dérivée de la version des données.
+
+    Chaque encodage a sa propre ETag ; le client qui présente l'une de
+    celles de la version courante (If-None-Match) reçoit un 304 sans corps,
+    sans lecture ni sérialisation. Sinon le corps sérialisé et compressé est
+    réutilisé tant que les données ne changent pas.
+    """
+    try:
+        version = version_donnees()
+    except OSError as e:
+        raise HTTPException(status_code=503, detail=f"Source de données indisponible : {e}")
+    en_tetes = {"Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    # Le 304 reprend l'ETag de la représentation que le client a en cache
+    etag_client = _correspond(request.headers.get("if-none-match"), _etag(cle, version))
+    if etag_client is not None:
+        return Response(status_code=304, headers={"ETag": etag_client, **en_tetes})
+
+    variantes = _reponses.get((cle, version))
+    if variantes is None:
+        variantes = await en_vol_unique((cle, version), _corps, fonction, args)
+        _reponses[(cle, version)] = variantes
+        while len(_reponses) > API_CACHE_REPONSES:
+            _reponses.popitem(last=False)
+    else:
+        _reponses.move_to_end((cle, version))
+
+    encodage = _encodage_accepte(request.headers.get("accept-encoding"))
+    if encodage not in variantes:
+        encodage = None
+    if encodage is not None:
+        en_tetes["Content-Encoding"] = encodage
+    en_tetes["ETag"] = _etag(cle, version, encodage)
+    return Response(variantes[encodage], media_type="application/json", headers=en_tetes)
+
+
+def _verifier_mois(mois):
+    for m in mois or []:
+        if not re.fullmatch(r"\d{4}-(0[1-9]|1[0-2])", m):
+            raise HTTPException(status_code=422, detail=f"Mois invalide : {m!r} (attendu AAAA-MM)")
+
+
+def _enregistrements(df):
+    # Nettoyer inf / -inf -> None
+    df = df.replace([np.inf, -np.inf], np.nan)
+    df = df.where(pd.notnull(df), None)
+
+    # Convertir les datetime en string (orjson gère ça mais c'est plus propre)
+    for col in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = df[col].dt.strftime("%d/%m/%Y")
+
+    return df.to_dict(orient="records")
+
+
+def _transactions(client=None, fournisseur=None, mois=None):
+    # Base de transactions (TRANSACTIONS_DB) : filtres résolus par index
+    base = obtenir_base()
+    if base is not None:
+        df = base.transactions(client, fournisseur, mois)
+    else:
+        df, _ = donnees_a_jour()
+        df = filtrer_transactions(df, client, fournisseur, mois)
+    return df[[col for col in COLONNES_UTILES if col in df.columns]]
+
+
+def _donnees(client, fournisseur, mois):
+    return _enregistrements(_transactions(client, fournisseur, mois))
+
+
+def _apercu():
+    return {"preview": _enregistrements(_transactions().head())}
+
+
+def _agregats():
+    base = obtenir_base()
+    if base is not None:
+        mensuel, regions = base.totaux_mensuels(), base.totaux_regions()
+    else:
+        _, agregats = donnees_a_jour()
+        mensuel, regions = agregats.mensuel.copy(), agregats.regions
+    # Aucune transaction datée : pas de mois à formater
+    if not mensuel.empty:
+        mensuel.index = mensuel.index.strftime("%m/%Y")
+    return {
+        "mensuel": mensuel.reset_index().to_dict(orient="records") if not mensuel.empty else [],
+        "regions": regions.reset_index().to_dict(orient="records"),
+    }
+
+
+@app.middleware("http")
+async def mesurer_requete(request: Request, call_next):
+    debut = time.perf_counter()
+    try:
+        return await call_next(request)
+    finally:
+        # Gabarit de la route (pas l'URL brute) : une série par route
+        route = request.scope.get("route")
+        enregistrer(f"http {request.method} {route.path if route else 'autre'}", time.perf_counter() - debut)
+
+
+@app.get("/")
+async def read_root():
+    return {"message": "API is running"}
+
+@app.get("/data")
+async def read_excel_data(
+    request: Request,
+    client: list[str] | None = Query(None),
+    fournisseur: list[str] | None = Query(None),
+    mois: list[str] | None = Query(None, description="AAAA-MM")
+):
+    _verifier_mois(mois)
+    cle = ("data", tuple(client or ()), tuple(fournisseur or ()), tuple(mois or ()))
+    return await reponse_json(request, cle, _donnees, client, fournisseur, mois)
+
+@app.get("/apercu")
+async def read_apercu(request: Request):
+    # Ex-server.py : les cinq premières lignes
+    return await reponse_json(request, ("apercu",), _apercu)
+
+@app.get("/agregats")
+async def read_agregats(request: Request):
+    return await reponse_json(request, ("agregats",), _agregats)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def read_metrics():
+    # Format texte Prometheus : durées des étapes et requêtes, mémoire, file d'attente et calculs en cours
+    return PlainTextResponse(
+        exposition_prometheus()
+        + "# HELP suivi_api_en_attente Calculs en attente d'un thread du pool.\n"
+        + "# TYPE suivi_api_en_attente gauge\n"
+        + f"suivi_api_en_attente {_en_attente}\n"
+        + "# HELP suivi_api_en_cours Calculs en cours dans le pool.\n"
+        + "# TYPE suivi_api_en_cours gauge\n"
+        + f"suivi_api_en_cours {_en_cours}\n",
+        media_type="text/plain; version=0.0.4"
+    )
@@ -0,0 +1,156 @@
+"""Mesure des étapes coûteuses : durées par rerun, cumuls du processus, export OpenTelemetry.
+
+    with etape("lecture_excel"):
+        df = lire_transactions(...)
+
+Chaque étape est ajoutée à la collecte du thread courant (un rerun
+Streamlit, cf. `demarrer_collecte`) et aux cumuls du processus exposés au
+format Prometheus. Si OTEL_EXPORTER_OTLP_ENDPOINT est défini et que le SDK
+OpenTelemetry est installé, elle devient aussi un span exporté en OTLP.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Bornes (s) des histogrammes Prometheus
+BORNES = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_local = threading.local()
+_verrou = threading.Lock()
+# etape -> [compteurs par borne (+ dépassement), somme, nombre]
+_cumuls = {}
+_traceur = None
+
+
+def configurer_opentelemetry(nom_service="suivi-transactions"):
+    """Exporte les étapes en spans OTLP (collecteur local, OTEL_EXPORTER_OTLP_ENDPOINT).
+
+    Sans le SDK OpenTelemetry et son exporteur OTLP, ne fait rien.
+    """
+    global _traceur
+    try:
+        from opentelemetry import trace
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    except ImportError:
+        return False
+    fournisseur = TracerProvider(resource=Resource.create({"service.name": nom_service}))
+    fournisseur.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    trace.set_tracer_provider(fournisseur)
+    _traceur = trace.get_tracer(__name__)
+    return True
+
+
+if os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT"):
+    configurer_opentelemetry(os.environ.get("OTEL_SERVICE_NAME", "suivi-transactions"))
+
+
+# ----------------------- ÉTAPES -----------------------
+def enregistrer(nom, duree):
+    """Ajoute une durée (s) aux cumuls du processus et à la collecte en cours."""
+    with _verrou:
+        cumul = _cumuls.get(nom)
+        if cumul is None:
+            cumul = _cumuls[nom] = [[0] * (len(BORNES) + 1), 0.0, 0]
+        i = 0
+        while i < len(BORNES) and duree > BORNES[i]:
+            i += 1
+        cumul[0][i] += 1
+        cumul[1] += duree
+        cumul[2] += 1
+    collecte = getattr(_local, "collecte", None)
+    if collecte is not None:
+        collecte.append((nom, duree, getattr(_local, "profondeur", 0)))
+
+
+@contextmanager
+def etape(nom, **attributs):
+    """Chronomètre le bloc (utilisable aussi en décorateur)."""
+    profondeur = getattr(_local, "profondeur", 0)
+    _local.profondeur = profondeur + 1
+    debut = time.perf_counter()
+    try:
+        if _traceur is not None:
+            with _traceur.start_as_current_span(nom, attributes=attributs):
+                yield
+        else:
+            yield
+    finally:
+        _local.profondeur = profondeur
+        enregistrer(nom, time.perf_counter() - debut)
+
+
+def demarrer_collecte():
+    """Démarre la liste des étapes du thread courant (une par rerun) et la renvoie."""
+    _local.collecte = []
+    _local.profondeur = 0
+    return _local.collecte
+
+
+def collecte_courante():
+    """Étapes (nom, durée, profondeur) du rerun en cours, dans l'ordre de fin."""
+    return list(getattr(_local, "collecte", None) or [])
+
+
+# ----------------------- MÉMOIRE -----------------------
+def memoire_processus():
+    """(RSS courante, pic de RSS) en octets ; None si non disponible."""
+    courante = None
+    try:
+        with open("/proc/self/statm") as f:
+            courante = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    pic = None
+    if resource is not None:
+        # ru_maxrss : Ko sous Linux
+        pic = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return courante, pic
+
+
+# ----------------------- PROMETHEUS -----------------------
+def _echapper(valeur):
+    return str(valeur).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def exposition_prometheus(prefixe="suivi"):
+    """Cumuls du processus au format texte Prometheus (version 0.0.4)."""
+    with _verrou:
+        cumuls = {nom: ([*c[0]], c[1], c[2]) for nom, c in _cumuls.items()}
+    lignes = [
+        f"# HELP {prefixe}_etape_duree_secondes Durée des étapes mesurées.",
+        f"# TYPE {prefixe}_etape_duree_secondes histogram",
+    ]
+    for nom in sorted(cumuls):
+        compteurs, somme, nombre = cumuls[nom]
+        etiquette = f'etape="{_echapper(nom)}"'
+        cumul = 0
+        for borne, compte in zip(BORNES, compteurs):
+            cumul += compte
+            lignes.append(f'{prefixe}_etape_duree_secondes_bucket{{{etiquette},le="{borne}"}} {cumul}')
+        lignes.append(f'{prefixe}_etape_duree_secondes_bucket{{{etiquette},le="+Inf"}} {nombre}')
+        lignes.append(f"{prefixe}_etape_duree_secondes_sum{{{etiquette}}} {somme}")
+        lignes.append(f"{prefixe}_etape_duree_secondes_count{{{etiquette}}} {nombre}")
+
+    courante, pic = memoire_processus()
+    if courante is not None:
+        lignes += [
+            f"# HELP {prefixe}_memoire_rss_octets Mémoire résidente du processus.",
+            f"# TYPE {prefixe}_memoire_rss_octets gauge",
+            f"{prefixe}_memoire_rss_octets {courante}",
+        ]
+    if pic is not None:
+        lignes += [
+            f"# HELP {prefixe}_memoire_rss_max_octets Pic de mémoire résidente du processus.",
+            f"# TYPE {prefixe}_memoire_rss_max_octets gauge",
+            f"{prefixe}_memoire_rss_max_octets {pic}",
+        ]
+    return "\n".join(lignes) + "\n"
@@ -0,0 +1,412 @@
+"""Rapports PDF des pages de l'application, renvoyés en bytes."""
+import os
+import tempfile
+from html import escape
+import unicodedata
+from datetime import datetime
+from io import BytesIO
+
+import fpdf
+import pandas as pd
+from fpdf import FPDF
+
+
+def pdf_en_octets(pdf):
+    # fpdf 1.7 renvoie une chaîne latin-1, fpdf2 un bytearray
+    sortie = pdf.output(dest="S")
+    return sortie.encode("latin-1") if isinstance(sortie, str) else bytes(sortie)
+
+
+def image_png(pdf, png, largeur):
+    """Insère une image PNG (bytes) à la position courante, sur `largeur` mm."""
+    if not fpdf.FPDF_VERSION.startswith("1."):
+        pdf.image(BytesIO(png), w=largeur)
+        return
+    # fpdf 1.7 ne lit les images que depuis un fichier
+    with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as f:
+        f.write(png)
+    try:
+        pdf.image(f.name, w=largeur)
+    finally:
+        os.unlink(f.name)
+
+
+def latin1(texte):
+    return texte.encode('latin-1', 'replace').decode('latin-1')
+
+
+def normalize_str(s):
+    if not isinstance(s, str):
+        return ""
+    s = s.replace('\xa0', ' ')
+    s = s.strip().lower()
+    s = unicodedata.normalize('NFD', s)
+    s = ''.join(c for c in s if unicodedata.category(c) != 'Mn')
+    return s
+
+
+# Colonnes du classeur -> colonnes de la page Carte des clients (et de rapport_region)
+COLONNES_CARTE = {
+    "Nom du client": "nom",
+    "Provenance": "region",
+    "Montant reçu": "montant",
+    "Nom du fournisseur": "nom_fournisseur",
+    "Montant payé": "montant_paye",
+    "Sexe": "sexe",
+    "Âge": "age",
+    "Catégorie socio-professionnelle": "csp",
+}
+
+
+def safe_val(v):
+    if pd.isna(v):
+        return "Non renseigné"
+    return str(v).strip() if str(v).strip() else "Non renseigné"
+
+
+# ----------------------- TABLEAUX -----------------------
+def colonne_texte(serie, nb_caracteres, defaut="Non renseigné"):
+    """Textes d'une colonne tronqués à `nb_caracteres`, comme `safe_val` mais en une opération par colonne."""
+    textes = serie.astype("string").str.strip().str.slice(0, nb_caracteres)
+    return textes.fillna("").replace("", defaut)
+
+
+def colonne_montant(serie, defaut="-"):
+    montants = pd.to_numeric(serie, errors="coerce")
+    return montants.map("{:.2f}".format).mask(montants.isna(), defaut)
+
+
+def colonne_latin1(textes):
+    # Une conversion latin-1 par colonne plutôt qu'une par cellule
+    return textes.str.encode("latin-1", "replace").str.decode("latin-1").tolist()
+
+
+def tableau_fpdf(pdf, entetes, largeurs, colonnes, alignements, hauteur=6, taille=9):
+    """Tableau FPDF ; l'en-tête est répété à chaque saut de page.
+
+    `colonnes` : une liste de textes latin-1 par colonne (cf. `colonne_latin1`).
+    """
+    def en_tete():
+        pdf.set_font("Arial", "B", taille)
+        pdf.set_fill_color(220, 220, 220)
+        for titre, largeur in zip(entetes, largeurs):
+            pdf.cell(largeur, hauteur + 1, latin1(titre), border=1, align="C", fill=True)
+        pdf.ln()
+        pdf.set_font("Arial", "", taille)
+        pdf.set_fill_color(245, 245, 245)
+
+    en_tete()
+    for i, ligne in enumerate(zip(*colonnes)):
+        if pdf.get_y() + hauteur > pdf.page_break_trigger:
+            pdf.add_page()
+            en_tete()
+        fond = i % 2 == 1
+        for texte, largeur, alignement in zip(ligne, largeurs, alignements):
+            pdf.cell(largeur, hauteur, texte, border=1, align=alignement, fill=fond)
+        pdf.ln()
+
+
+def tableau_reportlab(entetes, largeurs, colonnes, a_droite=(), taille=7):
+    """LongTable reportlab (textes bruts, sans balisage) ; l'en-tête est répété à chaque page."""
+    from reportlab.lib import colors
+    from reportlab.platypus import LongTable, TableStyle
+
+    lignes = [entetes, *zip(*colonnes)]
+    style = [
+        ("FONT", (0, 0), (-1, 0), "Helvetica-Bold", taille),
+        ("FONT", (0, 1), (-1, -1), "Helvetica", taille),
+        ("GRID", (0, 0), (-1, -1), 0.25, colors.grey),
+        ("BACKGROUND", (0, 0), (-1, 0), colors.lightgrey),
+        ("ROWBACKGROUNDS", (0, 1), (-1, -1), [colors.white, colors.whitesmoke]),
+        ("TOPPADDING", (0, 0), (-1, -1), 1),
+        ("BOTTOMPADDING", (0, 0), (-1, -1), 2),
+    ]
+    style += [("ALIGN", (i, 1), (i, -1), "RIGHT") for i in a_droite]
+    # Hauteurs fixées : reportlab n'a pas à mesurer chaque cellule
+    return LongTable(lignes, colWidths=largeurs, rowHeights=taille + 4, repeatRows=1, style=TableStyle(style))
+
+
+INFORMATIONS_CLIENT = ["Sexe", "Âge", "Provenance", "Catégorie socio-professionnelle"]
+
+
+def synthese_entites(df, colonne, montant, date, selection, informations=()):
+    """Par entité de `selection` (dans cet ordre) : total, nombre, moyenne, dernière transaction et `informations`."""
+    lignes = df[df[colonne].isin(selection)]
+    groupes = lignes.groupby(colonne)
+    synthese = groupes[montant].agg(["sum", "count", "mean"])
+    # Dernière transaction : la première ligne à la date maximale, comme idxmax
+    dernieres = (
+        lignes.dropna(subset=[date]).sort_values(date, ascending=False, kind="stable")
+        .drop_duplicates(colonne).set_index(colonne)[[date, montant]]
+        .rename(columns={date: "derniere_date", montant: "dernier_montant"})
+    )
+    synthese = synthese.join(dernieres)
+    if informations:
+        synthese = synthese.join(groupes[list(informations)].first())
+    synthese = synthese.reindex(pd.Index(selection, name=colonne))
+    synthese[["sum", "count", "mean"]] = synthese[["sum", "count", "mean"]].fillna(0)
+    return synthese
+
+
+# ----------------------- ACCUEIL -----------------------
+def rapport_periode(periode_label, df_recu, df_paye, commentaire_client, nb_clients, nb_fournisseurs, montant_recu_total, montant_paye_total, solde, graphique=None):
+    """`graphique` : PNG de l'évolution mensuelle déjà rendu pour la page, inséré tel quel."""
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_font("Arial", "B", 16)
+    pdf.cell(0, 10, f"Rapport - {periode_label}", ln=True)
+    pdf.set_font("Arial", "", 12)
+    date_rapport = datetime.today().strftime("%d/%m/%Y")
+    pdf.cell(0, 10, f"Date du rapport : {date_rapport}", ln=True)
+    pdf.ln(10)
+
+    # Résumé des chiffres clés
+    pdf.cell(0, 10, f"Montant reçu total : {montant_recu_total:.2f} EUR", ln=True)
+    pdf.cell(0, 10, f"Montant payé total : {montant_paye_total:.2f} EUR", ln=True)
+    pdf.cell(0, 10, f"Solde : {solde:.2f} EUR", ln=True)
+    pdf.cell(0, 10, f"Nombre de clients : {nb_clients}", ln=True)
+    pdf.cell(0, 10, f"Nombre de fournisseurs : {nb_fournisseurs}", ln=True)
+    pdf.ln(10)
+
+    if graphique:
+        image_png(pdf, graphique, 170)
+        pdf.ln(5)
+
+    # Commentaire utilisateur
+    pdf.set_font("Arial", "I", 12)
+    pdf.multi_cell(0, 10, f"Commentaires :\n{commentaire_client if commentaire_client else 'Aucun commentaire'}")
+    pdf.ln(10)
+
+    # Table Montant reçu par client
+    pdf.set_font("Arial", "B", 14)
+    pdf.cell(0, 10, "Montants reçus par client", ln=True)
+    pdf.set_font("Arial", "", 12)
+    df_recu_group = df_recu.groupby("Nom du client")["Montant reçu"].sum().reset_index()
+    for _, row in df_recu_group.iterrows():
+        pdf.cell(0, 10, f"{row['Nom du client']}: {row['Montant reçu']:.2f} EUR", ln=True)
+    pdf.ln(10)
+
+    # Table Montant payé par fournisseur
+    pdf.set_font("Arial", "B", 14)
+    pdf.cell(0, 10, "Montants payés par fournisseur", ln=True)
+    pdf.set_font("Arial", "", 12)
+    df_paye_group = df_paye.groupby("Nom du fournisseur")["Montant payé"].sum().reset_index()
+    for _, row in df_paye_group.iterrows():
+        pdf.cell(0, 10, f"{row['Nom du fournisseur']}: {row['Montant payé']:.2f} EUR", ln=True)
+    pdf.ln(10)
+
+    return pdf_en_octets(pdf)
+
+
+# ----------------------- FILTRER PAR CLIENT/FOURNISSEUR -----------------------
+def rapport_selection(df, clients_selection, fournisseurs_selection, montant_recu_total, montant_paye_total, solde, commentaire_client, syntheses=None):
+    """`syntheses` : {"clients": ..., "fournisseurs": ...}, lignes de `synthese_entites`
+    déjà calculées pour la sélection ; `df` ne sert alors qu'aux autres."""
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet
+
+    syntheses = syntheses or {}
+
+    buffer = BytesIO()
+    # Marges de 0,5 pouce : les tableaux occupent 523 pt de large
+    doc = SimpleDocTemplate(buffer, pagesize=A4, leftMargin=36, rightMargin=36, topMargin=36, bottomMargin=36)
+    styles = getSampleStyleSheet()
+    elements = []
+
+    elements.append(Paragraph("Rapport des Transactions - Clients et Fournisseurs", styles["Title"]))
+    elements.append(Spacer(1, 12))
+
+    # AJOUT DES 3 VARIABLES CLÉS EN HAUT DU PDF
+    elements.append(Paragraph(f"Montant reçu total : {montant_recu_total:.2f} €", styles["Heading3"]))
+    elements.append(Paragraph(f"Montant payé total : {montant_paye_total:.2f} €", styles["Heading3"]))
+    elements.append(Paragraph(f"Solde : {solde:.2f} €", styles["Heading3"]))
+    elements.append(Spacer(1, 12))
+
+    def nb_car(largeur):
+        # Helvetica corps 7 : ~3,8 pt par caractère
+        return int(largeur / 3.8)
+
+    def derniere(synthese):
+        textes = synthese["derniere_date"].dt.strftime("%d/%m/%Y") + " : " + colonne_montant(synthese["dernier_montant"]) + " €"
+        return textes.mask(synthese["count"] == 0).fillna("N/A").tolist()
+
+    # Infos Clients
+    if clients_selection:
+        synthese = syntheses.get("clients")
+        if synthese is None:
+            synthese = synthese_entites(
+                df, "Nom du client", "Montant reçu", "Date 1", clients_selection,
+                INFORMATIONS_CLIENT
+            )
+        largeurs = [95, 30, 25, 65, 75, 50, 28, 50, 105]
+        elements.append(Paragraph("Clients", styles["Heading2"]))
+        elements.append(tableau_reportlab(
+            ["Client", "Sexe", "Âge", "Provenance", "CSP", "Total reçu (€)", "Trans.", "Moyenne (€)", "Dernière transaction"],
+            largeurs,
+            [
+                colonne_texte(synthese.index.to_series(), nb_car(largeurs[0])).tolist(),
+                *(colonne_texte(synthese[col], nb_car(largeur), "N/A").tolist() for col, largeur in zip(
+                    INFORMATIONS_CLIENT, largeurs[1:5])),
+                colonne_montant(synthese["sum"]).tolist(),
+                synthese["count"].astype(int).astype(str).tolist(),
+                colonne_montant(synthese["mean"]).tolist(),
+                derniere(synthese),
+            ],
+            a_droite=(5, 6, 7),
+        ))
+        elements.append(Spacer(1, 12))
+
+    # Infos Fournisseurs
+    if fournisseurs_selection:
+        synthese = syntheses.get("fournisseurs")
+        if synthese is None:
+            synthese = synthese_entites(df, "Nom du fournisseur", "Montant payé", "Date 2", fournisseurs_selection)
+        largeurs = [180, 80, 50, 80, 133]
+        elements.append(Paragraph("Fournisseurs", styles["Heading2"]))
+        elements.append(tableau_reportlab(
+            ["Fournisseur", "Total payé (€)", "Trans.", "Moyenne (€)", "Dernière transaction"],
+            largeurs,
+            [
+                colonne_texte(synthese.index.to_series(), nb_car(largeurs[0])).tolist(),
+                colonne_montant(synthese["sum"]).tolist(),
+                synthese["count"].astype(int).astype(str).tolist(),
+                colonne_montant(synthese["mean"]).tolist(),
+                derniere(synthese),
+            ],
+            a_droite=(1, 2, 3),
+        ))
+        elements.append(Spacer(1, 12))
+
+    # Ajout du commentaire utilisateur s'il existe
+    if commentaire_client.strip():
+        elements.append(Paragraph("Commentaire de l'utilisateur :", styles["Heading2"]))
+        elements.append(Paragraph(escape(commentaire_client.strip()), styles["Normal"]))
+        elements.append(Spacer(1, 12))
+
+    doc.build(elements)
+    return buffer.getvalue()
+
+
+# ----------------------- CARTE DES CLIENTS -----------------------
+def rapport_region(region, filtered_clients, montant_recu_total, montant_paye_total, solde, nb_clients, nb_fournisseurs, commentaire_client):
+    """`filtered_clients` : lignes de la région, aux colonnes renommées de la page Carte."""
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_font("Arial", "B", 14)
+    # Titre + variables clés
+    pdf.cell(0, 10, latin1(f"Clients de la région : {region}"), ln=True)
+    pdf.ln(5)
+    pdf.set_font("Arial", "", 12)
+    pdf.cell(0, 8, f"Montant reçu total : {montant_recu_total:.2f} EUR", ln=True)
+    pdf.cell(0, 8, f"Montant payé total : {montant_paye_total:.2f} EUR", ln=True)
+    pdf.cell(0, 8, f"Solde : {solde:.2f} EUR", ln=True)
+    pdf.cell(0, 8, f"Nombre de clients : {nb_clients}", ln=True)
+    pdf.cell(0, 8, f"Nombre de fournisseurs : {nb_fournisseurs}", ln=True)
+    pdf.ln(5)
+
+    # Colonne -> largeur (mm) ; en corps 9, un caractère fait ~1,6 mm
+    largeurs = {"nom": 45, "region": 35, "montant": 30, "sexe": 18, "age": 14, "csp": 48}
+    cellules = []
+    for col, largeur in largeurs.items():
+        serie = filtered_clients[col] if col in filtered_clients.columns else pd.Series(pd.NA, index=filtered_clients.index)
+        textes = colonne_montant(serie) if col == "montant" else colonne_texte(serie, int(largeur / 1.6), "-")
+        cellules.append(colonne_latin1(textes))
+    tableau_fpdf(
+        pdf, ["Nom", "Région", "Montant reçu (EUR)", "Sexe", "Âge", "CSP"], list(largeurs.values()),
+        cellules, ["L", "L", "R", "L", "L", "L"]
+    )
+
+    if commentaire_client.strip():
+        pdf.ln(10)
+        pdf.set_font("Arial", "B", 14)
+        pdf.cell(0, 10, latin1("Commentaire de l'utilisateur :"), ln=True)
+        pdf.set_font("Arial", "", 12)
+        for ligne in commentaire_client.strip().split('\n'):
+            pdf.cell(0, 8, latin1(ligne), ln=True)
+
+    return pdf_en_octets(pdf)
+
+
+# ----------------------- VEILLE CONCURRENTIELLE -----------------------
+def rapport_veille(entreprise, urls, toutes_phrases, depuis=None, limites=(), max_passages=30):
+    """`toutes_phrases` : passages (url, texte) déjà dédoublonnés ; les `max_passages`
+    premiers sont imprimés (tous avec None).
+
+    Pour un rapport des seules nouveautés, `depuis` est la date du passage
+    précédent et chaque passage peut porter un statut : (url, texte, statut).
+    `limites` : limites de crawl atteintes (cf. veille.BudgetCrawl).
+    """
+    from veille import safe_pdf_text
+
+    pdf = FPDF()
+    pdf.set_auto_page_break(auto=True, margin=15)
+    pdf.add_page()
+
+    # En-tête
+    pdf.set_font("Arial", "B", 16)
+    titre = "Nouveautés de veille concurrentielle" if depuis else "Rapport de veille concurrentielle"
+    pdf.cell(0, 10, titre, ln=True, align="C")
+    pdf.ln(8)
+
+    pdf.set_font("Arial", "B", 12)
+    pdf.cell(0, 8, f"Entreprise : {entreprise}", ln=True)
+    pdf.cell(0, 8, f"Liens : {', '.join(urls)}", ln=True)
+    pdf.cell(0, 8, f"Date : {datetime.now().strftime('%d/%m/%Y')}", ln=True)
+    if depuis:
+        pdf.cell(0, 8, f"Depuis le : {depuis.strftime('%d/%m/%Y %H:%M')}", ln=True)
+    if limites:
+        pdf.set_font("Arial", "I", 10)
+        pdf.set_text_color(150, 0, 0)
+        pdf.cell(0, 6, "Crawl incomplet, limites atteintes :", ln=True)
+        for limite in limites:
+            pdf.multi_cell(0, 6, f"- {safe_pdf_text(limite)}")
+        pdf.set_text_color(0, 0, 0)
+    pdf.ln(10)
+
+    # Corps du document
+    pdf.set_font("Arial", "", 12)
+    largeur_cell = 180
+    interligne = 7
+
+    for idx, (url_page, passage, *statut) in enumerate(toutes_phrases[:max_passages], 1):
+        pdf.set_fill_color(240, 240, 240)
+        x_start = pdf.get_x()
+        y_start = pdf.get_y()
+
+        texte = safe_pdf_text(passage)
+        libelle = f"Passage {idx} ({statut[0]}):" if statut else f"Passage {idx}:"
+
+        # Vérifier hauteur avant impression (si besoin d’une nouvelle page)
+        temp_pdf = FPDF()
+        temp_pdf.add_page()
+        temp_pdf.set_font("Arial", "", 12)
+        temp_pdf.multi_cell(largeur_cell, interligne, f"{libelle}\n{texte}")
+        hauteur_necessaire = temp_pdf.get_y()
+        hauteur_totale = hauteur_necessaire + 14  # marge + source
+
+        if pdf.get_y() + hauteur_totale > pdf.page_break_trigger:
+            pdf.add_page()
+            x_start = pdf.get_x()
+            y_start = pdf.get_y()
+
+        # Impression du passage
+        pdf.multi_cell(largeur_cell, interligne, f"{libelle}\n{texte}", fill=True)
+        y_end = pdf.get_y()
+
+        # Bordure autour du passage
+        pdf.rect(x_start - 1, y_start - 1, largeur_cell + 2, y_end - y_start + 2)
+
+        # Source du passage
+        pdf.ln(2)
+        pdf.set_text_color(100, 100, 100)
+        pdf.set_font("Arial", "I", 10)
+        url_court = url_page if len(url_page) <= 70 else url_page[:67] + "..."
+        pdf.cell(largeur_cell, 6, f"Source : {url_court}", ln=True)
+
+        # Reset style
+        pdf.set_text_color(0, 0, 0)
+        pdf.set_font("Arial", "", 12)
+        pdf.ln(6)
+
+    return pdf_en_octets(pdf)
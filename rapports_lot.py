@@ -0,0 +1,182 @@
+"""Rapports PDF en lot : un par client, par fournisseur et par région, dans un ZIP.
+
+    python rapports_lot.py fichier_client.xlsx fichiers_clients/ -o rapports.zip
+    python rapports_lot.py fichier_client.xlsx --types clients regions --processus 8
+"""
+import argparse
+import multiprocessing
+import os
+import re
+import sys
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+import pandas as pd
+
+from incremental import AgregatsTransactions
+from rapports import COLONNES_CARTE, INFORMATIONS_CLIENT, normalize_str, rapport_region, rapport_selection
+
+TYPES = ("clients", "fournisseurs", "regions")
+MAX_PROCESSUS = int(os.environ.get("RAPPORTS_PROCESSUS", "0")) or os.cpu_count() or 1
+
+_executeur = None
+_verrou_executeur = threading.Lock()
+
+
+def _executeur_processus():
+    # Même principe que l'ingestion : pool "spawn" réutilisé d'un lot à l'autre
+    global _executeur
+    with _verrou_executeur:
+        if _executeur is None:
+            _executeur = ProcessPoolExecutor(
+                max_workers=MAX_PROCESSUS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _executeur
+
+
+def _nom_fichier(nom):
+    return re.sub(r"[^\w\- ]+", "_", str(nom)).strip() or "sans_nom"
+
+
+# ----------------------- TÂCHES -----------------------
+def _taches_entites(df, agregats, type_rapport):
+    if type_rapport == "clients":
+        colonne, stats, informations = "Nom du client", agregats.clients, INFORMATIONS_CLIENT
+    else:
+        colonne, stats, informations = "Nom du fournisseur", agregats.fournisseurs, []
+    # Lignes de synthese_entites de toutes les entités, tirées des agrégats
+    # partagés : chaque rapport reçoit la sienne, sans rien recalculer
+    synthese = pd.DataFrame({
+        "sum": stats["Montant total"],
+        "count": stats["Transactions"],
+        "mean": (stats["Montant total"] / stats["Transactions"]).where(stats["Transactions"] > 0, 0.0),
+        "derniere_date": stats["Dernière date"],
+        "dernier_montant": stats["Dernier montant"],
+    }).rename_axis(colonne).sort_index()
+    if informations:
+        presentes = [c for c in informations if c in df.columns]
+        # Un seul groupby pour les informations (première valeur renseignée)
+        synthese = synthese.join(df.groupby(colonne)[presentes].first()).reindex(
+            columns=[*synthese.columns, *informations])
+    for nom in synthese.index:
+        yield type_rapport, nom, synthese.loc[[nom]], float(synthese.at[nom, "sum"])
+
+
+def _taches_regions(df):
+    carte = df.rename(columns=COLONNES_CARTE)
+    carte = carte[carte["region"].notna()]
+    regions_brutes = carte["region"].astype(str)
+    carte = carte.assign(region_norm=regions_brutes.map({r: normalize_str(r) for r in regions_brutes.unique()}))
+    carte = carte[carte["region_norm"] != ""]
+    for _, lignes in carte.groupby("region_norm", sort=True):
+        # Nom affiché : l'écriture la plus fréquente, sans espaces parasites
+        nom = lignes["region"].astype(str).str.strip().mode().iat[0]
+        clients = lignes[lignes["nom"].notna()]
+        fournisseurs = lignes[lignes["nom_fournisseur"].notna()]
+        if clients.empty and fournisseurs.empty:
+            continue
+        totaux = (
+            float(clients["montant"].sum()), float(fournisseurs["montant_paye"].sum()),
+            int(clients["nom"].nunique()), int(fournisseurs["nom_fournisseur"].nunique())
+        )
+        yield "regions", nom, clients.drop(columns="region_norm"), totaux
+
+
+def _rendre(tache):
+    type_rapport, nom, donnees, totaux = tache
+    if type_rapport == "clients":
+        pdf = rapport_selection(None, [nom], [], totaux, 0.0, totaux, "", syntheses={"clients": donnees})
+    elif type_rapport == "fournisseurs":
+        pdf = rapport_selection(None, [], [nom], 0.0, totaux, -totaux, "", syntheses={"fournisseurs": donnees})
+    else:
+        recu, paye, nb_clients, nb_fournisseurs = totaux
+        pdf = rapport_region(nom, donnees, recu, paye, recu - paye, nb_clients, nb_fournisseurs, "")
+    return f"{type_rapport}/{_nom_fichier(nom)}.pdf", pdf
+
+
+# ----------------------- LOT -----------------------
+def generer_lot(df, types=TYPES, agregats=None, processus=None, progression=None):
+    """ZIP (bytes) des rapports de `types`, et statistiques du lot.
+
+    Les agrégats par entité (`agregats`, recalculés s'ils ne sont pas
+    fournis) donnent les totaux et les tableaux de chaque rapport ; le rendu des PDF est réparti sur un pool
+    de processus. `progression(fait, total)` est appelé après chaque rapport.
+    """
+    debut = time.perf_counter()
+    agregats = agregats or AgregatsTransactions.depuis(df)
+    taches = []
+    for type_rapport in types:
+        if type_rapport == "regions":
+            taches.extend(_taches_regions(df))
+        else:
+            taches.extend(_taches_entites(df, agregats, type_rapport))
+
+    processus = processus or MAX_PROCESSUS
+    if processus > 1 and len(taches) > 1:
+        # Pool partagé, ou dédié si un nombre de processus différent est demandé
+        executeur = _executeur_processus() if processus == MAX_PROCESSUS else ProcessPoolExecutor(
+            max_workers=processus, mp_context=multiprocessing.get_context("spawn"))
+        # Lots de tâches par aller-retour : moins de sérialisations que de rapports
+        resultats = executeur.map(_rendre, taches, chunksize=max(1, len(taches) // (processus * 4)))
+    else:
+        executeur = None
+        resultats = map(_rendre, taches)
+
+    buffer = BytesIO()
+    noms = set()
+    try:
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+            for i, (nom_fichier, pdf) in enumerate(resultats, 1):
+                # Deux noms qui ne diffèrent que par des caractères remplacés
+                base, n = nom_fichier[:-4], 2
+                while nom_fichier in noms:
+                    nom_fichier, n = f"{base} ({n}).pdf", n + 1
+                noms.add(nom_fichier)
+                archive.writestr(nom_fichier, pdf)
+                if progression is not None:
+                    progression(i, len(taches))
+    finally:
+        if executeur is not None and executeur is not _executeur:
+            executeur.shutdown()
+
+    duree = time.perf_counter() - debut
+    return buffer.getvalue(), {
+        "rapports": len(taches),
+        "secondes": duree,
+        "rapports_par_seconde": len(taches) / duree if duree > 0 else 0.0,
+    }
+
+
+def main(arguments):
+    from ingestion import charger_fichiers, fichiers_du_dossier
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("sources", nargs="+", help="classeurs ou dossiers de classeurs")
+    parser.add_argument("-o", "--sortie", default="rapports.zip")
+    parser.add_argument("--types", nargs="+", choices=TYPES, default=list(TYPES))
+    parser.add_argument("--processus", type=int, default=MAX_PROCESSUS)
+    args = parser.parse_args(arguments)
+
+    fichiers = []
+    for chemin in args.sources:
+        if os.path.isdir(chemin):
+            fichiers.extend(fichiers_du_dossier(chemin))
+        else:
+            with open(chemin, "rb") as f:
+                fichiers.append((os.path.basename(chemin), f.read()))
+    df = charger_fichiers(fichiers)
+
+    contenu, stats = generer_lot(df, args.types, processus=args.processus)
+    with open(args.sortie, "wb") as f:
+        f.write(contenu)
+    print(f"{stats['rapports']} rapports en {stats['secondes']:.1f} s "
+          f"({stats['rapports_par_seconde']:.1f} rapports/s) -> {args.sortie}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,43 @@
+import pytest
+
+from auth import ErreurAuth, ServiceAuth, TableUtilisateursMemoire
+
+
+@pytest.fixture
+def auth():
+    # Coût bcrypt minimal : le test vérifie le parcours, pas la robustesse du hachage
+    return ServiceAuth(TableUtilisateursMemoire(), secret="secret-de-test", cout=4)
+
+
+def test_inscription_puis_connexion(auth):
+    auth.inscrire("alice@example.com", "motdepasse")
+
+    jeton = auth.verifier("alice@example.com", "motdepasse")
+
+    assert jeton is not None
+    assert auth.utilisateur_du_jeton(jeton) == "alice@example.com"
+
+
+def test_mauvais_mot_de_passe_ou_inconnu(auth):
+    auth.inscrire("alice@example.com", "motdepasse")
+
+    assert auth.verifier("alice@example.com", "autre") is None
+    assert auth.verifier("bob@example.com", "motdepasse") is None
+
+
+def test_identifiant_deja_pris(auth):
+    auth.inscrire("alice@example.com", "motdepasse")
+
+    with pytest.raises(ErreurAuth):
+        auth.inscrire("alice@example.com", "autre")
+
+
+def test_jeton_falsifie_expire_ou_autre_secret(auth):
+    jeton = auth.emettre_jeton("alice@example.com")
+    charge, signature = jeton.rsplit(".", 1)
+
+    assert auth.utilisateur_du_jeton(f"{charge}.{signature[::-1]}") is None
+    assert auth.utilisateur_du_jeton(auth.emettre_jeton("alice@example.com", duree=-1)) is None
+    assert ServiceAuth(TableUtilisateursMemoire(), secret="autre").utilisateur_du_jeton(jeton) is None
+    assert auth.utilisateur_du_jeton(None) is None
+    assert auth.utilisateur_du_jeton("pas-un-jeton") is None
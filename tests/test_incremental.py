@@ -0,0 +1,82 @@
+from io import BytesIO
+
+import pandas as pd
+import pytest
+
+from depot import DepotDonnees
+from donnees import FEUILLE
+from incremental import AgregatsTransactions, IngestionIncrementale
+from ingestion import agregats_du_jeu, charger_fichiers, cle_consolidee
+
+
+def transactions(n, debut=0):
+    return pd.DataFrame({
+        "Nom du client": [f"Client {i % 7}" for i in range(debut, debut + n)],
+        "Nom du fournisseur": [f"Fournisseur {i % 5}" for i in range(debut, debut + n)],
+        "Âge": [18 + i % 60 for i in range(debut, debut + n)],
+        "Sexe": "H",
+        "Provenance": [f"Région {i % 3}" for i in range(debut, debut + n)],
+        "Catégorie socio-professionnelle": "Cadre",
+        "Montant reçu": [float(i % 900 + 1) for i in range(debut, debut + n)],
+        "Date 1": pd.date_range("2024-01-01", periods=n, freq="D"),
+        "Montant payé": [float(i % 700 + 1) for i in range(debut, debut + n)],
+        "Date 2": pd.date_range("2024-01-03", periods=n, freq="D"),
+    })
+
+
+@pytest.fixture
+def classeur(tmp_path):
+    chemin = tmp_path / "registre.xlsx"
+
+    def ecrire(df):
+        df.to_excel(chemin, sheet_name=FEUILLE, index=False)
+        return chemin.read_bytes()
+
+    return ecrire
+
+
+def test_ajout_en_bas_complete_les_agregats(classeur):
+    ingestion = IngestionIncrementale()
+    debut = transactions(40)
+    ingestion.rafraichir(BytesIO(classeur(debut)))
+
+    complet = pd.concat([debut, transactions(5, debut=40)], ignore_index=True)
+    assert ingestion.rafraichir(BytesIO(classeur(complet))) == 5
+
+    assert len(ingestion.df) == 45
+    pd.testing.assert_frame_equal(
+        ingestion.agregats.clients.sort_index(),
+        AgregatsTransactions.depuis(ingestion.df).clients.sort_index(),
+        check_dtype=False,
+    )
+
+
+def test_ligne_modifiee_au_milieu_relue(classeur):
+    ingestion = IngestionIncrementale()
+    df = transactions(40)
+    ingestion.rafraichir(BytesIO(classeur(df)))
+
+    df.loc[20, "Montant reçu"] = 999999.0
+    ingestion.rafraichir(BytesIO(classeur(df)))
+
+    assert ingestion.df.loc[20, "Montant reçu"] == 999999.0
+    assert ingestion.agregats.clients["Montant total"].sum() == df["Montant reçu"].sum()
+
+
+def test_ligne_modifiee_au_milieu_et_ajout_charger_fichiers(classeur):
+    depot = DepotDonnees(memoire_max_octets=10**8)
+    df = transactions(40)
+    fichiers = [("registre.xlsx", classeur(df))]
+    cle = cle_consolidee(fichiers)
+    jeu = depot.obtenir(cle, lambda: charger_fichiers(fichiers, depot=depot, proprietaire="alice"))
+    agregats_du_jeu(cle, jeu)
+
+    df.loc[20, "Montant reçu"] = 999999.0
+    df = pd.concat([df, transactions(5, debut=40)], ignore_index=True)
+    fichiers = [("registre.xlsx", classeur(df))]
+    cle = cle_consolidee(fichiers)
+    jeu = depot.obtenir(cle, lambda: charger_fichiers(fichiers, depot=depot, proprietaire="alice"))
+
+    assert len(jeu) == 45
+    assert jeu.loc[20, "Montant reçu"] == 999999.0
+    assert agregats_du_jeu(cle, jeu).clients["Montant total"].sum() == df["Montant reçu"].sum()
@@ -0,0 +1,397 @@
+"""Extraction et dédoublonnage des passages de la veille concurrentielle."""
+import hashlib
+import os
+import re
+import time
+from difflib import SequenceMatcher
+from typing import NamedTuple
+from urllib.parse import urljoin, urlparse
+
+import unidecode
+from bs4 import BeautifulSoup
+from langdetect import detect, LangDetectException
+
+from mesures import etape
+
+MAX_PAGES = 5
+
+STOPWORDS = {
+    "le","la","les","de","des","du","un","une","et","en","à","a","au","aux","pour","par","sur","dans","que","qui","ce","ces","se","ses","est","sont","d'","l'","avec","ou","où","mais","nous","vous","il","elle","ils","elles",
+    "the","and","of","to","in","for","with","on","at","by","is","are","we","you","our","us","be","this","that","it","from","as","an"
+}
+
+
+def nettoyer_html(soup):
+    for tag in soup(["script", "style", "noscript", "header", "footer", "nav", "form", "svg", "img", "meta", "link", "button", "input", "aside"]):
+        tag.decompose()
+    text = soup.get_text(separator=' ')
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text
+
+
+def extraire_phrases(texte):
+    phrases = re.split(r'(?<=[.!?;:])\s+', texte)
+    phrases = [p.strip() for p in phrases if 30 <= len(p.strip()) <= 600]
+    return phrases
+
+
+def est_francais(texte):
+    try:
+        return detect(texte) == 'fr'
+    except LangDetectException:
+        return False
+
+
+def mots_cles_dans_phrase(phrase, mots):
+    phrase_ascii = unidecode.unidecode(phrase.lower())
+    return any(m in phrase_ascii for m in mots)
+
+
+def safe_pdf_text(txt):
+    txt = txt.replace('\n', ' ').replace('\r', '')
+    txt = unidecode.unidecode(txt)
+    txt = re.sub(r'[^\x20-\x7E]+', ' ', txt)
+    txt = re.sub(r'\s+', ' ', txt).strip()
+    return txt
+
+
+def canonicalize_url(u):
+    try:
+        p = urlparse(u)
+        scheme = p.scheme or "http"
+        netloc = p.netloc
+        path = p.path.rstrip('/')
+        query = ('?' + p.query) if p.query else ''
+        return f"{scheme}://{netloc}{path}{query}"
+    except Exception:
+        return u.split('#')[0]
+
+
+def _liens_du_domaine(soup, url_page, domaine):
+    liens = []
+    for link in soup.find_all('a', href=True):
+        href = link['href']
+        href_parsed = urlparse(href)
+        if href_parsed.scheme in ['http', 'https']:
+            lien_complet = href
+        else:
+            lien_complet = urljoin(url_page, href)
+
+        try:
+            domaine_lien = urlparse(lien_complet).hostname or ''
+        except Exception:
+            domaine_lien = ''
+        if domaine_lien == domaine:
+            liens.append(lien_complet)
+    return liens
+
+
+def _entetes_conditionnels(connue):
+    entetes = {}
+    if connue.get("etag"):
+        entetes["If-None-Match"] = connue["etag"]
+    if connue.get("last_modified"):
+        entetes["If-Modified-Since"] = connue["last_modified"]
+    return entetes
+
+
+# ----------------------- POLITIQUE DE CRAWL -----------------------
+class PolitiqueCrawl(NamedTuple):
+    """Limites d'un travail de veille : par site et pour l'ensemble des sites."""
+    secondes_site: float = float(os.environ.get("VEILLE_SECONDES_SITE", "90"))
+    secondes_travail: float = float(os.environ.get("VEILLE_SECONDES_TRAVAIL", "300"))
+    octets_site: int = int(os.environ.get("VEILLE_MO_SITE", "20")) * 1024 * 1024
+    octets_travail: int = int(os.environ.get("VEILLE_MO_TRAVAIL", "60")) * 1024 * 1024
+    # Contexte navigateur recréé après ce nombre de pages (libère sa mémoire)
+    pages_par_contexte: int = int(os.environ.get("VEILLE_PAGES_PAR_CONTEXTE", "3"))
+    # Tas JavaScript max du navigateur (Mo)
+    memoire_js_mo: int = int(os.environ.get("VEILLE_MEMOIRE_JS_MO", "256"))
+    # Types de ressources Playwright jamais chargées, sans effet sur le texte.
+    # "stylesheet" et "other" peuvent s'ajouter (VEILLE_RESSOURCES_BLOQUEES),
+    # au risque de perdre le texte des pages qui l'affichent via CSS ou requêtes annexes.
+    ressources_bloquees: frozenset = frozenset(
+        r.strip() for r in os.environ.get("VEILLE_RESSOURCES_BLOQUEES", "image,media,font,websocket,manifest").split(",")
+        if r.strip()
+    )
+    bloquer_scripts_tiers: bool = True
+
+
+class BudgetCrawl:
+    """Consommation d'un travail de veille (temps, octets), partagée entre ses sites.
+
+    `limites` liste les limites atteintes, pour le rapport.
+    """
+
+    def __init__(self, politique=None):
+        self.politique = politique or PolitiqueCrawl()
+        self.debut = time.monotonic()
+        self.octets = 0
+        self.requetes_bloquees = 0
+        self.limites = []
+
+    def secondes_restantes(self):
+        return self.politique.secondes_travail - (time.monotonic() - self.debut)
+
+    def octets_restants(self):
+        return self.politique.octets_travail - self.octets
+
+    def noter(self, limite):
+        if limite not in self.limites:
+            self.limites.append(limite)
+
+
+def _meme_site(hote, domaine):
+    # www.exemple.fr, exemple.fr et cdn.exemple.fr sont le même site
+    base = domaine.removeprefix("www.")
+    return hote == base or hote.endswith("." + base)
+
+
+def crawler_site_playwright(url, max_pages=MAX_PAGES, etat_pages=None, budget=None):
+    """Textes (url, texte) des pages du domaine de `url`.
+
+    `etat_pages` (url canonique -> {"etag", "last_modified", "empreinte",
+    "liens"}), mis à jour sur place, décrit les pages d'un passage précédent :
+    une page connue avec ETag ou Last-Modified est d'abord demandée sans
+    rendu, avec If-None-Match / If-Modified-Since. Si elle n'a pas changé
+    (304, ou même texte après rendu), elle n'est pas renvoyée mais ses liens
+    restent suivis ; sinon elle est rendue à partir de cette réponse, sans
+    second téléchargement.
+
+    `budget` (BudgetCrawl, partagé entre les sites d'un même travail) borne
+    le temps et les octets du site et du travail ; les ressources lourdes et
+    les scripts tiers ne sont pas chargés.
+    """
+    from playwright.sync_api import sync_playwright, TimeoutError as PlaywrightTimeoutError
+
+    budget = budget or BudgetCrawl()
+    politique = budget.politique
+    pages_visited = set()
+    to_visit = [url]
+    textes = []
+
+    # Nom d'hôte (sans port, en minuscules), comme pour les requêtes filtrées
+    domaine = urlparse(url).hostname or ""
+    debut_site = time.monotonic()
+    octets_site = 0
+
+    def suivre(liens):
+        for lien_complet in liens:
+            canon_link = canonicalize_url(lien_complet)
+            already_in_to_visit = any(canonicalize_url(t) == canon_link for t in to_visit)
+            if canon_link not in pages_visited and not already_in_to_visit:
+                to_visit.append(lien_complet)
+
+    def secondes_restantes():
+        return min(politique.secondes_site - (time.monotonic() - debut_site), budget.secondes_restantes())
+
+    def limite_atteinte():
+        if budget.secondes_restantes() <= 0:
+            return f"budget de temps du travail ({politique.secondes_travail:g} s) atteint"
+        if budget.octets_restants() <= 0:
+            return f"budget du travail ({politique.octets_travail // (1024 * 1024)} Mo) atteint"
+        if secondes_restantes() <= 0:
+            return f"{domaine} : budget de temps du site ({politique.secondes_site:g} s) atteint"
+        if octets_site >= politique.octets_site:
+            return f"{domaine} : budget du site ({politique.octets_site // (1024 * 1024)} Mo) atteint"
+        return None
+
+    def filtrer(route):
+        requete = route.request
+        bloquee = requete.resource_type in politique.ressources_bloquees or (
+            politique.bloquer_scripts_tiers and requete.resource_type == "script"
+            and not _meme_site(urlparse(requete.url).hostname or "", domaine)
+        )
+        # Budget d'octets épuisé : plus aucune requête, la page en cours garde ce qu'elle a
+        if bloquee or limite_atteinte():
+            budget.requetes_bloquees += 1
+            route.abort()
+        else:
+            route.continue_()
+
+    # Documents servis depuis la réponse conditionnelle, déjà comptés
+    requetes_servies = set()
+
+    def compter(requete):
+        nonlocal octets_site
+        if requete in requetes_servies:
+            requetes_servies.discard(requete)
+            return
+        try:
+            tailles = requete.sizes()
+        except Exception:
+            return
+        octets = max(tailles["responseBodySize"], 0) + max(tailles["responseHeadersSize"], 0)
+        octets_site += octets
+        budget.octets += octets
+
+    def nouveau_contexte(navigateur):
+        context = navigateur.new_context(user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115.0 Safari/537.36")
+        context.route("**/*", filtrer)
+        context.on("requestfinished", compter)
+        return context
+
+    with sync_playwright() as p:
+        browser = p.chromium.launch(headless=True, args=[
+            f"--js-flags=--max-old-space-size={politique.memoire_js_mo}", "--disable-dev-shm-usage",
+        ])
+        context = nouveau_contexte(browser)
+        pages_du_contexte = 0
+
+        while to_visit and len(pages_visited) < max_pages:
+            limite = limite_atteinte()
+            if limite:
+                budget.noter(limite)
+                break
+            current_url = to_visit.pop(0)
+            canon_current = canonicalize_url(current_url)
+            if canon_current in pages_visited:
+                continue
+            connue = etat_pages.get(canon_current) if etat_pages is not None else None
+            delai_ms = max(1000, min(15000, secondes_restantes() * 1000))
+            try:
+                document = None
+                entetes = _entetes_conditionnels(connue) if connue else {}
+                if entetes:
+                    with etape("crawl_requete_conditionnelle"):
+                        reponse = context.request.get(current_url, headers=entetes, timeout=delai_ms)
+                    if reponse.status == 304:
+                        pages_visited.add(canon_current)
+                        suivre(connue["liens"])
+                        continue
+                    octets_site += len(reponse.body())
+                    budget.octets += len(reponse.body())
+                    if reponse.ok:
+                        document = reponse
+
+                if pages_du_contexte >= politique.pages_par_contexte:
+                    with etape("crawl_recyclage_contexte"):
+                        context.close()
+                        context = nouveau_contexte(browser)
+                    pages_du_contexte = 0
+                pages_du_contexte += 1
+
+                page = context.new_page()
+                try:
+                    if document is not None:
+                        # Le document modifié vient d'être reçu : le navigateur le rend tel quel
+                        def servir(route, document=document):
+                            requetes_servies.add(route.request)
+                            route.fulfill(response=document)
+                        page.route(lambda u, canon=canon_current: canonicalize_url(u) == canon, servir, times=1)
+                    with etape("crawl_chargement_page"):
+                        reponse = page.goto(current_url, timeout=delai_ms)
+                    with etape("crawl_attente"):
+                        page.wait_for_timeout(max(0, min(7000, secondes_restantes() * 1000)))
+                    content = page.content()
+                finally:
+                    page.close()
+
+                soup = BeautifulSoup(content, "html.parser")
+                texte = nettoyer_html(soup)
+                liens = _liens_du_domaine(soup, current_url, domaine)
+
+                pages_visited.add(canon_current)
+                suivre(liens)
+
+                empreinte = hashlib.sha1(texte.encode("utf-8")).hexdigest()
+                if etat_pages is not None:
+                    entetes_reponse = reponse.headers if reponse is not None else {}
+                    etat_pages[canon_current] = {
+                        "etag": entetes_reponse.get("etag"),
+                        "last_modified": entetes_reponse.get("last-modified"),
+                        "empreinte": empreinte,
+                        "liens": liens,
+                    }
+                if connue and connue.get("empreinte") == empreinte:
+                    continue
+                textes.append((current_url, texte))
+            except PlaywrightTimeoutError:
+                continue
+            except Exception:
+                continue
+
+        browser.close()
+    return textes
+
+
+# ----------------------- DÉDOUBLONNAGE -----------------------
+def normalize_for_dedup(text):
+    s = unidecode.unidecode(text.lower())
+    s = re.sub(r'http\S+', ' ', s)
+    s = re.sub(r'\d+', ' ', s)
+    s = re.sub(r'[^\w\s]', ' ', s)
+    s = re.sub(r'\s+', ' ', s).strip()
+    tokens = [t for t in s.split() if t not in STOPWORDS and len(t) > 2]
+    norm_str = ' '.join(tokens)
+    return tokens, norm_str
+
+
+def is_similar(passage, existing_passages, token_thresh=0.55, seq_thresh=0.78):
+    tokens_a, norm_a = normalize_for_dedup(passage)
+    set_a = set(tokens_a)
+    if not set_a:
+        return False
+
+    for _, existing in existing_passages:
+        tokens_b, norm_b = normalize_for_dedup(existing)
+        set_b = set(tokens_b)
+        if not set_b:
+            continue
+
+        inter = set_a.intersection(set_b)
+        min_len = min(len(set_a), len(set_b))
+        if min_len > 0:
+            overlap_ratio = len(inter) / min_len
+            if overlap_ratio >= token_thresh:
+                return True
+
+        if norm_a and norm_b:
+            seq_ratio = SequenceMatcher(None, norm_a, norm_b).ratio()
+            if seq_ratio >= seq_thresh:
+                return True
+
+        if norm_a and norm_b:
+            if norm_a in norm_b or norm_b in norm_a:
+                if len(norm_a) >= 20 and len(norm_b) >= 20:
+                    return True
+
+    return False
+
+
+def dedoublonner(toutes_phrases, token_thresh=0.55, seq_thresh=0.78):
+    """Passages (url, texte) sans les doublons exacts ni les quasi-doublons."""
+    unique_phrases = []
+    seen_exact = set()
+    for url_page, passage in toutes_phrases:
+        if passage in seen_exact:
+            continue
+        if is_similar(passage, unique_phrases, token_thresh=token_thresh, seq_thresh=seq_thresh):
+            continue
+        seen_exact.add(passage)
+        unique_phrases.append((url_page, passage))
+    return unique_phrases
+
+
+def empreinte_passage(texte):
+    """Empreinte d'un passage, stable aux variations de casse, d'accents, de chiffres et de ponctuation."""
+    _, norm_str = normalize_for_dedup(texte)
+    return hashlib.sha1((norm_str or texte).encode("utf-8")).hexdigest()
+
+
+# ----------------------- SÉLECTION -----------------------
+def passages_pertinents(pages_textes, mots_cles, deja_vus=None):
+    """Passages (url, texte) en français contenant un des `mots_cles`.
+
+    Les passages dont l'empreinte est dans `deja_vus` sont écartés avant la
+    détection de langue, la partie coûteuse.
+    """
+    passages = []
+    for url_page, texte in pages_textes:
+        for p in extraire_phrases(texte):
+            if not mots_cles_dans_phrase(p, mots_cles):
+                continue
+            if deja_vus and empreinte_passage(p) in deja_vus:
+                continue
+            if est_francais(p):
+                passages.append((url_page, p))
+    return passages
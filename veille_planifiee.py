@@ -0,0 +1,332 @@
+"""Veille concurrentielle planifiée : profils enregistrés, passages incrémentaux, rapports des nouveautés.
+
+    python veille_planifiee.py veille.db ajouter acme --entreprise Acme --urls https://acme.fr --mots-cles prix offre
+    python veille_planifiee.py veille.db executer              # profils arrivés à échéance (cron)
+    python veille_planifiee.py veille.db planifier -d rapports_veille/
+
+Chaque passage conserve l'état des pages visitées (ETag, Last-Modified,
+empreinte du texte, liens) et les empreintes des passages déjà rapportés
+(forme normalisée de `normalize_for_dedup`) : le passage suivant ne rend
+que les pages modifiées et ne rapporte que les passages nouveaux ou modifiés.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import NamedTuple
+
+import unidecode
+
+from mesures import etape
+from veille import MAX_PAGES, BudgetCrawl, crawler_site_playwright, dedoublonner, empreinte_passage, is_similar, passages_pertinents
+
+CHEMIN_SUIVI = os.environ.get("VEILLE_DB") or None
+INTERVALLE_HEURES = 24 * 7
+# Attente max (s) entre deux vérifications du planificateur
+ATTENTE_MAX = 15 * 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS profils (
+    nom TEXT PRIMARY KEY,
+    entreprise TEXT NOT NULL,
+    urls TEXT NOT NULL,
+    mots_cles TEXT NOT NULL,
+    intervalle_heures REAL NOT NULL,
+    derniere_execution TEXT
+);
+CREATE TABLE IF NOT EXISTS pages (
+    profil TEXT NOT NULL,
+    url TEXT NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    empreinte TEXT,
+    liens TEXT NOT NULL,
+    PRIMARY KEY (profil, url)
+);
+CREATE TABLE IF NOT EXISTS passages (
+    profil TEXT NOT NULL,
+    empreinte TEXT NOT NULL,
+    url TEXT NOT NULL,
+    texte TEXT NOT NULL,
+    premiere_vue TEXT NOT NULL,
+    PRIMARY KEY (profil, empreinte)
+);
+CREATE TABLE IF NOT EXISTS executions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    profil TEXT NOT NULL,
+    date TEXT NOT NULL,
+    pages_modifiees INTEGER NOT NULL,
+    nouveaux INTEGER NOT NULL,
+    modifies INTEGER NOT NULL,
+    secondes REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_passages_url ON passages (profil, url);
+"""
+
+
+class Profil(NamedTuple):
+    nom: str
+    entreprise: str
+    urls: list
+    mots_cles: list
+    intervalle_heures: float
+    derniere_execution: datetime | None
+
+    def prochaine_execution(self):
+        if self.derniere_execution is None:
+            return datetime.min
+        return self.derniere_execution + timedelta(hours=self.intervalle_heures)
+
+
+class ResultatVeille(NamedTuple):
+    profil: Profil
+    # (url, texte, "nouveau" | "modifié")
+    passages: list
+    pages_modifiees: int
+    secondes: float
+    # (url, message) des sites dont le crawl a échoué
+    erreurs: list
+    # Limites de crawl atteintes (BudgetCrawl.limites)
+    limites: list
+
+
+def normaliser_mots_cles(mots_cles):
+    return [unidecode.unidecode(m.strip().lower()) for m in mots_cles if m.strip()]
+
+
+class SuiviVeille:
+    """Profils de veille et ce que leurs passages précédents ont déjà vu."""
+
+    def __init__(self, chemin):
+        self.chemin = chemin
+        self._local = threading.local()
+        with self._connexion() as cx:
+            cx.executescript(SCHEMA)
+
+    def _connexion(self):
+        cx = getattr(self._local, "cx", None)
+        if cx is None:
+            cx = sqlite3.connect(self.chemin)
+            cx.execute("PRAGMA journal_mode=WAL")
+            self._local.cx = cx
+        return cx
+
+    # ----------------------- PROFILS -----------------------
+    def enregistrer_profil(self, nom, entreprise, urls, mots_cles, intervalle_heures=INTERVALLE_HEURES):
+        """Crée ou modifie un profil ; l'historique des pages et passages est conservé.
+
+        Si les mots-clés changent, l'état des pages est oublié : une page
+        inchangée peut contenir des passages pertinents pour les nouveaux
+        mots-clés, elle est donc rendue de nouveau au prochain passage.
+        """
+        mots_cles = normaliser_mots_cles(mots_cles)
+        with self._connexion() as cx:
+            ancien = cx.execute("SELECT mots_cles FROM profils WHERE nom = ?", (nom,)).fetchone()
+            if ancien is not None and json.loads(ancien[0]) != mots_cles:
+                cx.execute("DELETE FROM pages WHERE profil = ?", (nom,))
+            cx.execute(
+                """INSERT INTO profils (nom, entreprise, urls, mots_cles, intervalle_heures) VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT (nom) DO UPDATE SET entreprise = excluded.entreprise, urls = excluded.urls,
+                   mots_cles = excluded.mots_cles, intervalle_heures = excluded.intervalle_heures""",
+                (nom, entreprise, json.dumps(urls), json.dumps(mots_cles), intervalle_heures)
+            )
+
+    def supprimer_profil(self, nom):
+        with self._connexion() as cx:
+            for table, colonne in (("profils", "nom"), ("pages", "profil"), ("passages", "profil"), ("executions", "profil")):
+                cx.execute(f"DELETE FROM {table} WHERE {colonne} = ?", (nom,))
+
+    def profils(self):
+        lignes = self._connexion().execute(
+            "SELECT nom, entreprise, urls, mots_cles, intervalle_heures, derniere_execution FROM profils ORDER BY nom")
+        return [
+            Profil(nom, entreprise, json.loads(urls), json.loads(mots_cles), intervalle,
+                   datetime.fromisoformat(derniere) if derniere else None)
+            for nom, entreprise, urls, mots_cles, intervalle, derniere in lignes
+        ]
+
+    def profil(self, nom):
+        return next((p for p in self.profils() if p.nom == nom), None)
+
+    def profils_dus(self, maintenant=None):
+        maintenant = maintenant or datetime.now()
+        return [p for p in self.profils() if p.prochaine_execution() <= maintenant]
+
+    # ----------------------- ÉTAT -----------------------
+    def etat_pages(self, nom):
+        """url canonique -> état de la page, au format de `crawler_site_playwright`."""
+        return {
+            url: {"etag": etag, "last_modified": last_modified, "empreinte": empreinte, "liens": json.loads(liens)}
+            for url, etag, last_modified, empreinte, liens in self._connexion().execute(
+                "SELECT url, etag, last_modified, empreinte, liens FROM pages WHERE profil = ?", (nom,))
+        }
+
+    def empreintes(self, nom):
+        return {r[0] for r in self._connexion().execute("SELECT empreinte FROM passages WHERE profil = ?", (nom,))}
+
+    def passages_de_page(self, nom, url):
+        return [(url, r[0]) for r in self._connexion().execute(
+            "SELECT texte FROM passages WHERE profil = ? AND url = ?", (nom, url))]
+
+    def enregistrer_execution(self, nom, date, etat_pages, resultat):
+        with self._connexion() as cx:
+            cx.executemany(
+                "INSERT OR REPLACE INTO pages (profil, url, etag, last_modified, empreinte, liens) VALUES (?, ?, ?, ?, ?, ?)",
+                [(nom, url, e["etag"], e["last_modified"], e["empreinte"], json.dumps(e["liens"]))
+                 for url, e in etat_pages.items()]
+            )
+            cx.executemany(
+                "INSERT OR IGNORE INTO passages (profil, empreinte, url, texte, premiere_vue) VALUES (?, ?, ?, ?, ?)",
+                [(nom, empreinte_passage(texte), url, texte, date.isoformat(timespec="seconds"))
+                 for url, texte, _ in resultat.passages]
+            )
+            nb_modifies = sum(statut == "modifié" for *_, statut in resultat.passages)
+            cx.execute(
+                "INSERT INTO executions (profil, date, pages_modifiees, nouveaux, modifies, secondes) VALUES (?, ?, ?, ?, ?, ?)",
+                (nom, date.isoformat(timespec="seconds"), resultat.pages_modifiees,
+                 len(resultat.passages) - nb_modifies, nb_modifies, resultat.secondes)
+            )
+            cx.execute("UPDATE profils SET derniere_execution = ? WHERE nom = ?", (date.isoformat(timespec="seconds"), nom))
+
+
+_suivis = {}
+_verrou_suivis = threading.Lock()
+
+
+def obtenir_suivi(chemin=None):
+    """Suivi du processus pour `chemin` (par défaut VEILLE_DB), ou None."""
+    chemin = chemin or CHEMIN_SUIVI
+    if not chemin:
+        return None
+    with _verrou_suivis:
+        if chemin not in _suivis:
+            _suivis[chemin] = SuiviVeille(chemin)
+        return _suivis[chemin]
+
+
+# ----------------------- EXÉCUTION -----------------------
+def executer_profil(suivi, profil, max_pages=MAX_PAGES, crawler=crawler_site_playwright, politique=None):
+    """Passe de veille incrémentale : seuls les passages nouveaux ou modifiés sont renvoyés."""
+    debut_execution = datetime.now()
+    debut = time.perf_counter()
+    etat_pages = suivi.etat_pages(profil.nom)
+    deja_vus = suivi.empreintes(profil.nom)
+
+    pages_textes = []
+    erreurs = []
+    budget = BudgetCrawl(politique)
+    for url in profil.urls:
+        try:
+            with etape("crawl_site"):
+                pages_textes.extend(crawler(url, max_pages, etat_pages=etat_pages, budget=budget))
+        except Exception as e:
+            erreurs.append((url, str(e)))
+
+    with etape("selection_passages"):
+        candidats = passages_pertinents(pages_textes, profil.mots_cles, deja_vus=deja_vus)
+    with etape("dedoublonnage"):
+        candidats = dedoublonner(candidats, token_thresh=0.55, seq_thresh=0.78)
+
+    # Nouveau sur la page, mais proche d'un passage déjà rapporté pour elle : modifié
+    passages = []
+    connus_par_page = {}
+    for url_page, texte in candidats:
+        if url_page not in connus_par_page:
+            connus_par_page[url_page] = suivi.passages_de_page(profil.nom, url_page)
+        statut = "modifié" if is_similar(texte, connus_par_page[url_page]) else "nouveau"
+        passages.append((url_page, texte, statut))
+
+    resultat = ResultatVeille(profil, passages, len(pages_textes), time.perf_counter() - debut, erreurs, budget.limites)
+    suivi.enregistrer_execution(profil.nom, debut_execution, etat_pages, resultat)
+    return resultat
+
+
+def ecrire_rapport(resultat, dossier):
+    """Écrit le PDF des nouveautés dans `dossier` ; None s'il n'y en a aucune."""
+    from rapports import rapport_veille
+
+    if not resultat.passages:
+        return None
+    profil = resultat.profil
+    # Tous les passages : chacun est enregistré comme déjà vu
+    pdf = rapport_veille(profil.entreprise, profil.urls, resultat.passages,
+                         depuis=profil.derniere_execution, limites=resultat.limites, max_passages=None)
+    os.makedirs(dossier, exist_ok=True)
+    chemin = os.path.join(dossier, f"veille_{profil.nom}_{datetime.now().strftime('%Y%m%d_%H%M')}.pdf")
+    with open(chemin, "wb") as f:
+        f.write(pdf)
+    return chemin
+
+
+def executer_dus(suivi, dossier, noms=None, forcer=False):
+    profils = suivi.profils() if forcer else suivi.profils_dus()
+    for profil in profils:
+        if noms and profil.nom not in noms:
+            continue
+        try:
+            resultat = executer_profil(suivi, profil)
+        except Exception as e:
+            print(f"{profil.nom} : erreur {e}", flush=True)
+            continue
+        for url, message in resultat.erreurs:
+            print(f"{profil.nom} : erreur lors du crawl de {url} : {message}", flush=True)
+        for limite in resultat.limites:
+            print(f"{profil.nom} : {limite}", flush=True)
+        chemin = ecrire_rapport(resultat, dossier)
+        print(f"{profil.nom} : {resultat.pages_modifiees} page(s) modifiée(s), "
+              f"{len(resultat.passages)} nouveauté(s) en {resultat.secondes:.0f} s"
+              + (f" -> {chemin}" if chemin else ""), flush=True)
+
+
+def planifier(suivi, dossier):
+    """Boucle du planificateur local : exécute chaque profil à son échéance."""
+    while True:
+        executer_dus(suivi, dossier)
+        prochaines = [p.prochaine_execution() for p in suivi.profils()]
+        attente = min([(d - datetime.now()).total_seconds() for d in prochaines] + [ATTENTE_MAX])
+        time.sleep(max(attente, 1))
+
+
+def main(arguments):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("base")
+    commandes = parser.add_subparsers(dest="commande", required=True)
+    ajouter = commandes.add_parser("ajouter", help="créer ou modifier un profil")
+    ajouter.add_argument("nom")
+    ajouter.add_argument("--entreprise", required=True)
+    ajouter.add_argument("--urls", nargs="+", required=True)
+    ajouter.add_argument("--mots-cles", nargs="+", required=True)
+    ajouter.add_argument("--intervalle", type=float, default=INTERVALLE_HEURES, help="heures entre deux passages")
+    supprimer = commandes.add_parser("supprimer")
+    supprimer.add_argument("nom")
+    commandes.add_parser("lister")
+    executer = commandes.add_parser("executer", help="lancer les profils arrivés à échéance")
+    executer.add_argument("noms", nargs="*")
+    executer.add_argument("--forcer", action="store_true", help="ignorer l'échéance")
+    executer.add_argument("-d", "--dossier", default="rapports_veille")
+    planif = commandes.add_parser("planifier", help="tourner en continu")
+    planif.add_argument("-d", "--dossier", default="rapports_veille")
+    args = parser.parse_args(arguments)
+
+    suivi = SuiviVeille(args.base)
+    if args.commande == "ajouter":
+        suivi.enregistrer_profil(args.nom, args.entreprise, args.urls, args.mots_cles, args.intervalle)
+    elif args.commande == "supprimer":
+        suivi.supprimer_profil(args.nom)
+    elif args.commande == "lister":
+        for p in suivi.profils():
+            derniere = p.derniere_execution.strftime("%d/%m/%Y %H:%M") if p.derniere_execution else "jamais"
+            print(f"{p.nom} : {p.entreprise}, {len(p.urls)} URL(s), toutes les {p.intervalle_heures:g} h, dernier passage {derniere}")
+    elif args.commande == "executer":
+        executer_dus(suivi, args.dossier, args.noms, args.forcer)
+    else:
+        planifier(suivi, args.dossier)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))